@@ -1 +1,2 @@
 from catbench.main import benchmark
+from catbench.registry import register_benchmark, available_benchmarks
@@ -1,17 +1,27 @@
 import argparse
+import sys
 
 from catbench.main import benchmark
-from interopt.runner.grpc_runner.server import Server
 
 def main():
-    parser = argparse.ArgumentParser(description="Run a benchmark")
+    if sys.argv[1:2] == ['worker']:
+        from catbench.worker import main as worker_main
+        return worker_main(sys.argv[2:])
+    if sys.argv[1:2] == ['prebuild']:
+        from catbench.prebuild import main as prebuild_main
+        return prebuild_main(sys.argv[2:])
+
+    parser = argparse.ArgumentParser(
+        description="Run a benchmark",
+        epilog="Run 'python -m catbench worker --help' to start simulated hardware workers, "
+               "or 'python -m catbench prebuild --help' to prepare datasets and models.")
     parser.add_argument('--benchmark', type=str,
                         help='Benchmark to use', default="spmm")
     parser.add_argument('--dataset', type=str,
                         help='Dataset to use', default="server")
     parser.add_argument('--servers', type=str, nargs='+',
-                        help='List of servers to use for benchmarking',
-                        default=["localhost"])
+                        help='List of servers to use for benchmarking (default: localhost)',
+                        default=None)
     parser.add_argument('--objectives', type=str, nargs='+',
                         help='List of objectives to use for benchmarking',
                         default=None)
@@ -21,19 +31,116 @@ def main():
                         help='Enable caching of datasets')
     parser.add_argument('--enable_download', type=bool, default=True,
                         help='Enable downloading of datasets')
+    parser.add_argument('--multi_output_model', action='store_true',
+                        help='Serve all objectives from one multi-output surrogate')
+    parser.add_argument('--retrain_model', action='store_true',
+                        help='Retrain surrogate models instead of loading stored ones')
+    parser.add_argument('--server_concurrency', type=int, default=1,
+                        help='Maximum number of queries in flight per server')
+    parser.add_argument('--hedge', action='store_true',
+                        help='Re-issue straggling queries to an idle server')
+    parser.add_argument('--enable_result_store', action=argparse.BooleanOptionalAction, default=True,
+                        help='Reuse stored hardware results instead of re-running them')
+    parser.add_argument('--result_ttl', type=float, default=None,
+                        help='Seconds after which stored hardware results expire')
+    parser.add_argument('--adaptive_repeats', action='store_true',
+                        help='Stop repeating a measurement once its mean is precise enough')
+    parser.add_argument('--repeat_rel_error', type=float, default=0.05,
+                        help='Target relative half-width of the confidence interval '
+                             'with --adaptive_repeats')
+    parser.add_argument('--streaming_rpc', action=argparse.BooleanOptionalAction, default=True,
+                        help='Multiplex evaluations over one streaming call per server')
+    parser.add_argument('--query_log', type=str, default=None,
+                        help='Append every answered query to a memory-mappable log in this directory')
+    parser.add_argument('--multi_tenant', action='store_true',
+                        help='Serve every benchmark and dataset from one port, routing each '
+                             'request to its own study over a shared pool of servers')
+    parser.add_argument('--benchmarks', type=str, nargs='+', default=None,
+                        help='Benchmarks served with --multi_tenant (default: all)')
+    parser.add_argument('--report_interval', type=float, default=60.0,
+                        help='Seconds between throughput reports with --multi_tenant')
+    parser.add_argument('--processes', type=int, default=0,
+                        help='Answer dataset and surrogate queries on this many pre-forked '
+                             'processes, batching concurrent queries (default: in the server '
+                             'process; not used with --multi_tenant)')
+    parser.add_argument('--max_tenants', type=int, default=16,
+                        help='Most studies a --multi_tenant manager creates; requests for '
+                             'further benchmarks and datasets are refused')
+    parser.add_argument('--port', type=int, default=50051,
+                        help='Port of the servers whose address does not include one')
     parser.add_argument('--interopt_port', type=int, default=50050,
                         help='Port to use for the server')
+    parser.add_argument('--metrics_port', type=int, default=None,
+                        help='Serve per-stage latency histograms for Prometheus on this port')
+    parser.add_argument('--trace_file', type=str, default=None,
+                        help='Append a JSONL record of every timed stage to this file')
 
     args = parser.parse_args()
+    pooled = args.processes and not args.multi_tenant
+    if pooled and args.servers:
+        parser.error('--processes only answers from the dataset and surrogate, not with --servers')
+
+    import asyncio
+
+    from catbench import telemetry
+    from catbench.adaptive import AdaptiveRepeats
+    from catbench.server import serve
 
-    study = benchmark(
-        args.benchmark,
+    if args.metrics_port is not None or args.trace_file is not None:
+        telemetry.enable(trace_path=args.trace_file)
+    if args.metrics_port is not None:
+        telemetry.start_http_server(args.metrics_port)
+
+    def adaptive_repeats():
+        return args.adaptive_repeats and AdaptiveRepeats(rel_error=args.repeat_rel_error)
+
+    options = dict(
         enable_tabular=args.enable_tabular, enable_model=args.enable_model,
-        enable_download=args.enable_download, dataset=args.dataset,
-        enabled_objectives=args.objectives,  server_addresses=args.servers)
+        enable_download=args.enable_download,
+        enabled_objectives=args.objectives,  port=args.port,
+        # A pooled server is software-only, which also keeps its surrogate enabled
+        server_addresses=None if pooled else args.servers or ['localhost'],
+        retrain_model=args.retrain_model, multi_output_model=args.multi_output_model,
+        server_concurrency=args.server_concurrency,
+        hedge=args.hedge, enable_result_store=args.enable_result_store,
+        result_ttl=args.result_ttl, streaming_rpc=args.streaming_rpc)
+
+    if args.multi_tenant:
+        import os
+
+        from catbench.client import ConnectionPool, server_url
+        from catbench.scheduler import Scheduler
+        from catbench.server import MultiTenantServicer, serve_multi_tenant
+
+        scheduler = Scheduler([server_url(address, args.port) for address in options['server_addresses']],
+                              max_concurrency=args.server_concurrency, hedge=args.hedge)
+        connections = ConnectionPool()
+
+        def factory(benchmark_name, dataset):
+            query_log = None if args.query_log is None else \
+                os.path.join(args.query_log, f'{benchmark_name}_{dataset}')
+            return benchmark(benchmark_name, dataset=dataset, query_log=query_log,
+                             adaptive_repeats=adaptive_repeats(),
+                             scheduler=scheduler, connections=connections, **options)
+
+        servicer = MultiTenantServicer(factory, (args.benchmark, args.dataset),
+                                       benchmarks=args.benchmarks, scheduler=scheduler,
+                                       max_tenants=args.max_tenants)
+        asyncio.run(serve_multi_tenant(servicer, port=args.interopt_port,
+                                       report_interval=args.report_interval))
+        return
+
+    study = benchmark(args.benchmark, dataset=args.dataset, query_log=args.query_log,
+                      adaptive_repeats=adaptive_repeats(), **options)
+    pool = None
+    if pooled:
+        from catbench.prefork import PreforkPool
+
+        # Started once the study has its dataset cache and stored models, which
+        # the processes load
+        pool = PreforkPool(study, args.processes)
 
-    server = Server(study, port=args.interopt_port)
-    server.start()
+    asyncio.run(serve(study, port=args.interopt_port, pool=pool))
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,119 @@
+"""Adaptive number of repeats for hardware measurements.
+
+Instead of asking a server for all ``repeats`` at once, the measurement is
+issued in chunks of repeats on the same server. After every chunk the
+per-repeat ``compute_times`` give a confidence interval of the mean, and the
+measurement stops as soon as its half-width is within ``rel_error`` of the
+mean, or once the requested number of repeats has been run. A configuration
+whose interval lies entirely above the best mean seen so far (the incumbent)
+at the same fidelities is abandoned early.
+"""
+import math
+import statistics
+from typing import Awaitable, Callable, Optional
+
+REPEATS = 'repeats'
+TIMES = 'compute_times'
+
+
+def t_quantile(confidence: float, dof: int) -> float:
+    """Two-sided Student t quantile, from the Cornish-Fisher expansion of the
+    normal quantile (within 3% of the exact value for ``dof >= 2`` and 1% for
+    ``dof >= 3``)."""
+    z = statistics.NormalDist().inv_cdf(0.5 + confidence / 2)
+    v = dof
+    return (z + (z ** 3 + z) / (4 * v)
+            + (5 * z ** 5 + 16 * z ** 3 + 3 * z) / (96 * v ** 2)
+            + (3 * z ** 7 + 19 * z ** 5 + 17 * z ** 3 - 15 * z) / (384 * v ** 3))
+
+
+def merge_chunks(chunks: list[tuple[int, dict]]) -> dict:
+    """Combine the responses of several chunks into one response: per-repeat
+    ``compute_times`` are concatenated and every other metric is averaged,
+    weighted by the number of repeats in the chunk."""
+    total = sum(repeats for repeats, _ in chunks)
+    merged = {}
+    for name in chunks[0][1]:
+        if name == TIMES:
+            merged[name] = [value for _, result in chunks for value in result.get(name, [])]
+        else:
+            merged[name] = [sum(repeats * result[name][0] for repeats, result in chunks) / total]
+    return merged
+
+
+class AdaptiveRepeats:
+    def __init__(self, rel_error: float = 0.05, confidence: float = 0.95,
+                 min_repeats: int = 3, step: int = 1, short_circuit: bool = True,
+                 margin: float = 0.0):
+        self.rel_error = rel_error
+        self.confidence = confidence
+        self.min_repeats = min_repeats
+        self.step = step
+        self.short_circuit = short_circuit
+        self.margin = margin
+        self.incumbents: dict = {}
+        self.requested_repeats = 0
+        self.measured_repeats = 0
+        self.short_circuited = 0
+
+    def interval(self, times: list[float]) -> Optional[tuple[float, float]]:
+        """Mean and half-width of its confidence interval."""
+        if len(times) < 2:
+            return None
+        mean = statistics.fmean(times)
+        half = t_quantile(self.confidence, len(times) - 1) * statistics.stdev(times) / math.sqrt(len(times))
+        return mean, half
+
+    async def measure(self, run: Callable[[dict], Awaitable[dict]], fidelities: dict):
+        """Measure with ``run(fidelities)`` in chunks of repeats. Returns the
+        merged response and the fidelities it satisfies: the requested ones,
+        unless the configuration was abandoned against the incumbent or a
+        chunk failed, in which case ``repeats`` is the number actually run."""
+        requested = int(fidelities.get(REPEATS, 0))
+        if requested <= self.min_repeats:
+            return await run(fidelities), fidelities
+
+        key = tuple(sorted((name, value) for name, value in fidelities.items() if name != REPEATS))
+        incumbent = self.incumbents.get(key)
+        chunks = []
+        done = 0
+        times = []
+        abandoned = failed = False
+        while done < requested:
+            repeats = min(self.min_repeats if not chunks else self.step, requested - done)
+            result = await run({**fidelities, REPEATS: repeats})
+            if not result:
+                failed = True
+                break
+            chunks.append((repeats, result))
+            done += repeats
+            times.extend(result.get(TIMES, []))
+            interval = self.interval(times)
+            if interval is None:
+                continue
+            mean, half = interval
+            if half <= self.rel_error * abs(mean):
+                break
+            if self.short_circuit and incumbent is not None and mean - half > incumbent * (1 + self.margin):
+                abandoned = True
+                break
+
+        self.requested_repeats += requested
+        self.measured_repeats += done
+        if not chunks:
+            return {}, fidelities
+        if times and not abandoned:
+            mean = statistics.fmean(times)
+            if incumbent is None or mean < incumbent:
+                self.incumbents[key] = mean
+        if abandoned or failed:
+            self.short_circuited += abandoned
+            return merge_chunks(chunks), {**fidelities, REPEATS: done}
+        return merge_chunks(chunks), fidelities
+
+    def stats(self) -> dict:
+        return {
+            'requested_repeats': self.requested_repeats,
+            'measured_repeats': self.measured_repeats,
+            'short_circuited': self.short_circuited,
+        }
@@ -1,13 +1,18 @@
-from .spmm import get_spmm_definition
-from .spmv import get_spmv_definition
-from .sddmm import get_sddmm_definition
-from .mttkrp import get_mttkrp_definition
-from .ttv import get_ttv_definition
-from .asum import get_asum_definition
-from .harris import get_harris_definition
-from .kmeans import get_kmeans_definition
-from .mm import get_mm_definition
-from .scal import get_scal_definition
-from .stencil import get_stencil_definition
-from .carl import get_carl_definition
-from .intersect import get_intersect_definition
\ No newline at end of file
+import importlib
+
+# Benchmark modules are imported on first access so that importing the package
+# does not pull in interopt and its dependencies
+_definitions = {
+    f'get_{name}_definition': name for name in [
+        'spmm', 'spmv', 'sddmm', 'mttkrp', 'ttv', 'asum', 'harris', 'kmeans', 'mm',
+        'scal', 'stencil', 'carl', 'intersect']
+}
+
+__all__ = list(_definitions)
+
+
+def __getattr__(name):
+    if name in _definitions:
+        module = importlib.import_module(f'.{_definitions[name]}', __name__)
+        return getattr(module, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,33 @@
+"""Location and helpers for catbench's on-disk caches."""
+import hashlib
+import os
+
+import numpy as np
+
+CACHE_DIR_ENV = 'CATBENCH_CACHE_DIR'
+
+
+def cache_dir(*parts) -> str:
+    path = os.path.join(os.environ.get(CACHE_DIR_ENV, 'cache'), *parts)
+    os.makedirs(path, exist_ok=True)
+    return path
+
+
+def fingerprint(*items) -> str:
+    digest = hashlib.sha256()
+    for item in items:
+        digest.update(repr(item).encode('utf-8'))
+        digest.update(b'\0')
+    return digest.hexdigest()[:16]
+
+
+def save_array(path: str, array: np.ndarray):
+    # Write to a temporary file first so concurrent readers never see a partial array
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.save(f, array)
+    os.replace(tmp_path, path)
+
+
+def load_array(path: str) -> np.ndarray:
+    return np.load(path, mmap_mode='r')
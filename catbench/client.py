@@ -0,0 +1,252 @@
+"""Concurrent gRPC client for hardware evaluations.
+
+Keeps one channel per server for the lifetime of the event loop and hands
+evaluations to a :class:`~catbench.scheduler.Scheduler`, which runs up to
+``max_concurrency`` of them on each server at the same time. Results are
+looked up in and saved to an optional :class:`~catbench.results.ResultStore`,
+and repeats can be issued adaptively with
+:class:`~catbench.adaptive.AdaptiveRepeats`. Evaluations are multiplexed over
+one streaming call per server (see :mod:`catbench.streaming`), or sent as
+unary calls to servers that do not support it. Every call carries the
+benchmark and dataset it is for as gRPC metadata, which a multi-tenant
+manager routes on; the connections can be shared by the clients of several
+benchmarks through one :class:`ConnectionPool`.
+"""
+import asyncio
+import logging
+from typing import Optional
+
+import grpc.aio
+import pandas as pd
+
+import interopt.runner.grpc_runner.config_service_pb2 as cs
+import interopt.runner.grpc_runner.config_service_pb2_grpc as cs_grpc
+from interopt.parameter import ParamType
+from interopt.runner.grpc_runner.main import value_to_param
+
+from catbench.adaptive import AdaptiveRepeats
+from catbench.permutations import get_codec
+from catbench.results import ResultStore
+from catbench.scheduler import Scheduler
+from catbench.streaming import EvaluationError, StreamingCall
+from catbench import telemetry
+
+
+# gRPC metadata naming the benchmark and dataset of a request
+BENCHMARK_METADATA = 'catbench-benchmark'
+DATASET_METADATA = 'catbench-dataset'
+
+
+def route_metadata(benchmark_name: str, dataset) -> tuple:
+    return (BENCHMARK_METADATA, benchmark_name), (DATASET_METADATA, str(dataset))
+
+
+def request_route(context) -> tuple:
+    """The benchmark and dataset named by the metadata of a call, or None."""
+    if context is None:
+        return None, None
+    metadata = dict(context.invocation_metadata() or ())
+    return metadata.get(BENCHMARK_METADATA), metadata.get(DATASET_METADATA)
+
+
+def server_url(address: str, port: int) -> str:
+    """``address:port``, unless ``address`` already names a port."""
+    host, _, address_port = address.rpartition(':')
+    if host and address_port.isdigit() and (host.startswith('[') or ':' not in host):
+        return address
+    return f"{address}:{port}"
+
+
+def build_request(query: dict, parameters: list, fidelities: dict,
+                  fidelity_params: list) -> cs.ConfigurationRequest:
+    def encode(values: dict, params: list) -> dict:
+        params = {param.name: param for param in params}
+        encoded = {}
+        for name, value in values.items():
+            if name not in params:
+                raise ValueError(f"Unknown parameter: {name}")
+            param_type = params[name].param_type_enum
+            if param_type == ParamType.PERMUTATION:
+                # The servers parse the string form; catbench also takes tuples and ranks
+                value = get_codec(params[name].length).canonical(value)
+            encoded[name] = value_to_param(value, param_type)
+        return encoded
+
+    return cs.ConfigurationRequest(
+        configurations=cs.Configuration(parameters=encode(query, parameters)),
+        output_data_file="test",
+        fidelities=cs.Fidelities(parameters=encode(fidelities, fidelity_params or [])))
+
+
+def params_to_dict(parameters) -> dict:
+    values = {}
+    for name, param in parameters.items():
+        if param.HasField('permutation_param'):
+            values[name] = str(tuple(param.permutation_param.values))
+        elif param.HasField('integer_param'):
+            values[name] = param.integer_param.value
+        elif param.HasField('real_param'):
+            values[name] = param.real_param.value
+        elif param.HasField('categorical_param'):
+            values[name] = param.categorical_param.value
+        elif param.HasField('ordinal_param'):
+            values[name] = param.ordinal_param.value
+        elif param.HasField('string_param'):
+            values[name] = param.string_param.value
+    return values
+
+
+def response_to_dict(response) -> dict:
+    return {metric.name: list(metric.values) for metric in response.metrics}
+
+
+class ConnectionPool:
+    """One channel per server, and the streaming calls open on them. A
+    stream carries the metadata it was opened with, so there is one per
+    server and metadata."""
+
+    def __init__(self):
+        self.unary_urls = set()
+        self._stubs = {}
+        self._streams = {}
+        self._channels = {}
+        self._loop = None
+
+    def bind_loop(self):
+        # grpc.aio channels belong to the event loop that created them
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            if self._loop is not None and not self._loop.is_closed() and self._channels:
+                # Channels are closed on their own loop, while it is still open
+                asyncio.run_coroutine_threadsafe(
+                    self._close(self._streams, self._channels), self._loop)
+            self._loop = loop
+            self._stubs = {}
+            self._streams = {}
+            self._channels = {}
+
+    def channel(self, url: str) -> grpc.aio.Channel:
+        if url not in self._channels:
+            self._channels[url] = grpc.aio.insecure_channel(url)
+        return self._channels[url]
+
+    def stub(self, url: str) -> cs_grpc.ConfigurationServiceStub:
+        if url not in self._stubs:
+            self._stubs[url] = cs_grpc.ConfigurationServiceStub(self.channel(url))
+        return self._stubs[url]
+
+    async def call(self, url: str, request: cs.ConfigurationRequest, metadata: tuple = (),
+                   streaming: bool = True) -> cs.ConfigurationResponse:
+        if streaming and url not in self.unary_urls:
+            stream = self._streams.get((url, metadata))
+            if stream is None or stream.closed:
+                stream = self._streams[(url, metadata)] = StreamingCall(self.channel(url), metadata)
+            try:
+                return await stream.evaluate(request)
+            except grpc.aio.AioRpcError as e:
+                if e.code() != grpc.StatusCode.UNIMPLEMENTED:
+                    raise
+                logging.info(f"{url} does not support streaming, using unary calls")
+                self.unary_urls.add(url)
+        return await self.stub(url).RunConfigurationsClientServer(request, metadata=metadata or None)
+
+    async def close(self):
+        """Close the streams and channels; they are opened again on the next call."""
+        streams, channels = self._streams, self._channels
+        self._stubs = {}
+        self._streams = {}
+        self._channels = {}
+        await self._close(streams, channels)
+
+    @staticmethod
+    async def _close(streams: dict, channels: dict):
+        for stream in streams.values():
+            stream.close()
+        for channel in channels.values():
+            await channel.close()
+
+
+class HardwareQuery:
+    def __init__(self, grpc_urls: list[str], enabled_objectives: list[str], definition,
+                 max_concurrency: int = 1, scheduler: Optional[Scheduler] = None,
+                 result_store: Optional[ResultStore] = None,
+                 adaptive: Optional[AdaptiveRepeats] = None, streaming: bool = True,
+                 connections: Optional[ConnectionPool] = None, metadata: tuple = ()):
+        self.grpc_urls = grpc_urls
+        self.enabled_objectives = enabled_objectives
+        self.definition = definition
+        self.parameters = definition.search_space.params
+        self.fidelity_params = definition.search_space.fidelity_params or []
+        self.scheduler = scheduler or Scheduler(grpc_urls, max_concurrency=max_concurrency)
+        self.result_store = result_store
+        self.adaptive = adaptive
+        self.streaming = streaming
+        self.connections = connections or ConnectionPool()
+        self.metadata = tuple(metadata)
+
+    async def call(self, url: str, request: cs.ConfigurationRequest) -> cs.ConfigurationResponse:
+        return await self.connections.call(url, request, self.metadata, self.streaming)
+
+    async def run_request(self, request: cs.ConfigurationRequest, url: str) -> dict:
+        logging.info(f"Sending request to {url}: {request}")
+        with telemetry.span('grpc'):
+            response = await self.call(url, request)
+        logging.info(f"Received response from {url}: {response}")
+        return response_to_dict(response)
+
+    async def send_query(self, query: dict, fidelities: dict) -> dict:
+        self.connections.bind_loop()
+        if self.result_store is not None:
+            # Any server's result will do, as they all measure the study's hardware
+            result = self.result_store.get(query, fidelities)
+            if result is not None:
+                return result
+
+        servers = []
+
+        async def dispatch(chunk_fidelities: dict) -> dict:
+            # Built before dispatch, so that a malformed query fails here and not on a worker
+            request = build_request(query, self.parameters, chunk_fidelities, self.fidelity_params)
+
+            # Chunks of an adaptive measurement stay on the server of the first one
+            async def run(url):
+                return url, await self.run_request(request, url)
+
+            # Latencies are compared per benchmark and fidelity settings
+            url, result = await self.scheduler.submit(
+                run, (self.metadata, tuple(sorted(chunk_fidelities.items()))),
+                prefer=servers[0] if servers else None)
+            servers.append(url)
+            return result
+
+        try:
+            if self.adaptive is not None:
+                result, measured_fidelities = await self.adaptive.measure(dispatch, fidelities)
+            else:
+                result, measured_fidelities = await dispatch(fidelities), fidelities
+        except grpc.aio.AioRpcError as e:
+            logging.warning(f"Query failed: {e.code()} {e.details()}")
+            return {}
+        except EvaluationError as e:
+            logging.warning(f"Query failed: {e.code} {e.details}")
+            return {}
+        if self.result_store is not None and result:
+            self.result_store.put(query, measured_fidelities, result, server=servers[0])
+        return result
+
+    async def query_hardware(self, query: dict, fidelities: dict) -> pd.DataFrame:
+        result = await self.send_query(query, fidelities)
+        return self.process_grpc_results(result, query, fidelities)
+
+    def process_grpc_results(self, result: dict, query: dict, fidelities: dict) -> pd.DataFrame:
+        d = query.copy()
+        d.update(fidelities)
+        if len(result) == 0:
+            multi_index = pd.MultiIndex.from_tuples([], names=list(d.keys()))
+            return pd.DataFrame(columns=self.enabled_objectives, index=multi_index)
+        values = [result[e][0] for e in self.enabled_objectives]
+        multi_index = pd.MultiIndex.from_tuples([tuple(d.values())], names=list(d.keys()))
+        return pd.DataFrame([values], columns=self.enabled_objectives, index=multi_index)
+
+    async def close(self):
+        await self.connections.close()
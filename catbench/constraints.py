@@ -0,0 +1,212 @@
+"""Vectorized evaluation of search space constraints.
+
+Constraint strings from the benchmark definitions are parsed once and
+rewritten into NumPy expressions that operate on a column-oriented batch of
+configurations: a dict mapping each parameter name to a 1-D array of length N.
+Permutation parameters are stored as their lexicographic ranks (see
+:mod:`catbench.permutations`) and ``permutation[i]`` looks the element up in
+the table of all permutations. A constraint that only depends on one
+permutation parameter is evaluated once for every rank into a feasibility
+bitmap, which is then indexed by the ranks of a batch.
+"""
+import ast
+import weakref
+
+import numpy as np
+
+from interopt.parameter import ParamType
+
+from catbench.permutations import get_codec
+
+
+class _Vectorize(ast.NodeTransformer):
+    def __init__(self, names, permutations):
+        self.names = names
+        self.permutations = permutations
+        self.used = set()
+
+    @staticmethod
+    def _np_call(func, *args):
+        return ast.Call(
+            func=ast.Attribute(value=ast.Name(id='np', ctx=ast.Load()), attr=func, ctx=ast.Load()),
+            args=list(args), keywords=[])
+
+    def _column(self, name):
+        self.used.add(name)
+        return ast.Subscript(value=ast.Name(id='x', ctx=ast.Load()),
+                             slice=ast.Constant(value=name), ctx=ast.Load())
+
+    def visit_Name(self, node):
+        if node.id not in self.names:
+            raise ValueError(f"Unknown name in constraint: {node.id}")
+        return self._column(node.id)
+
+    def visit_Subscript(self, node):
+        # permutation[i] -> tables['permutation'][x['permutation'], i]
+        if not isinstance(node.value, ast.Name) or node.value.id not in self.permutations:
+            raise ValueError("Only permutation indexing is supported in constraints")
+        index = self.visit(node.slice)
+        table = ast.Subscript(value=ast.Name(id='tables', ctx=ast.Load()),
+                              slice=ast.Constant(value=node.value.id), ctx=ast.Load())
+        return ast.Subscript(
+            value=table,
+            slice=ast.Tuple(elts=[self._column(node.value.id), index], ctx=ast.Load()),
+            ctx=ast.Load())
+
+    def visit_BoolOp(self, node):
+        func = 'logical_and' if isinstance(node.op, ast.And) else 'logical_or'
+        values = [self.visit(value) for value in node.values]
+        result = values[0]
+        for value in values[1:]:
+            result = self._np_call(func, result, value)
+        return result
+
+    def visit_UnaryOp(self, node):
+        operand = self.visit(node.operand)
+        if isinstance(node.op, ast.Not):
+            return self._np_call('logical_not', operand)
+        return ast.UnaryOp(op=node.op, operand=operand)
+
+    def visit_Compare(self, node):
+        # a < b < c -> (a < b) & (b < c)
+        operands = [self.visit(node.left)] + [self.visit(c) for c in node.comparators]
+        result = None
+        for op, left, right in zip(node.ops, operands, operands[1:]):
+            pair = ast.Compare(left=left, ops=[op], comparators=[right])
+            result = pair if result is None else self._np_call('logical_and', result, pair)
+        return result
+
+    def visit_IfExp(self, node):
+        return self._np_call('where', self.visit(node.test),
+                             self.visit(node.body), self.visit(node.orelse))
+
+    def generic_visit(self, node):
+        if isinstance(node, (ast.Call, ast.Attribute, ast.Lambda, ast.NamedExpr)):
+            raise ValueError(f"Unsupported expression in constraint: {ast.dump(node)}")
+        return super().generic_visit(node)
+
+
+class CompiledConstraint:
+    def __init__(self, constraint: str, params):
+        self.constraint = constraint
+        lengths = {param.name: param.length for param in params
+                   if param.param_type_enum == ParamType.PERMUTATION}
+        # Constraint strings use backslash continuations inside the literal
+        tree = ast.parse(' '.join(constraint.split()), mode='eval')
+        transformer = _Vectorize({param.name for param in params}, lengths)
+        body = transformer.visit(tree.body)
+        self.dependent_params = sorted(transformer.used)
+        expression = ast.fix_missing_locations(ast.Expression(body=body))
+        self.source = ast.unparse(expression)
+        tables = {name: get_codec(length).table for name, length in lengths.items()}
+        self._func = eval(f"lambda x: {self.source}", {'np': np, 'tables': tables})
+        # Feasibility of every rank of the only (permutation) parameter
+        self.bitmap = None
+        if len(self.dependent_params) == 1 and self.dependent_params[0] in lengths:
+            name = self.dependent_params[0]
+            self.bitmap = self._evaluate({name: np.arange(get_codec(lengths[name]).size)})
+
+    def _evaluate(self, columns: dict) -> np.ndarray:
+        n = batch_size(columns)
+        with np.errstate(all='ignore'):
+            result = self._func(columns)
+        return np.broadcast_to(np.asarray(result, dtype=bool), (n,))
+
+    def __call__(self, columns: dict) -> np.ndarray:
+        if self.bitmap is not None:
+            return self.bitmap[columns[self.dependent_params[0]]]
+        return self._evaluate(columns)
+
+
+class CompiledConstraints:
+    def __init__(self, search_space):
+        self.params = search_space.params
+        self.constraints = [
+            CompiledConstraint(c.constraint, self.params) for c in search_space.constraints
+            if isinstance(c.constraint, str)]
+        self.callables = [c for c in search_space.constraints
+                          if not isinstance(c.constraint, str)]
+        # The bitmaps of the constraints on each permutation parameter, combined
+        self.bitmaps = {}
+        for constraint in self.constraints:
+            if constraint.bitmap is not None:
+                name = constraint.dependent_params[0]
+                self.bitmaps[name] = self.bitmaps.get(name, True) & constraint.bitmap
+        self._remaining = [c for c in self.constraints if c.bitmap is None]
+
+    def mask(self, columns: dict) -> np.ndarray:
+        mask = np.ones(batch_size(columns), dtype=bool)
+        for name, bitmap in self.bitmaps.items():
+            mask &= bitmap[columns[name]]
+        for constraint in self._remaining:
+            mask &= constraint(columns)
+        if self.callables:
+            configs = from_columns(columns, self.params)
+            for constraint in self.callables:
+                mask &= np.fromiter((bool(constraint.constraint(c)) for c in configs),
+                                    dtype=bool, count=len(configs))
+        return mask
+
+    def __call__(self, configs) -> np.ndarray:
+        if not isinstance(configs, dict):
+            configs = to_columns(configs, self.params)
+        return self.mask(configs)
+
+    def is_feasible(self, config: dict) -> bool:
+        return bool(self.mask(to_columns([config], self.params))[0])
+
+
+def batch_size(columns: dict) -> int:
+    for value in columns.values():
+        return len(value)
+    return 0
+
+
+def to_columns(configs, params) -> dict:
+    """Convert a list of configuration dicts, or a dict of per-parameter
+    sequences, into the column-oriented batch format. Permutations may be
+    given as strings, tuples, ranks or an ``(N, length)`` array."""
+    if isinstance(configs, dict):
+        columns = configs
+    else:
+        columns = {param.name: [config[param.name] for config in configs] for param in params}
+    result = {}
+    for param in params:
+        if param.name not in columns:
+            continue
+        values = columns[param.name]
+        if param.param_type_enum == ParamType.PERMUTATION:
+            values = get_codec(param.length).rank(values)
+            if np.any(values < 0):
+                raise ValueError(f"Invalid permutation for {param.name}")
+        else:
+            values = np.asarray(values)
+        result[param.name] = values
+    return result
+
+
+def from_columns(columns: dict, params) -> list[dict]:
+    """Inverse of :func:`to_columns`; permutations are rendered as the
+    ``'(0, 1, 2, 3, 4)'`` strings used by the query interface."""
+    names = [param.name for param in params if param.name in columns]
+    values = []
+    for param in params:
+        if param.name not in columns:
+            continue
+        column = columns[param.name]
+        if param.param_type_enum == ParamType.PERMUTATION:
+            values.append(get_codec(param.length).render(column))
+        else:
+            values.append(np.asarray(column).tolist())
+    return [dict(zip(names, row)) for row in zip(*values)]
+
+
+_compiled = weakref.WeakKeyDictionary()
+
+
+def compile_constraints(definition) -> CompiledConstraints:
+    """Return the vectorized constraints of a ProblemDefinition, compiling
+    them on first use."""
+    if definition not in _compiled:
+        _compiled[definition] = CompiledConstraints(definition.search_space)
+    return _compiled[definition]
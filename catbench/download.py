@@ -0,0 +1,163 @@
+"""Streaming, resumable file downloads.
+
+A file is streamed to ``<path>.part`` in chunks while its SHA-256 is computed,
+and only renamed to ``path`` once it is complete and matches the expected
+checksum. A transfer that breaks off is resumed with an HTTP range request,
+by the next retry or by the next process that fetches the same file, as long
+as the server's ETag or Last-Modified date shows the file is unchanged. Each
+chunk can also be passed to a consumer as it arrives, so a file can be parsed
+while it downloads. :func:`file_lock` lets processes on a host agree on which
+of them fetches a file.
+"""
+import contextlib
+import hashlib
+import http.client
+import os
+import time
+import urllib.error
+import urllib.request
+from typing import Callable, Optional
+
+try:
+    import fcntl
+except ImportError:  # no cross-process locking on Windows
+    fcntl = None
+
+CHUNK_SIZE = 1 << 20
+
+
+class ChecksumError(ValueError):
+    pass
+
+
+@contextlib.contextmanager
+def file_lock(path: str):
+    """Hold an exclusive lock on ``path`` (created if missing) for the
+    duration of the block; other processes block until it is released."""
+    with open(path, 'ab') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _validator(headers) -> Optional[str]:
+    # A range request can be made conditional on a strong ETag or the modification date
+    etag = headers.get('ETag')
+    if etag and not etag.startswith('W/'):
+        return etag
+    return headers.get('Last-Modified')
+
+
+def _remove(*paths: str):
+    for path in paths:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(path)
+
+
+def fetch(url: str, path: str, sha256: Optional[str] = None,
+          consumer: Optional[Callable[[bytes], None]] = None, retries: int = 3,
+          timeout: float = 10.0, chunk_size: int = CHUNK_SIZE) -> str:
+    """Download ``url`` to ``path`` and return the SHA-256 of its content.
+
+    Bytes already in ``<path>.part`` are kept and the rest is requested with a
+    range request, made conditional (``If-Range``) on the ETag or
+    Last-Modified date the part was downloaded with; a file that changed since
+    is downloaded again from the start, and a part without such a validator
+    is discarded. ``consumer`` receives the whole content in order, starting
+    with what was already on disk. Connection errors are retried ``retries``
+    times; HTTP errors and a checksum mismatch raise, as does a transfer that
+    cannot be resumed after ``consumer`` received part of it.
+    """
+    part = f'{path}.part'
+    validator_path = f'{part}.validator'
+    validator = None
+    if os.path.exists(part) and os.path.exists(validator_path):
+        with open(validator_path, encoding='utf-8') as f:
+            validator = f.read().strip() or None
+    if validator is None:
+        _remove(part, validator_path)
+    offset = os.path.getsize(part) if validator is not None else 0
+    digest = hashlib.sha256()
+    # Bytes of the part file passed to the digest and the consumer so far
+    passed = 0
+
+    def catch_up():
+        nonlocal passed
+        if passed < offset:
+            with open(part, 'rb') as f:
+                f.seek(passed)
+                while data := f.read(chunk_size):
+                    digest.update(data)
+                    if consumer is not None:
+                        consumer(data)
+            passed = offset
+
+    for attempt in range(retries + 1):
+        # Without a validator a part cannot be resumed, and the file is requested again
+        headers = {'Range': f'bytes={offset}-', 'If-Range': validator} \
+            if offset and validator is not None else {}
+        request = urllib.request.Request(url, headers=headers)
+        try:
+            with urllib.request.urlopen(request, timeout=timeout) as response:
+                current = _validator(response.headers)
+                skip = 0
+                if offset and response.status != 206:
+                    if current is not None and current == validator:
+                        # The same file from a server without range support
+                        skip = offset
+                    elif passed and consumer is not None:
+                        _remove(part, validator_path)
+                        raise ChecksumError(f"Cannot resume {url}: it changed during the download "
+                                            "or has no ETag or Last-Modified date")
+                    else:
+                        # The file changed since the part was written
+                        digest, offset, passed = hashlib.sha256(), 0, 0
+                        _remove(part)
+                if not offset:
+                    validator = current
+                    if validator is None:
+                        _remove(validator_path)
+                    else:
+                        with open(validator_path, 'w', encoding='utf-8') as f:
+                            f.write(validator)
+                catch_up()
+                length = response.headers.get('Content-Length')
+                total = int(length) + offset - skip if length is not None else None
+                with open(part, 'ab') as f:
+                    while data := response.read(chunk_size):
+                        if skip:
+                            skipped = min(skip, len(data))
+                            data, skip = data[skipped:], skip - skipped
+                            if not data:
+                                continue
+                        f.write(data)
+                        digest.update(data)
+                        if consumer is not None:
+                            consumer(data)
+                        offset += len(data)
+                        passed = offset
+            if total is not None and offset < total:
+                raise http.client.IncompleteRead(b'', total - offset)
+            break
+        except urllib.error.HTTPError as e:
+            # 416: the part file already holds the whole content
+            if e.code != 416 or not offset:
+                raise
+            break
+        except (urllib.error.URLError, http.client.HTTPException, ConnectionError, TimeoutError):
+            if attempt == retries:
+                raise
+            time.sleep(0.5 * 2 ** attempt)
+
+    catch_up()
+    hexdigest = digest.hexdigest()
+    if sha256 is not None and hexdigest != sha256.lower():
+        _remove(part, validator_path)
+        raise ChecksumError(f"Checksum mismatch for {url}: expected {sha256}, got {hexdigest}")
+    os.replace(part, path)
+    _remove(validator_path)
+    return hexdigest
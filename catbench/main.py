@@ -1,36 +1,26 @@
-from .benchmarks import *
+from catbench.registry import get_benchmark
 
-from interopt import Study
 
-# Similarly define SpMV, SDDMM, MTTKRP, and TTV classes
 def benchmark(benchmark_name, enable_tabular=True, enable_model=True,
               dataset=None, enabled_objectives=None, enable_download=True,
-              port=50051, server_addresses=None):
-    definitions = {
-        'spmm': get_spmm_definition(),
-        'spmv': get_spmv_definition(),
-        'sddmm': get_sddmm_definition(),
-        'mttkrp': get_mttkrp_definition(),
-        'ttv': get_ttv_definition(),
-        'asum': get_asum_definition(),
-        'harris': get_harris_definition(),
-        'kmeans': get_kmeans_definition(),
-        'mm': get_mm_definition(),
-        'scal': get_scal_definition(),
-        'stencil': get_stencil_definition(),
-    }
-    taco_tasks = ['spmm', 'spmv', 'sddmm', 'ttv', 'mttkrp']
-    rise_tasks = ['asum', 'harris', 'kmeans', 'mm', 'scal', 'stencil']
-    benchmark_name = benchmark_name.lower()
+              port=50051, server_addresses=None, retrain_model=False,
+              multi_output_model=False,
+              server_concurrency=1, hedge=False,
+              enable_result_store=None, result_ttl=None, adaptive_repeats=False,
+              streaming_rpc=True, track_pareto=None, query_log=None, scheduler=None,
+              connections=None):
+    # Imported here so that `import catbench` stays free of interopt/pandas/catboost
+    from catbench.study import Study
 
-    if benchmark_name not in definitions:
-        raise ValueError("Unknown benchmark name")
+    benchmark_name = benchmark_name.lower()
+    entry = get_benchmark(benchmark_name)
 
     if enabled_objectives is None:
-        if benchmark_name in taco_tasks:
-            enabled_objectives = ['compute_time']
-        elif benchmark_name in rise_tasks:
-            enabled_objectives = ['compute_time', 'energy']
+        enabled_objectives = entry.get_default_objectives()
+
+    # Only studies measured on the given servers store their hardware results
+    if enable_result_store is None:
+        enable_result_store = server_addresses is not None
 
     # If server_addresses is None, then run the benchmark locally
     if server_addresses is None:
@@ -40,13 +30,16 @@ def benchmark(benchmark_name, enable_tabular=True, enable_model=True,
         enable_model = False
 
     if dataset is None:
-        if benchmark_name in taco_tasks:
-            dataset = '2630'
-        elif benchmark_name in rise_tasks:
-            dataset = 'rtxtitan'
+        dataset = entry.default_dataset
 
-    return Study(benchmark_name=benchmark_name, definition=definitions[benchmark_name],
+    return Study(benchmark_name=benchmark_name, definition=entry.definition,
                  enable_tabular=enable_tabular, enable_model=enable_model,
                  dataset=dataset, enable_download=enable_download,
                  enabled_objectives=enabled_objectives, port=port,
-                 server_addresses=server_addresses)
+                 server_addresses=server_addresses, retrain_model=retrain_model,
+                 multi_output_model=multi_output_model,
+                 server_concurrency=server_concurrency, hedge=hedge,
+                 enable_result_store=enable_result_store, result_ttl=result_ttl,
+                 adaptive_repeats=adaptive_repeats, streaming_rpc=streaming_rpc,
+                 track_pareto=track_pareto, query_log=query_log,
+                 scheduler=scheduler, connections=connections)
@@ -0,0 +1,184 @@
+"""Persistent store of trained surrogate models.
+
+Models are saved under ``cache/models/`` with a key built from the benchmark,
+the content hash of the dataset they were trained on, the objective, the
+feature list and the versions of the libraries involved, so any change to
+these retrains instead of loading a stale model. The store is bounded in size
+and evicts the least recently used models first.
+
+With ``multi_output=True`` the objectives share one CatBoost model trained
+with the ``MultiRMSE`` loss, so a batch is encoded and predicted once for all
+of them.
+"""
+import ast
+import os
+from importlib import metadata
+from typing import Callable, Optional
+
+from catbench.cache import cache_dir, fingerprint
+from catbench.shared import shared_cache
+
+MAX_STORE_BYTES = int(os.environ.get('CATBENCH_MODEL_STORE_BYTES', 2 * 1024 ** 3))
+
+
+def library_versions() -> tuple:
+    versions = []
+    for package in ('catboost', 'scikit-learn', 'interopt'):
+        try:
+            versions.append((package, metadata.version(package)))
+        except metadata.PackageNotFoundError:
+            versions.append((package, None))
+    return tuple(versions)
+
+
+class MultiOutputModel:
+    """A model predicting several objectives, one output column each."""
+
+    def __init__(self, model, objectives: list[str]):
+        self.model = model
+        self.objectives = list(objectives)
+
+    @property
+    def feature_names_(self) -> list[str]:
+        return self.model.feature_names_
+
+    def predict(self, frame):
+        return self.model.predict(frame).reshape(len(frame), len(self.objectives))
+
+
+def train_model(tab, objectives: list[str], in_features: list[str], thread_count: int = -1):
+    """Train a surrogate as ``interopt.runner.model.train_model`` does: log
+    targets, permutations split into one feature per position, an 80/20
+    split to report the fit. Several ``objectives`` give one ``MultiRMSE``
+    model. ``thread_count`` is passed on to CatBoost (-1 uses every core)."""
+    import tempfile
+
+    import numpy as np
+    from catboost import CatBoostRegressor
+    from sklearn.metrics import r2_score
+    from sklearn.model_selection import train_test_split
+
+    from catbench.permutations import get_codec
+    from catbench.surrogate import PERMUTATION_FEATURE
+
+    tab = tab.reset_index()
+    features = [name for name in in_features if name != 'permutation']
+    if 'permutation' in in_features:
+        permutations = tab['permutation'].tolist()
+        first = permutations[0]
+        length = len(ast.literal_eval(first) if isinstance(first, str) else first)
+        codec = get_codec(length)
+        table = codec.unrank(codec.rank(permutations))
+        for i in range(length):
+            tab[f'{PERMUTATION_FEATURE}{i}'] = table[:, i]
+        features += [f'{PERMUTATION_FEATURE}{i}' for i in range(length)]
+
+    X = tab[features]
+    y = np.log(tab[objectives[0]] if len(objectives) == 1 else tab[objectives])
+    X_train, X_test, y_train, y_test = train_test_split(X, y, test_size=0.2, random_state=42)
+    loss_function = 'RMSE' if len(objectives) == 1 else 'MultiRMSE'
+    with tempfile.TemporaryDirectory() as tmpdirname:
+        model = CatBoostRegressor(loss_function=loss_function, silent=True, train_dir=tmpdirname,
+                                  thread_count=thread_count)
+        model.fit(X_train, y_train)
+    y_pred = model.predict(X_test).reshape(len(X_test), len(objectives))
+    y_test = np.asarray(y_test).reshape(len(X_test), len(objectives))
+    for i, objective in enumerate(objectives):
+        print(f"R-squared for {objective}: {r2_score(y_test[:, i], y_pred[:, i])}")
+    return model
+
+
+class ModelStore:
+    def __init__(self, root: Optional[str] = None, max_bytes: int = MAX_STORE_BYTES):
+        self.root = root or cache_dir('models')
+        os.makedirs(self.root, exist_ok=True)
+        self.max_bytes = max_bytes
+
+    def key(self, benchmark_name: str, dataset_hash: str, objectives, features: list[str]) -> str:
+        digest = fingerprint(benchmark_name, dataset_hash, objectives, features, library_versions())
+        objectives = objectives if isinstance(objectives, str) else '+'.join(objectives)
+        return f'{benchmark_name}_{objectives}_{digest}'
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.root, f'{key}.cbm')
+
+    def load(self, key: str):
+        from catboost import CatBoostRegressor
+
+        path = self.path(key)
+        if not os.path.exists(path):
+            return None
+        model = CatBoostRegressor()
+        model.load_model(path)
+        # Loading counts as a use for the eviction order
+        os.utime(path)
+        return model
+
+    def save(self, key: str, model):
+        path = self.path(key)
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        model.save_model(tmp_path)
+        os.replace(tmp_path, path)
+        self.evict(keep=path)
+
+    def evict(self, keep: Optional[str] = None):
+        entries = []
+        for name in os.listdir(self.root):
+            if not name.endswith('.cbm'):
+                continue
+            path = os.path.join(self.root, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+
+def load_models(training_data: Callable, benchmark_name: str, dataset_hash: str,
+                objectives: list[str], features: list[str], retrain: bool = False,
+                store: Optional[ModelStore] = None, multi_output: bool = False,
+                thread_count: int = -1, owner: Optional[object] = None) -> dict:
+    """Load one surrogate per objective from the store, training and storing
+    the missing ones. ``training_data`` is only called when a model has to be
+    trained, and returns the dataset as a DataFrame indexed by ``features``.
+    With ``multi_output``, every objective maps to the same
+    :class:`MultiOutputModel`. With ``owner``, the models come from the
+    process-wide :mod:`catbench.shared` cache and are held until ``owner`` is
+    garbage collected."""
+    store = store or ModelStore()
+    groups = [objectives] if multi_output and len(objectives) > 1 else [[o] for o in objectives]
+    models = {}
+    for group in groups:
+        key = store.key(benchmark_name, dataset_hash, group[0] if len(group) == 1 else group, features)
+
+        def load(group=group, key=key):
+            model = None if retrain else store.load(key)
+            if model is None:
+                print(f"Training model for {'+'.join(group)}")
+                model = train_model(training_data(), group, features, thread_count)
+                store.save(key, model)
+            if len(group) > 1:
+                model = MultiOutputModel(model, group)
+            return model
+
+        if owner is None:
+            model = load()
+        else:
+            path = store.path(key)
+            model = shared_cache().acquire(
+                ('model', key), load, owner=owner, reload=retrain,
+                sizeof=lambda model, path=path: os.path.getsize(path) if os.path.exists(path) else 0)
+        for objective in group:
+            models[objective] = model
+    return models
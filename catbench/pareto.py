@@ -0,0 +1,187 @@
+"""Pareto archive of evaluated configurations and front quality indicators.
+
+All objectives are minimized. :class:`ParetoArchive` keeps the non-dominated
+objective vectors seen so far together with the configuration each came from;
+a single insertion is one vectorized dominance check against the current
+front, and a batch is reduced to its own front before it is merged. The
+hypervolume and inverted generational distance (IGD) of a front are computed
+on demand with NumPy.
+"""
+from typing import Callable, Optional, Sequence, Union
+
+import numpy as np
+
+CHUNK_SIZE = 256
+# Comparisons per block of the front filter
+BLOCK_ELEMENTS = 1 << 20
+
+
+def non_dominated(points: np.ndarray) -> np.ndarray:
+    """Mask of the rows of ``points`` (N, k) that no other row dominates.
+    Of several equal rows only the first is kept."""
+    points = np.asarray(points, dtype=np.float64)
+    n, k = points.shape
+    mask = np.zeros(n, dtype=bool)
+    if n == 0:
+        return mask
+    if k == 1:
+        mask[np.argmin(points[:, 0])] = True
+        return mask
+    if k == 2:
+        # A row can only be dominated by rows that come before it in lexicographic order
+        order = np.lexsort(points.T[::-1])
+        ordered = points[order]
+        best = np.minimum.accumulate(ordered[:, 1])
+        mask[order] = ordered[:, 1] < np.concatenate([[np.inf], best[:-1]])
+        return mask
+    # Ordered by the sum of the objectives, ties broken lexicographically, a row
+    # can only be dominated by earlier rows, and good rows come first
+    order = np.lexsort(np.vstack([points.T[::-1], points.sum(axis=1)]))
+    ordered = points[order]
+    front = np.empty((0, k))
+    kept = []
+    start = 0
+    while start < n:
+        # Large blocks while the front is small, so the Python loop stays short
+        size = int(np.clip(BLOCK_ELEMENTS // max(len(front), 1), CHUNK_SIZE, 16 * CHUNK_SIZE))
+        rows = order[start:start + size]
+        block = ordered[start:start + size]
+        start += size
+        if len(front):
+            survivors = ~_weakly_dominated(front, block).any(axis=1)
+            rows, block = rows[survivors], block[survivors]
+        # Rows weakly dominated by an earlier survivor of the block; a row
+        # dominated by one the front removed is dominated by the front too
+        survivors = ~np.tril(_weakly_dominated(block, block), -1).any(axis=1)
+        front = np.concatenate([front, block[survivors]])
+        kept.append(rows[survivors])
+    mask[np.concatenate(kept)] = True
+    return mask
+
+
+def _weakly_dominated(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """``(len(b), len(a))`` matrix of whether row j of ``a`` is at most row i
+    of ``b`` in every objective."""
+    result = a[None, :, 0] <= b[:, None, 0]
+    for j in range(1, a.shape[1]):
+        result &= a[None, :, j] <= b[:, None, j]
+    return result
+
+
+def hypervolume(points: np.ndarray, reference: Sequence[float]) -> float:
+    """Volume of the objective space dominated by ``points`` and bounded by
+    ``reference``; points that do not improve on the reference in every
+    objective add nothing."""
+    points = np.asarray(points, dtype=np.float64)
+    reference = np.asarray(reference, dtype=np.float64)
+    points = points[np.all(points < reference, axis=1)]
+    if len(points) == 0:
+        return 0.0
+    return _hypervolume(points[non_dominated(points)], reference)
+
+
+def _hypervolume(points: np.ndarray, reference: np.ndarray) -> float:
+    k = points.shape[1]
+    if k == 1:
+        return float(reference[0] - points[:, 0].min())
+    if k == 2:
+        # Sorted by the first objective, the front descends in the second
+        points = points[np.argsort(points[:, 0])]
+        widths = np.diff(np.append(points[:, 0], reference[0]))
+        return float(np.sum(widths * (reference[1] - points[:, 1])))
+    # Slice along the last objective; each slab is the front of the points below it
+    points = points[np.argsort(points[:, -1])]
+    bounds = np.append(points[1:, -1], reference[-1])
+    volume = 0.0
+    for i in range(len(points)):
+        depth = bounds[i] - points[i, -1]
+        if depth > 0:
+            below = points[:i + 1, :-1]
+            volume += depth * _hypervolume(below[non_dominated(below)], reference[:-1])
+    return volume
+
+
+def igd(points: np.ndarray, reference_front: np.ndarray) -> float:
+    """Mean distance from each point of ``reference_front`` to its nearest
+    point in ``points``."""
+    points = np.asarray(points, dtype=np.float64)
+    reference_front = np.asarray(reference_front, dtype=np.float64)
+    if len(points) == 0:
+        return float('inf')
+    distances = []
+    for start in range(0, len(reference_front), CHUNK_SIZE):
+        chunk = reference_front[start:start + CHUNK_SIZE]
+        squared = ((chunk[:, None, :] - points[None, :, :]) ** 2).sum(axis=2)
+        distances.append(np.sqrt(squared.min(axis=1)))
+    return float(np.concatenate(distances).mean())
+
+
+class ParetoArchive:
+    def __init__(self, objectives: list[str]):
+        self.objectives = list(objectives)
+        self.points = np.empty((0, len(self.objectives)))
+        self.configs: list = []
+        self.evaluated = 0
+
+    def __len__(self) -> int:
+        return len(self.points)
+
+    def dominates(self, point: Sequence[float]) -> bool:
+        """Whether the archive weakly dominates ``point``."""
+        point = np.asarray(point, dtype=np.float64)
+        return bool(np.any(np.all(self.points <= point, axis=1)))
+
+    def add(self, point: Union[dict, Sequence[float]], config=None) -> bool:
+        """Insert one evaluation; returns whether it joined the front."""
+        if isinstance(point, dict):
+            point = [point.get(objective, np.nan) for objective in self.objectives]
+        point = np.asarray(point, dtype=np.float64)
+        self.evaluated += 1
+        if np.isnan(point).any() or self.dominates(point):
+            return False
+        keep = ~np.all(point <= self.points, axis=1)
+        self.points = np.concatenate([self.points[keep], point[None, :]])
+        self.configs = [c for c, k in zip(self.configs, keep) if k] + [config]
+        return True
+
+    def add_batch(self, points: np.ndarray,
+                  configs: Optional[Union[Sequence, Callable[[np.ndarray], list]]] = None) -> int:
+        """Insert many evaluations at once; ``configs`` is a sequence with one
+        entry per row or a function returning the entries of the given rows,
+        so only those that join the front are built. Returns how many rows
+        joined the front."""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, len(self.objectives))
+        self.evaluated += len(points)
+        rows = np.flatnonzero(~np.isnan(points).any(axis=1))
+        rows = rows[non_dominated(points[rows])]
+        if len(rows) == 0:
+            return 0
+        # Existing members come first, so they win ties against new rows
+        candidates = np.concatenate([self.points, points[rows]])
+        mask = non_dominated(candidates)
+        old, new = mask[:len(self.points)], rows[mask[len(self.points):]]
+        if configs is None:
+            new_configs = [None] * len(new)
+        elif callable(configs):
+            new_configs = list(configs(new))
+        else:
+            new_configs = [configs[row] for row in new]
+        self.points = np.concatenate([self.points[old], points[new]])
+        self.configs = [c for c, k in zip(self.configs, old) if k] + new_configs
+        return len(new)
+
+    def front(self) -> list[dict]:
+        """The members of the front, each as its configuration merged with
+        its objective values, sorted by the first objective."""
+        order = np.argsort(self.points[:, 0], kind='stable') if len(self) else []
+        return [{**(self.configs[i] or {}),
+                 **{objective: float(value) for objective, value in zip(self.objectives, self.points[i])}}
+                for i in order]
+
+    def hypervolume(self, reference: Union[dict, Sequence[float]]) -> float:
+        if isinstance(reference, dict):
+            reference = [reference[objective] for objective in self.objectives]
+        return hypervolume(self.points, reference)
+
+    def igd(self, reference_front: np.ndarray) -> float:
+        return igd(self.points, reference_front)
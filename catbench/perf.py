@@ -0,0 +1,284 @@
+"""Benchmarks of catbench's own overheads.
+
+    python -m catbench.perf import      # cold import time of the package
+    python -m catbench.perf queries     # query throughput per benchmark and mode
+    python -m catbench.perf queries --output run.json --baseline baseline.json
+
+Every query benchmark runs in a fresh interpreter, so cold start and peak RSS
+are those of a single study. Hardware mode runs against a stand-in gRPC worker
+started in the same process. With ``--baseline``, metrics that got worse by
+more than ``--tolerance`` are reported and the exit status is 1.
+"""
+import argparse
+import json
+import platform
+import statistics
+import subprocess
+import sys
+import time
+from typing import Optional
+
+HEAVY_MODULES = ['interopt', 'pandas', 'numpy', 'catboost', 'grpc', 'sklearn']
+
+MODES = ['tabular', 'surrogate', 'hardware']
+
+# 1 where lower is better, -1 where higher is better
+METRICS = {
+    'median_s': 1,
+    'cold_start_s': 1,
+    'time_to_first_query_s': 1,
+    'p50_ms': 1,
+    'p99_ms': 1,
+    'qps': -1,
+    'batch_qps': -1,
+    'peak_rss_mb': 1,
+}
+
+
+def measure_import(statement: str = 'import catbench', repeats: int = 10) -> dict:
+    """Time ``statement`` in fresh interpreters and report which heavy
+    dependencies it pulled in."""
+    code = ("import sys, time\n"
+            "start = time.perf_counter()\n"
+            f"{statement}\n"
+            "print(time.perf_counter() - start)\n"
+            f"print(','.join(m for m in {HEAVY_MODULES!r} if m in sys.modules))\n")
+    times, modules = [], ''
+    for _ in range(repeats):
+        output = subprocess.run([sys.executable, '-c', code], check=True,
+                                capture_output=True, text=True).stdout.splitlines()
+        times.append(float(output[0]))
+        modules = output[1] if len(output) > 1 else ''
+    return {
+        'name': statement,
+        'statement': statement,
+        'median_s': statistics.median(times),
+        'min_s': min(times),
+        'heavy_modules': [m for m in modules.split(',') if m],
+    }
+
+
+def measure_command(args: list[str], repeats: int = 5) -> dict:
+    """Wall-clock time of running a command in a new process."""
+    times = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        subprocess.run(args, check=True, capture_output=True)
+        times.append(time.perf_counter() - start)
+    command = ' '.join(args[1:])
+    return {'name': command, 'command': command, 'median_s': statistics.median(times),
+            'min_s': min(times)}
+
+
+def import_benchmark(repeats: int) -> list[dict]:
+    return [
+        measure_import('import catbench', repeats),
+        measure_import("import catbench; catbench.registry.get_definition('spmm')", repeats),
+        measure_command([sys.executable, '-m', 'catbench', '--help'], repeats),
+    ]
+
+
+def _start_stand_in(definition, port: int):
+    """Run a stand-in worker on its own event loop in a daemon thread."""
+    import asyncio
+    import threading
+
+    from catbench.worker import StandInServicer, metric_names, start_worker
+
+    loop = asyncio.new_event_loop()
+    started = threading.Event()
+    servers = []
+
+    def run():
+        asyncio.set_event_loop(loop)
+        # Keep a reference: the server shuts down when it is garbage collected
+        servers.append(loop.run_until_complete(
+            start_worker(StandInServicer(metric_names(definition)), port)))
+        started.set()
+        loop.run_forever()
+
+    threading.Thread(target=run, daemon=True).start()
+    started.wait()
+    return servers[0]
+
+
+def _queries(study, mode: str, n: int, seed: int) -> tuple[list[dict], list[dict]]:
+    import numpy as np
+
+    if mode != 'tabular':
+        return study.sample(n, rng=seed), [{} for _ in range(n)]
+    # Tabular queries are drawn from the dataset so that they hit
+    table = study.software_query.tabular_dataset.table
+    if table is None:
+        raise FileNotFoundError(study.software_query.tabular_dataset.tab_path)
+    frame = table.to_frame()
+    rows = np.random.default_rng(seed).integers(0, len(frame), n)
+    sample = frame.iloc[rows]
+    configs = sample[[param.name for param in study.parameters]].to_dict('records')
+    fidelities = sample[[param.name for param in study.fidelity_params]].to_dict('records')
+    return configs, fidelities
+
+
+def run_case(benchmark_name: str, mode: str, n: int, dataset: Optional[str],
+             enable_download: bool, port: int, seed: int, process_start: float) -> dict:
+    """Measure one benchmark in one mode; meant to run in a fresh interpreter."""
+    import resource
+
+    import numpy as np
+
+    import catbench
+
+    options = {
+        'tabular': dict(enable_tabular=True, enable_model=False),
+        'surrogate': dict(enable_tabular=False, enable_model=True),
+        'hardware': dict(enable_tabular=False, enable_model=False, server_addresses=['localhost'],
+                         port=port, enable_result_store=False),
+    }[mode]
+    if mode == 'hardware':
+        _start_stand_in(catbench.registry.get_definition(benchmark_name), port)
+
+    start = time.perf_counter()
+    study = catbench.benchmark(benchmark_name, dataset=dataset, enable_download=enable_download,
+                               **options)
+    cold_start = time.perf_counter() - start
+    configs, fidelities = _queries(study, mode, n, seed)
+
+    latencies = []
+    for config, fidelity in zip(configs, fidelities):
+        start = time.perf_counter()
+        study.query(config, fidelity)
+        latencies.append(time.perf_counter() - start)
+        if len(latencies) == 1:
+            first_query = time.perf_counter() - process_start
+
+    start = time.perf_counter()
+    study.query_batch(configs, fidelities)
+    batch_time = time.perf_counter() - start
+
+    latencies = np.asarray(latencies[1:] or latencies)
+    return {
+        'name': f'{benchmark_name}/{mode}',
+        'benchmark': benchmark_name,
+        'mode': mode,
+        'queries': n,
+        'cold_start_s': cold_start,
+        'time_to_first_query_s': first_query,
+        'p50_ms': float(np.percentile(latencies, 50) * 1e3),
+        'p99_ms': float(np.percentile(latencies, 99) * 1e3),
+        'qps': float(len(latencies) / latencies.sum()),
+        'batch_qps': n / batch_time,
+        # ru_maxrss is in KiB on Linux
+        'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def query_benchmark(benchmarks: list[str], modes: list[str], n: int, dataset: Optional[str],
+                    enable_download: bool, port: int, seed: int) -> list[dict]:
+    results = []
+    for benchmark_name in benchmarks:
+        for mode in modes:
+            code = ("import time; process_start = time.perf_counter()\n"
+                    "import json\n"
+                    "from catbench.perf import run_case\n"
+                    f"print(json.dumps(run_case({benchmark_name!r}, {mode!r}, {n}, {dataset!r}, "
+                    f"{enable_download!r}, {port}, {seed}, process_start)))\n")
+            process = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True)
+            name = f'{benchmark_name}/{mode}'
+            if process.returncode != 0:
+                error = process.stderr.strip().splitlines()[-1] if process.stderr.strip() else ''
+                results.append({'name': name, 'benchmark': benchmark_name, 'mode': mode,
+                                'error': error})
+            else:
+                results.append(json.loads(process.stdout.strip().splitlines()[-1]))
+            print(f"{name}: {results[-1].get('error') or 'done'}", file=sys.stderr)
+    return results
+
+
+def environment() -> dict:
+    from importlib import metadata
+
+    versions = {}
+    for package in ('catbench', 'interopt', 'numpy', 'pandas', 'catboost', 'grpcio'):
+        try:
+            versions[package] = metadata.version(package)
+        except metadata.PackageNotFoundError:
+            versions[package] = None
+    return {'python': platform.python_version(), 'platform': platform.platform(),
+            'versions': versions}
+
+
+def compare(results: list[dict], baseline: list[dict], tolerance: float) -> list[dict]:
+    """Metrics that are worse than in ``baseline`` by more than ``tolerance``
+    (a fraction of the baseline value)."""
+    baseline = {result['name']: result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline.get(result['name'])
+        if previous is None:
+            continue
+        for metric, direction in METRICS.items():
+            if metric not in result or not previous.get(metric):
+                continue
+            change = (result[metric] - previous[metric]) / previous[metric]
+            if change * direction > tolerance:
+                regressions.append({'name': result['name'], 'metric': metric,
+                                    'baseline': previous[metric], 'value': result[metric],
+                                    'change': change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark catbench's own overheads")
+    parser.add_argument('--output', type=str, default=None,
+                        help='Write the results to this JSON file instead of stdout')
+    parser.add_argument('--baseline', type=str, default=None,
+                        help='JSON file of a previous run to compare against')
+    parser.add_argument('--tolerance', type=float, default=0.1,
+                        help='Relative change of a metric that counts as a regression')
+    subparsers = parser.add_subparsers(dest='suite', required=True)
+    import_parser = subparsers.add_parser('import', help='Cold import time')
+    import_parser.add_argument('--repeats', type=int, default=10)
+    query_parser = subparsers.add_parser('queries', help='Query throughput, latency and memory')
+    query_parser.add_argument('--benchmarks', type=str, nargs='+', default=None,
+                              help='Benchmarks to run (default: all registered)')
+    query_parser.add_argument('--modes', type=str, nargs='+', default=MODES, choices=MODES)
+    query_parser.add_argument('--queries', type=int, default=200,
+                              help='Number of queries per benchmark and mode')
+    query_parser.add_argument('--dataset', type=str, default=None,
+                              help='Dataset to use instead of each benchmark\'s default')
+    query_parser.add_argument('--no_download', action='store_true',
+                              help='Do not download missing datasets')
+    query_parser.add_argument('--port', type=int, default=50099,
+                              help='Port of the stand-in worker for hardware mode')
+    query_parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    if args.suite == 'import':
+        results = import_benchmark(args.repeats)
+    else:
+        from catbench.registry import available_benchmarks
+
+        results = query_benchmark(args.benchmarks or available_benchmarks(), args.modes,
+                                  args.queries, args.dataset, not args.no_download,
+                                  args.port, args.seed)
+
+    report = {'suite': args.suite, 'environment': environment(), 'results': results}
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            report['regressions'] = compare(results, json.load(f)['results'], args.tolerance)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+
+    for regression in report.get('regressions', []):
+        print(f"Regression in {regression['name']} {regression['metric']}: "
+              f"{regression['baseline']:.4g} -> {regression['value']:.4g} "
+              f"({regression['change']:+.0%})", file=sys.stderr)
+    if report.get('regressions'):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
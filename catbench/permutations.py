@@ -0,0 +1,100 @@
+"""Rank encoding of permutation parameters.
+
+Inside catbench a permutation value is its lexicographic rank, in the order of
+``itertools.permutations(range(length))``: ``(0, 1, 2, 3, 4)`` is 0 and
+``(4, 3, 2, 1, 0)`` is 119. The ``'(0, 1, 2, 3, 4)'`` strings of the query
+interface are translated with a dictionary lookup, tuples and ``(N, length)``
+arrays with a lookup table, and ranks are turned back into tuples or strings
+by indexing precomputed tables.
+"""
+import ast
+import functools
+import itertools
+import math
+
+import numpy as np
+
+# Largest length whose length**length lookup table is built
+MAX_TABLE_LENGTH = 6
+
+
+class PermutationCodec:
+    def __init__(self, length: int):
+        self.length = length
+        self.size = math.factorial(length)
+        permutations = list(itertools.permutations(range(length)))
+        # rank -> permutation, and rank -> string of the query interface
+        self.table = np.asarray(permutations, dtype=np.int64).reshape(self.size, length)
+        self.strings = np.asarray([str(p) for p in permutations], dtype=object)
+        self._ranks = {}
+        for rank, permutation in enumerate(permutations):
+            self._ranks[permutation] = rank
+            self._ranks[str(permutation)] = rank
+        self._weights = length ** np.arange(length - 1, -1, -1, dtype=np.int64)
+        self._lookup = None
+        if length <= MAX_TABLE_LENGTH:
+            self._lookup = np.full(length ** length, -1, dtype=np.int64)
+            self._lookup[self.table @ self._weights] = np.arange(self.size)
+
+    def rank_array(self, permutations: np.ndarray) -> np.ndarray:
+        """Ranks of the rows of an ``(N, length)`` array; -1 for rows that are
+        not permutations of ``range(length)``."""
+        permutations = np.asarray(permutations, dtype=np.int64).reshape(-1, self.length)
+        in_range = np.all((permutations >= 0) & (permutations < self.length), axis=1)
+        if self._lookup is not None:
+            ranks = self._lookup[np.where(in_range, permutations @ self._weights, 0)]
+            return np.where(in_range, ranks, -1)
+        # Lehmer code
+        valid = in_range & np.all(np.sort(permutations, axis=1) == np.arange(self.length), axis=1)
+        ranks = np.zeros(len(permutations), dtype=np.int64)
+        for i in range(self.length - 1):
+            smaller = (permutations[:, i + 1:] < permutations[:, i:i + 1]).sum(axis=1)
+            ranks += smaller * math.factorial(self.length - 1 - i)
+        return np.where(valid, ranks, -1)
+
+    def _rank_value(self, value) -> int:
+        if isinstance(value, (list, np.ndarray)):
+            value = tuple(value)
+        rank = self._ranks.get(value)
+        if rank is not None:
+            return rank
+        if isinstance(value, str):
+            try:
+                value = ast.literal_eval(value)
+            except (ValueError, SyntaxError):
+                return -1
+        try:
+            return self._ranks.get(tuple(int(v) for v in value), -1)
+        except (TypeError, ValueError):
+            return -1
+
+    def rank(self, values) -> np.ndarray:
+        """Ranks of a sequence of permutations given as strings, tuples or
+        ranks, or of an ``(N, length)`` array; -1 for invalid values."""
+        if isinstance(values, np.ndarray) and values.dtype.kind in 'iu':
+            if values.ndim == 2:
+                return self.rank_array(values)
+            values = values.astype(np.int64)
+            return np.where((values >= 0) & (values < self.size), values, -1)
+        return np.fromiter((value if isinstance(value, (int, np.integer)) and 0 <= value < self.size
+                            else self._rank_value(value) for value in values),
+                           dtype=np.int64, count=len(values))
+
+    def unrank(self, ranks) -> np.ndarray:
+        return self.table[ranks]
+
+    def render(self, ranks) -> list[str]:
+        return self.strings[np.asarray(ranks, dtype=np.int64)].tolist()
+
+    def canonical(self, value) -> str:
+        """The string of the query interface for a permutation given as a
+        string, tuple, list, array or rank."""
+        rank = int(self.rank([value])[0])
+        if rank < 0:
+            raise ValueError(f"Not a permutation of length {self.length}: {value!r}")
+        return self.strings[rank]
+
+
+@functools.lru_cache(maxsize=None)
+def get_codec(length: int) -> PermutationCodec:
+    return PermutationCodec(length)
@@ -0,0 +1,147 @@
+"""Prepare datasets and surrogate models ahead of a tuning campaign.
+
+    python -m catbench prebuild                          # every benchmark, default datasets
+    python -m catbench prebuild --benchmarks spmm mm --jobs 8
+
+Each benchmark's dataset is downloaded and converted to the columnar cache
+first, then one surrogate per objective is loaded or trained, all on a pool
+of worker processes. Every training run gets ``cores / jobs`` CatBoost
+threads so the pool does not oversubscribe the machine. The artifacts are
+left in the caches that ``catbench.benchmark()`` reads, so studies created
+afterwards start without training.
+"""
+import argparse
+import concurrent.futures
+import os
+import sys
+import time
+from typing import Optional
+
+
+def prepare_dataset(benchmark_name: str, dataset: str, enable_download: bool) -> dict:
+    """Download the dataset and build its columnar cache."""
+    from catbench.registry import get_definition
+    from catbench.tabular import TabularDataset
+
+    start = time.perf_counter()
+    definition = get_definition(benchmark_name)
+    search_space = definition.search_space
+    tabular = TabularDataset(benchmark_name, dataset,
+                             search_space.params + (search_space.fidelity_params or []),
+                             [], enable_download)
+    if tabular.table is None:
+        raise FileNotFoundError(tabular.tab_path)
+    return {'rows': tabular.table.rows, 'seconds': time.perf_counter() - start}
+
+
+def prepare_model(benchmark_name: str, dataset: str, objectives: list[str],
+                  thread_count: int, retrain: bool) -> dict:
+    """Load the surrogate of ``objectives`` from the model store, training
+    it if it is missing."""
+    from catbench.models import ModelStore, load_models
+    from catbench.registry import get_definition
+    from catbench.tabular import TabularDataset
+
+    start = time.perf_counter()
+    search_space = get_definition(benchmark_name).search_space
+    key_params = search_space.params + (search_space.fidelity_params or [])
+    features = [param.name for param in key_params]
+    tabular = TabularDataset(benchmark_name, dataset, key_params, objectives, False)
+    if tabular.table is None:
+        raise FileNotFoundError(tabular.tab_path)
+    store = ModelStore()
+    key = store.key(benchmark_name, tabular.content_hash,
+                    objectives[0] if len(objectives) == 1 else objectives, features)
+    trained = retrain or not os.path.exists(store.path(key))
+    load_models(lambda: tabular.query_tab, benchmark_name, tabular.content_hash, objectives,
+                features, retrain=retrain, store=store, multi_output=len(objectives) > 1,
+                thread_count=thread_count)
+    return {'trained': trained, 'seconds': time.perf_counter() - start}
+
+
+def prebuild(benchmarks: list[str], dataset: Optional[str] = None,
+             objectives: Optional[list[str]] = None, jobs: Optional[int] = None,
+             multi_output_model: bool = False, retrain: bool = False,
+             enable_download: bool = True) -> list[dict]:
+    """Prepare the datasets and models of ``benchmarks`` on ``jobs`` processes
+    and return one report per task."""
+    from catbench.registry import get_benchmark
+
+    cores = os.cpu_count() or 1
+    jobs = jobs or cores
+    thread_count = max(1, cores // jobs)
+    plans = {}
+    for benchmark_name in benchmarks:
+        entry = get_benchmark(benchmark_name)
+        if (dataset or entry.default_dataset) is None:
+            print(f"{entry.name}: skipped (no default dataset)", flush=True)
+            continue
+        names = objectives or entry.get_default_objectives()
+        groups = [names] if multi_output_model and len(names) > 1 else [[name] for name in names]
+        plans[(entry.name, dataset or entry.default_dataset)] = groups
+
+    reports = []
+    with concurrent.futures.ProcessPoolExecutor(jobs) as pool:
+        pending = {pool.submit(prepare_dataset, name, data, enable_download): (name, data, None)
+                   for name, data in plans}
+        while pending:
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                name, data, group = pending.pop(future)
+                report = {'benchmark': name, 'dataset': data,
+                          'task': 'dataset' if group is None else '+'.join(group)}
+                try:
+                    report.update(future.result())
+                except Exception as e:
+                    report['error'] = f'{type(e).__name__}: {e}'
+                reports.append(report)
+                _print_report(report)
+                if group is None and 'error' not in report:
+                    # The models of a dataset are trained once its cache exists
+                    for objectives_group in plans[(name, data)]:
+                        future = pool.submit(prepare_model, name, data, objectives_group,
+                                             thread_count, retrain)
+                        pending[future] = (name, data, objectives_group)
+    return reports
+
+
+def _print_report(report: dict):
+    name = f"{report['benchmark']}/{report['dataset']} {report['task']}"
+    if 'error' in report:
+        print(f"{name}: failed ({report['error']})", flush=True)
+    else:
+        detail = f"{report['rows']} rows" if 'rows' in report else \
+            'trained' if report['trained'] else 'loaded'
+        print(f"{name}: {detail} in {report['seconds']:.2f}s", flush=True)
+
+
+def main(argv: Optional[list[str]] = None):
+    from catbench.registry import available_benchmarks
+
+    parser = argparse.ArgumentParser(prog='python -m catbench prebuild',
+                                     description="Prepare datasets and surrogate models")
+    parser.add_argument('--benchmarks', type=str, nargs='+', default=None,
+                        help='Benchmarks to prepare (default: all registered)')
+    parser.add_argument('--dataset', type=str, default=None,
+                        help='Dataset to use instead of each benchmark\'s default')
+    parser.add_argument('--objectives', type=str, nargs='+', default=None,
+                        help='Objectives to train models for (default: each benchmark\'s defaults)')
+    parser.add_argument('--jobs', type=int, default=None,
+                        help='Number of worker processes (default: one per core)')
+    parser.add_argument('--multi_output_model', action='store_true',
+                        help='Train one multi-output surrogate per benchmark')
+    parser.add_argument('--retrain_model', action='store_true',
+                        help='Retrain models that are already stored')
+    parser.add_argument('--enable_download', action=argparse.BooleanOptionalAction, default=True,
+                        help='Enable downloading of datasets')
+    args = parser.parse_args(argv)
+
+    start = time.perf_counter()
+    reports = prebuild(args.benchmarks or available_benchmarks(), args.dataset, args.objectives,
+                       args.jobs, args.multi_output_model, args.retrain_model,
+                       args.enable_download)
+    failed = [report for report in reports if 'error' in report]
+    print(f"Prepared {len(reports) - len(failed)} of {len(reports)} tasks in "
+          f"{time.perf_counter() - start:.2f}s", flush=True)
+    if failed:
+        sys.exit(1)
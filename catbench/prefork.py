@@ -0,0 +1,227 @@
+"""Pool of pre-started processes that answer software queries.
+
+A study served from one process answers every query from the dataset or the
+surrogate models under the GIL, so more clients only add latency. A
+:class:`PreforkPool` starts its processes once the study has loaded its
+dataset and trained any missing models. The processes are spawned rather
+than forked, as neither CatBoost's thread pool nor gRPC survive a fork. Each
+rebuilds a software-only copy of the study, which memory-maps the same
+columnar cache (so the table's pages are shared) and loads the stored
+models. Queries are handed to idle processes, and the queries that arrive
+while every process is busy go to the next idle one as a single batch: one
+encoding and one prediction per model for all of them. A query that cannot
+be answered fails on its own, not with the batch it was sent in.
+
+Only the lookups and predictions run in the pool. Hardware evaluations, the
+Pareto archive and the query log stay in the serving process, and queries the
+pool cannot answer (including configurations measured after the pool started)
+are answered by the study there.
+"""
+import asyncio
+import collections
+import functools
+import logging
+import multiprocessing
+import os
+import signal
+from typing import Callable, Optional
+
+import numpy as np
+
+from catbench.constraints import to_columns
+
+
+def _answer(study, queries: list, fidelities: list) -> tuple:
+    columns = to_columns(queries, study.parameters)
+    fidelities = [{param.name: fidelity.get(param.name, param.default)
+                   for param in study.fidelity_params} for fidelity in fidelities]
+    fidelity_columns = study._fidelity_columns(fidelities, len(queries))
+    return (columns, fidelity_columns, *study._query_software(columns, fidelity_columns))
+
+
+def software_study(study) -> Callable:
+    """A picklable function that builds a software-only copy of ``study``
+    from its dataset cache and stored models."""
+    from catbench.main import benchmark
+
+    software = study.software_query
+    return functools.partial(benchmark, study.benchmark_name, dataset=study.dataset,
+                             enable_tabular=software.enable_tabular,
+                             enable_model=software.enable_model,
+                             enabled_objectives=study.enabled_objectives, enable_download=False,
+                             multi_output_model=software.multi_output_model,
+                             enable_result_store=False, track_pareto=False)
+
+
+def _serve(factory: Callable, connection):
+    # Interrupts go to the serving process, which stops the pool
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        study = factory()
+    except Exception as e:
+        connection.send(RuntimeError(f'{type(e).__name__}: {e}'))
+        return
+    # Ready
+    connection.send(None)
+    while True:
+        try:
+            batch = connection.recv()
+        except EOFError:
+            break
+        if batch is None:
+            break
+        queries, fidelities = batch
+        rows, errors = list(range(len(queries))), {}
+        try:
+            try:
+                answer = _answer(study, queries, fidelities)
+            except Exception:
+                # Find the queries at fault, so that they fail alone
+                for row in rows:
+                    try:
+                        _answer(study, queries[row:row + 1], fidelities[row:row + 1])
+                    except Exception as e:
+                        errors[row] = f'{type(e).__name__}: {e}'
+                rows = [row for row in rows if row not in errors]
+                answer = _answer(study, [queries[row] for row in rows],
+                                 [fidelities[row] for row in rows]) if rows else None
+            reply = (rows, errors, answer)
+        except Exception as e:
+            reply = RuntimeError(f'{type(e).__name__}: {e}')
+        connection.send(reply)
+
+
+class _Process:
+    def __init__(self, process, connection):
+        self.process = process
+        self.connection = connection
+        # Futures of the batch being answered
+        self.batch = None
+
+
+class PreforkPool:
+    """``processes`` processes (one per core by default) that answer the
+    software queries of ``study``. Each builds its copy of the study with
+    ``factory``, by default :func:`software_study`; benchmarks registered at
+    run time are unknown to the spawned processes and need a factory that
+    registers them first."""
+
+    def __init__(self, study, processes: Optional[int] = None, max_batch: int = 256,
+                 factory: Optional[Callable] = None):
+        if study.software_query is None:
+            raise ValueError("A study without tabular or surrogate mode has nothing to serve from a pool")
+        self.study = study
+        self.max_batch = max_batch
+        self.queue = collections.deque()
+        self.batches = 0
+        self.queries = 0
+        self._loop = None
+        factory = factory or software_study(study)
+        context = multiprocessing.get_context('spawn')
+        self.processes = []
+        for _ in range(processes or os.cpu_count() or 1):
+            connection, child_connection = context.Pipe()
+            process = context.Process(target=_serve, args=(factory, child_connection), daemon=True)
+            process.start()
+            child_connection.close()
+            self.processes.append(_Process(process, connection))
+        for process in self.processes:
+            try:
+                error = process.connection.recv()
+            except EOFError:
+                error = RuntimeError(f"Serving process {process.process.pid} exited")
+            if error is not None:
+                self.close()
+                raise error
+        self.idle = list(self.processes)
+
+    def _bind_loop(self):
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            for process in self.processes:
+                loop.add_reader(process.connection.fileno(), self._receive, process)
+
+    async def query(self, query: dict, fidelities: dict) -> Optional[dict]:
+        """Answer ``query`` from the dataset or surrogate models; None when
+        neither can."""
+        self._bind_loop()
+        if not self.processes:
+            raise RuntimeError("Every process of the pool has exited")
+        future = self._loop.create_future()
+        self.queue.append((query, fidelities, future))
+        self._dispatch()
+        return await future
+
+    def _dispatch(self):
+        while self.queue and self.idle:
+            process = self.idle.pop()
+            batch = [self.queue.popleft() for _ in range(min(len(self.queue), self.max_batch))]
+            process.batch = batch
+            process.connection.send(([query for query, _, _ in batch],
+                                     [fidelities for _, fidelities, _ in batch]))
+            self.batches += 1
+            self.queries += len(batch)
+
+    def _receive(self, process: _Process):
+        try:
+            reply = process.connection.recv()
+        except (EOFError, OSError):
+            reply = RuntimeError(f"Serving process {process.process.pid} exited")
+            logging.error(str(reply))
+            self._loop.remove_reader(process.connection.fileno())
+            self.processes.remove(process)
+            if process in self.idle:
+                self.idle.remove(process)
+        batch, process.batch = process.batch or [], None
+        if isinstance(reply, Exception):
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(reply)
+        else:
+            rows, errors, answer = reply
+            for row, message in errors.items():
+                future = batch[row][2]
+                if not future.done():
+                    future.set_exception(ValueError(message))
+            if answer is not None:
+                columns, fidelity_columns, results, pending, sources = answer
+                self.study._record_batch(columns, fidelity_columns, results, sources,
+                                         np.flatnonzero(~pending))
+                for i, row in enumerate(rows):
+                    future = batch[row][2]
+                    if not future.done():
+                        future.set_result(None if pending[i] else
+                                          {objective: float(values[i]) for objective, values in results.items()})
+        if process in self.processes:
+            self.idle.append(process)
+        elif not self.processes:
+            while self.queue:
+                future = self.queue.popleft()[2]
+                if not future.done():
+                    future.set_exception(reply)
+        self._dispatch()
+
+    def stats(self) -> dict:
+        return {
+            'processes': len(self.processes),
+            'idle': len(self.idle),
+            'queued': len(self.queue),
+            'batches': self.batches,
+            'queries': self.queries,
+            'mean_batch': self.queries / self.batches if self.batches else None,
+        }
+
+    def close(self):
+        for process in self.processes:
+            if self._loop is not None and not self._loop.is_closed():
+                self._loop.remove_reader(process.connection.fileno())
+            try:
+                process.connection.send(None)
+            except OSError:
+                pass
+        for process in self.processes:
+            process.process.join(timeout=5)
+            process.connection.close()
+        self.processes = []
+        self.idle = []
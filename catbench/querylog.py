@@ -0,0 +1,251 @@
+"""Append-only, memory-mapped log of the queries a study answers.
+
+A log is a directory with a ``meta.json`` and one raw little-endian file per
+column: the configuration parameters and fidelities in a fixed-width
+encoding (permutations as their rank, string categories as their index,
+integers as int64, as a query may lie outside its parameter's bounds), one
+float64 column per objective, the wall-clock time of the query and where its
+result came from (tabular, surrogate or hardware). Rows are buffered in chunks of
+``CHUNK_ROWS`` and appended to the column files when a chunk fills up, when
+the log is flushed and when it is garbage collected or the interpreter
+exits, so the memory a study holds for its history does not grow with the
+number of queries.
+
+:class:`QueryLogReader` memory-maps the columns, so the history can be sliced
+or streamed in chunks without loading it, and :meth:`QueryLogReader.replay`
+feeds it back as ``(config, fidelities, result)`` tuples. A log has a single
+writer; readers may open it while it is written and see the chunks written
+so far.
+"""
+import json
+import math
+import os
+import time
+import weakref
+from typing import Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+from interopt.parameter import ParamType
+
+from catbench.permutations import get_codec
+from catbench.space import Domain
+
+FORMAT_VERSION = 2
+CHUNK_ROWS = 1 << 16
+
+SOURCES = ('tabular', 'surrogate', 'hardware')
+TABULAR, SURROGATE, HARDWARE = range(len(SOURCES))
+
+
+def _column_spec(param, group: str) -> dict:
+    spec = {'name': param.name, 'group': group, 'file': f'{group}_{param.name}.bin'}
+    param_type = param.param_type_enum
+    if param_type == ParamType.PERMUTATION:
+        size = math.factorial(param.length)
+        return {**spec, 'kind': 'rank', 'dtype': np.min_scalar_type(size).str, 'length': param.length}
+    if param_type == ParamType.CATEGORICAL:
+        categories = list(param.categories)
+        if not all(isinstance(c, (int, np.integer)) for c in categories):
+            # -1 marks values that are not categories
+            return {**spec, 'kind': 'code', 'dtype': np.min_scalar_type(-len(categories)).str,
+                    'categories': categories}
+    elif param_type in (ParamType.REAL, ParamType.ORDINAL, ParamType.NUMERIC):
+        return {**spec, 'kind': 'float', 'dtype': np.dtype(np.float64).str}
+    elif param_type not in (ParamType.BOOLEAN, ParamType.INTEGER, ParamType.INTEGER_EXP):
+        raise ValueError(f"Parameter {param.name} of type {param_type.name} cannot be logged")
+    return {**spec, 'kind': 'int', 'dtype': np.dtype(np.int64).str}
+
+
+def _columns_meta(params: list, fidelity_params: list, objectives: list[str]) -> list[dict]:
+    float64 = np.dtype(np.float64).str
+    return ([_column_spec(param, 'param') for param in params] +
+            [_column_spec(param, 'fidelity') for param in fidelity_params] +
+            [{'name': name, 'group': 'objective', 'file': f'objective_{name}.bin',
+              'kind': 'float', 'dtype': float64} for name in objectives] +
+            [{'name': 'timestamp', 'group': 'query', 'file': 'timestamp.bin',
+              'kind': 'float', 'dtype': float64},
+             {'name': 'source', 'group': 'query', 'file': 'source.bin',
+              'kind': 'source', 'dtype': np.dtype(np.uint8).str}])
+
+
+def _committed_rows(path: str, columns: list[dict]) -> int:
+    """Rows present in every column file; a chunk cut short by a crash is
+    only partly in some of them."""
+    return min((os.path.getsize(os.path.join(path, c['file'])) // np.dtype(c['dtype']).itemsize
+                if os.path.exists(os.path.join(path, c['file'])) else 0) for c in columns)
+
+
+class _Chunk:
+    """Column buffers of the rows not yet written to disk."""
+
+    def __init__(self, paths: list[str], dtypes: list, rows: int):
+        self.paths = paths
+        self.arrays = [np.empty(rows, dtype=dtype) for dtype in dtypes]
+        self.capacity = rows
+        self.size = 0
+
+    def extend(self, columns: list[np.ndarray], n: int):
+        offset = 0
+        while offset < n:
+            take = min(n - offset, self.capacity - self.size)
+            for array, column in zip(self.arrays, columns):
+                array[self.size:self.size + take] = column[offset:offset + take]
+            self.size += take
+            offset += take
+            if self.size == self.capacity:
+                self.write()
+
+    def write(self):
+        if not self.size:
+            return
+        for path, array in zip(self.paths, self.arrays):
+            with open(path, 'ab') as f:
+                f.write(memoryview(array[:self.size]))
+        self.size = 0
+
+
+class QueryLog:
+    """Writer of a query log at ``path``; an existing log with the same
+    columns is appended to."""
+
+    def __init__(self, path: str, params: list, fidelity_params: list, objectives: list[str],
+                 benchmark_name: Optional[str] = None, dataset: Optional[str] = None,
+                 chunk_rows: int = CHUNK_ROWS):
+        self.path = path
+        self.params = params
+        self.fidelity_params = fidelity_params
+        self.objectives = list(objectives)
+        self.columns = _columns_meta(params, fidelity_params, self.objectives)
+        os.makedirs(path, exist_ok=True)
+        meta_path = os.path.join(path, 'meta.json')
+        if os.path.exists(meta_path):
+            with open(meta_path, encoding='utf-8') as f:
+                meta = json.load(f)
+            if meta['version'] != FORMAT_VERSION or meta['columns'] != self.columns:
+                raise ValueError(f"{path} holds a query log with different columns")
+            # Drop the rows of a chunk that was only partly written
+            rows = _committed_rows(path, self.columns)
+            for column in self.columns:
+                file = os.path.join(path, column['file'])
+                if os.path.exists(file):
+                    os.truncate(file, rows * np.dtype(column['dtype']).itemsize)
+        else:
+            meta = {'version': FORMAT_VERSION, 'benchmark': benchmark_name, 'dataset': dataset,
+                    'sources': list(SOURCES), 'columns': self.columns}
+            tmp_path = f'{meta_path}.{os.getpid()}.tmp'
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, meta_path)
+        self._domains = {param.name: Domain(param) for param, column in
+                         zip(params + fidelity_params, self.columns) if column['kind'] == 'code'}
+        self._chunk = _Chunk([os.path.join(path, column['file']) for column in self.columns],
+                             [column['dtype'] for column in self.columns], chunk_rows)
+        # Buffered rows are written when the log is collected or at exit
+        self._finalizer = weakref.finalize(self, self._chunk.write)
+
+    def _encode(self, column: dict, values) -> np.ndarray:
+        if column['kind'] == 'code':
+            return self._domains[column['name']].encode(values, strict=False)
+        return values
+
+    def append(self, columns: dict, fidelity_columns: dict, results: dict, sources,
+               rows: Optional[np.ndarray] = None):
+        """Log the rows ``rows`` (all if None) of a batch given as parameter
+        columns, fidelity columns and objective arrays; ``sources`` is one
+        source per row or a single one for all."""
+        n = len(next(iter(results.values()))) if rows is None else len(rows)
+        if n == 0:
+            return
+        groups = {'param': columns, 'fidelity': fidelity_columns, 'objective': results,
+                  'query': {'timestamp': time.time(), 'source': sources}}
+        encoded = []
+        for column in self.columns:
+            values = groups[column['group']].get(column['name'], np.nan if column['kind'] == 'float' else 0)
+            if np.ndim(values) == 0:
+                encoded.append(np.broadcast_to(values, (n,)))
+                continue
+            values = np.asarray(values)
+            encoded.append(self._encode(column, values if rows is None else values[rows]))
+        self._chunk.extend(encoded, n)
+
+    def flush(self):
+        self._chunk.write()
+
+    def close(self):
+        self._finalizer()
+
+
+class QueryLogReader:
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        self.columns = self.meta['columns']
+        self.params = [c['name'] for c in self.columns if c['group'] == 'param']
+        self.fidelities = [c['name'] for c in self.columns if c['group'] == 'fidelity']
+        self.objectives = [c['name'] for c in self.columns if c['group'] == 'objective']
+        self.refresh()
+
+    def refresh(self):
+        """Pick up rows written since the log was opened."""
+        self.rows = _committed_rows(self.path, self.columns)
+        self._arrays = {}
+
+    def __len__(self) -> int:
+        return self.rows
+
+    def column(self, name: str, group: Optional[str] = None) -> np.ndarray:
+        """The stored (encoded) values of a column, memory-mapped."""
+        column = next(c for c in self.columns
+                      if c['name'] == name and (group is None or c['group'] == group))
+        key = (column['group'], name)
+        if key not in self._arrays:
+            dtype = np.dtype(column['dtype'])
+            if self.rows == 0:
+                self._arrays[key] = np.empty(0, dtype=dtype)
+            else:
+                self._arrays[key] = np.memmap(os.path.join(self.path, column['file']),
+                                              dtype=dtype, mode='r', shape=(self.rows,))
+        return self._arrays[key]
+
+    @staticmethod
+    def _decode(column: dict, stored: np.ndarray):
+        kind = column['kind']
+        if kind == 'rank':
+            return np.asarray(get_codec(column['length']).render(stored), dtype=object)
+        if kind == 'code':
+            categories = np.asarray(column['categories'] + [None], dtype=object)
+            return categories[stored]
+        if kind == 'source':
+            return np.asarray(SOURCES, dtype=object)[stored]
+        return np.asarray(stored)
+
+    def read(self, start: int = 0, stop: Optional[int] = None) -> dict:
+        """Decoded columns of rows ``start:stop``, keyed by ``(group, name)``."""
+        stop = self.rows if stop is None else min(stop, self.rows)
+        return {(c['group'], c['name']): self._decode(c, self.column(c['name'], c['group'])[start:stop])
+                for c in self.columns}
+
+    def to_frame(self, start: int = 0, stop: Optional[int] = None) -> pd.DataFrame:
+        return pd.DataFrame({name: values for (_, name), values in self.read(start, stop).items()})
+
+    def iter_frames(self, chunk_rows: int = CHUNK_ROWS) -> Iterator[pd.DataFrame]:
+        for start in range(0, self.rows, chunk_rows):
+            yield self.to_frame(start, start + chunk_rows)
+
+    def replay(self, start: int = 0, stop: Optional[int] = None,
+               chunk_rows: int = CHUNK_ROWS) -> Iterator[tuple]:
+        """Yield the logged ``(config, fidelities, result)`` of each row in
+        the order the queries were answered."""
+        stop = self.rows if stop is None else min(stop, self.rows)
+        for chunk in range(start, stop, chunk_rows):
+            columns = self.read(chunk, min(chunk + chunk_rows, stop))
+            groups = []
+            for group, names in (('param', self.params), ('fidelity', self.fidelities),
+                                 ('objective', self.objectives)):
+                values = [columns[(group, name)].tolist() for name in names]
+                groups.append([dict(zip(names, row)) for row in zip(*values)] if names
+                              else [{} for _ in columns[('query', 'timestamp')]])
+            yield from zip(*groups)
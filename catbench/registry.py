@@ -0,0 +1,112 @@
+"""Registry of the benchmarks that ``catbench.benchmark()`` can build.
+
+Definitions are registered by reference and only imported and built the first
+time they are requested; the built ``ProblemDefinition`` is memoized. Other
+packages can add benchmarks with :func:`register_benchmark` or by declaring an
+entry point in the ``catbench.benchmarks`` group that points at a function
+returning a ``ProblemDefinition``.
+"""
+import importlib
+from importlib import metadata
+from typing import Callable, Optional, Union
+
+ENTRY_POINT_GROUP = 'catbench.benchmarks'
+
+TACO_OBJECTIVES = ['compute_time']
+RISE_OBJECTIVES = ['compute_time', 'energy']
+
+
+class BenchmarkEntry:
+    def __init__(self, name: str, definition: Union[str, Callable], suite: Optional[str] = None,
+                 default_objectives: Optional[list[str]] = None,
+                 default_dataset: Optional[str] = None, checksums: Optional[dict[str, str]] = None):
+        self.name = name
+        self.suite = suite
+        self.default_objectives = default_objectives
+        self.default_dataset = default_dataset
+        # SHA-256 of the CSV file of each dataset, checked when it is downloaded
+        self.checksums = dict(checksums or {})
+        self._factory = definition
+        self._definition = None
+
+    @property
+    def definition(self):
+        if self._definition is None:
+            factory = self._factory
+            if isinstance(factory, str):
+                module_name, function_name = factory.split(':')
+                factory = getattr(importlib.import_module(module_name), function_name)
+            self._definition = factory() if callable(factory) else factory
+        return self._definition
+
+    def get_default_objectives(self) -> list[str]:
+        if self.default_objectives is not None:
+            return list(self.default_objectives)
+        return [objective.name for objective in self.definition.search_space.objectives]
+
+
+_registry: dict[str, BenchmarkEntry] = {}
+_entry_points_loaded = False
+
+
+def register_benchmark(name: str, definition, suite: Optional[str] = None,
+                       default_objectives: Optional[list[str]] = None,
+                       default_dataset: Optional[str] = None, replace: bool = False,
+                       checksums: Optional[dict[str, str]] = None):
+    """Register a benchmark under ``name`` (case-insensitive).
+
+    ``definition`` is a ``ProblemDefinition``, a function returning one, or a
+    ``'module:function'`` reference that is imported on first use.
+    ``checksums`` maps dataset names to the SHA-256 their download must match.
+    """
+    name = name.lower()
+    if name in _registry and not replace:
+        raise ValueError(f"Benchmark {name} is already registered")
+    _registry[name] = BenchmarkEntry(name, definition, suite, default_objectives, default_dataset,
+                                     checksums)
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+    for entry_point in metadata.entry_points(group=ENTRY_POINT_GROUP):
+        if entry_point.name.lower() not in _registry:
+            register_benchmark(entry_point.name, lambda entry_point=entry_point: entry_point.load()())
+
+
+def get_benchmark(name: str) -> BenchmarkEntry:
+    name = name.lower()
+    if name not in _registry:
+        _load_entry_points()
+    if name not in _registry:
+        raise ValueError("Unknown benchmark name")
+    return _registry[name]
+
+
+def get_definition(name: str):
+    return get_benchmark(name).definition
+
+
+def dataset_checksum(name: str, dataset: str) -> Optional[str]:
+    """The SHA-256 registered for ``dataset`` of benchmark ``name``, if any."""
+    try:
+        return get_benchmark(name).checksums.get(dataset)
+    except ValueError:
+        return None
+
+
+def available_benchmarks(suite: Optional[str] = None) -> list[str]:
+    _load_entry_points()
+    return sorted(name for name, entry in _registry.items() if suite is None or entry.suite == suite)
+
+
+for _name in ['spmm', 'spmv', 'sddmm', 'mttkrp', 'ttv']:
+    register_benchmark(_name, f'catbench.benchmarks.{_name}:get_{_name}_definition', suite='taco',
+                       default_objectives=TACO_OBJECTIVES, default_dataset='2630')
+for _name in ['asum', 'harris', 'kmeans', 'mm', 'scal', 'stencil']:
+    register_benchmark(_name, f'catbench.benchmarks.{_name}:get_{_name}_definition', suite='rise',
+                       default_objectives=RISE_OBJECTIVES, default_dataset='rtxtitan')
+for _name in ['carl', 'intersect']:
+    register_benchmark(_name, f'catbench.benchmarks.{_name}:get_{_name}_definition')
@@ -0,0 +1,170 @@
+"""Persistent store of hardware evaluation results.
+
+Results are kept in a SQLite database under ``cache/`` that any number of
+processes on the host can share. Entries are addressed by benchmark, dataset,
+canonical configuration, fidelities and the server that measured them. The
+servers of a study measure the same hardware, which its dataset names, so a
+lookup matches results from any of them unless it names one: the scheduler
+only picks a server after the lookup. A lookup is also satisfied by a result measured at higher fidelity: a result
+with 15 iterations and 5 repeats answers a request for 10 iterations and 3
+repeats, as long as the remaining fidelities are equal. Entries expire after
+``ttl`` seconds and the least recently used ones are evicted once the store
+holds more than ``max_entries`` results.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional
+
+import numpy as np
+
+from interopt.parameter import ParamType
+
+from catbench.cache import cache_dir, fingerprint
+from catbench.permutations import get_codec
+
+RESULT_TTL = float(os.environ['CATBENCH_RESULT_TTL']) if 'CATBENCH_RESULT_TTL' in os.environ else None
+MAX_RESULT_ENTRIES = int(os.environ.get('CATBENCH_RESULT_STORE_ENTRIES', 1_000_000))
+
+# Fidelities for which a larger stored value also answers a smaller request
+DOMINATING_FIDELITIES = ('iterations', 'repeats')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    key TEXT PRIMARY KEY,
+    benchmark TEXT NOT NULL,
+    dataset TEXT NOT NULL,
+    config_key TEXT NOT NULL,
+    config TEXT NOT NULL,
+    fidelities TEXT NOT NULL,
+    server TEXT NOT NULL,
+    result TEXT NOT NULL,
+    created REAL NOT NULL,
+    accessed REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS results_config ON results (benchmark, dataset, config_key);
+CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed);
+"""
+
+
+def canonical_value(value):
+    if isinstance(value, np.generic):
+        value = value.item()
+    if isinstance(value, (tuple, list, np.ndarray)):
+        # Same rendering as permutation values elsewhere in catbench
+        return str(tuple(int(v) for v in value))
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def canonical(values: dict, codecs: Optional[dict] = None) -> str:
+    """JSON of ``values`` with sorted keys. Parameters with a codec in
+    ``codecs`` are permutations, stored as their canonical string whether
+    they were given as a string, tuple or rank."""
+    codecs = codecs or {}
+    return json.dumps({name: codecs[name].canonical(value) if name in codecs else canonical_value(value)
+                       for name, value in values.items()}, sort_keys=True)
+
+
+def satisfies(stored: dict, requested: dict, dominating=DOMINATING_FIDELITIES) -> bool:
+    for name, value in requested.items():
+        if name not in stored:
+            return False
+        if name in dominating:
+            if stored[name] < value:
+                return False
+        elif stored[name] != value:
+            return False
+    return True
+
+
+class ResultStore:
+    def __init__(self, benchmark_name: str, dataset: str, path: Optional[str] = None,
+                 ttl: Optional[float] = None, max_entries: int = MAX_RESULT_ENTRIES,
+                 dominating=DOMINATING_FIDELITIES, parameters: Optional[list] = None):
+        self.benchmark_name = benchmark_name
+        self.codecs = {param.name: get_codec(param.length) for param in parameters or []
+                       if param.param_type_enum == ParamType.PERMUTATION}
+        self.dataset = str(dataset)
+        self.path = path or os.path.join(cache_dir(), 'results.sqlite')
+        self.ttl = ttl if ttl is not None else RESULT_TTL
+        self.max_entries = max_entries
+        self.dominating = tuple(dominating)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._puts = 0
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False,
+                                           isolation_level=None)
+        # WAL lets readers in other processes proceed while one process writes
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.executescript(SCHEMA)
+
+    def _expiry(self, now: float) -> float:
+        return now - self.ttl if self.ttl is not None else float('-inf')
+
+    def get(self, config: dict, fidelities: dict, server: Optional[str] = None) -> Optional[dict]:
+        """Return the stored result of ``config`` measured at ``fidelities``
+        or a dominating fidelity, preferring the highest fidelity; with
+        ``server``, only results measured by that server."""
+        now = time.time()
+        config_key = fingerprint(canonical(config, self.codecs))
+        sql = ('SELECT key, fidelities, result FROM results '
+               'WHERE benchmark = ? AND dataset = ? AND config_key = ? AND created >= ?')
+        args = [self.benchmark_name, self.dataset, config_key, self._expiry(now)]
+        if server is not None:
+            sql += ' AND server = ?'
+            args.append(server)
+        requested = json.loads(canonical(fidelities))
+        with self._lock:
+            rows = self._connection.execute(sql + ' ORDER BY created DESC', args).fetchall()
+            matches = [(json.loads(stored), key, result) for key, stored, result in rows]
+            matches = [match for match in matches if satisfies(match[0], requested, self.dominating)]
+            if not matches:
+                self.misses += 1
+                return None
+            _, key, result = max(matches, key=lambda match: tuple(
+                match[0].get(name, 0) for name in self.dominating))
+            self._connection.execute('UPDATE results SET accessed = ? WHERE key = ?', (now, key))
+            self.hits += 1
+        return json.loads(result)
+
+    def put(self, config: dict, fidelities: dict, result: dict, server: str = ''):
+        now = time.time()
+        config = canonical(config, self.codecs)
+        fidelities = canonical(fidelities)
+        key = fingerprint(self.benchmark_name, self.dataset, config, fidelities, server)
+        with self._lock:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, self.benchmark_name, self.dataset, fingerprint(config), config, fidelities,
+                 server, json.dumps(result), now, now))
+            self._puts += 1
+            evict = self._puts % 256 == 1
+        if evict:
+            self.evict()
+
+    def evict(self):
+        now = time.time()
+        with self._lock:
+            self._connection.execute('DELETE FROM results WHERE created < ?', (self._expiry(now),))
+            count, = self._connection.execute('SELECT COUNT(*) FROM results').fetchone()
+            if count > self.max_entries:
+                self._connection.execute(
+                    'DELETE FROM results WHERE key IN '
+                    '(SELECT key FROM results ORDER BY accessed LIMIT ?)',
+                    (count - self.max_entries,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            count, = self._connection.execute(
+                'SELECT COUNT(*) FROM results WHERE benchmark = ? AND dataset = ?',
+                (self.benchmark_name, self.dataset)).fetchone()
+        return count
+
+    def close(self):
+        self._connection.close()
@@ -0,0 +1,233 @@
+"""Load-aware dispatch of evaluations over a pool of workers.
+
+Every worker has a FIFO queue in front of ``max_concurrency`` evaluation
+slots. A query goes to the worker with the lowest expected completion time,
+estimated from its queue depth, the evaluations it has in flight and its
+measured speed relative to the other workers at the same fidelity settings.
+A worker whose evaluation fails with a transport error (the worker is
+unavailable, or the call timed out or was cancelled) is excluded for a while
+(with exponential backoff) and the query is retried on another worker; any
+other error, including a status the worker answered the query with, is the
+query's own and is raised at once. With hedging enabled, a query that has
+been running longer than the p95 latency of its fidelity settings is also
+issued to an idle worker and the first answer wins.
+"""
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Awaitable, Callable, Optional
+
+import grpc.aio
+import numpy as np
+
+from catbench import telemetry
+
+# Status codes that say something about the worker or the connection to it
+# rather than the query
+TRANSPORT_CODES = frozenset({grpc.StatusCode.UNAVAILABLE, grpc.StatusCode.DEADLINE_EXCEEDED,
+                             grpc.StatusCode.CANCELLED})
+
+
+def is_transport_error(error: BaseException) -> bool:
+    """Whether ``error`` is a failure of the worker or its connection, which
+    is retried elsewhere, rather than of the query, which is raised at once."""
+    if isinstance(error, grpc.aio.AioRpcError):
+        return error.code() in TRANSPORT_CODES
+    return isinstance(error, (ConnectionError, asyncio.TimeoutError))
+
+
+class WorkerState:
+    def __init__(self, url: str):
+        self.url = url
+        self.queued = 0
+        self.in_flight = 0
+        self.completed = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.excluded_until = 0.0
+        # Latency relative to the pool average for the same fidelity settings
+        self.speed = 1.0
+        self.busy_time = 0.0
+        self.slots: Optional[asyncio.Semaphore] = None
+
+    def stats(self) -> dict:
+        return {
+            'queued': self.queued,
+            'in_flight': self.in_flight,
+            'completed': self.completed,
+            'failures': self.failures,
+            'relative_latency': self.speed,
+            'throughput': self.completed / self.busy_time if self.busy_time else None,
+            'excluded': self.excluded_until > time.monotonic(),
+        }
+
+
+class Scheduler:
+    def __init__(self, urls: list[str], max_concurrency: int = 1, hedge: bool = False,
+                 hedge_quantile: float = 0.95, hedge_min_samples: int = 20,
+                 max_retries: int = 2, exclude_seconds: float = 30.0, history: int = 256,
+                 hedge_poll: float = 0.1):
+        self.workers = [WorkerState(url) for url in urls]
+        self.max_concurrency = max_concurrency
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_samples = hedge_min_samples
+        self.max_retries = max_retries
+        self.exclude_seconds = exclude_seconds
+        self.history = history
+        self.hedge_poll = hedge_poll
+        self.latencies: dict = {}
+        self.mean_latency: dict = {}
+        self.hedged = 0
+        self.hedge_wins = 0
+        self.retries = 0
+        self._started = {}
+        self._loop = None
+
+    def _bind_loop(self):
+        # Semaphores belong to an event loop; statistics outlive it
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            self._loop = loop
+            for worker in self.workers:
+                worker.slots = asyncio.Semaphore(self.max_concurrency)
+                worker.queued = worker.in_flight = 0
+
+    def expected_wait(self, worker: WorkerState) -> float:
+        return (worker.queued + worker.in_flight + 1) / self.max_concurrency * worker.speed
+
+    def pick(self, exclude=(), prefer: Optional[str] = None) -> WorkerState:
+        now = time.monotonic()
+        candidates = [w for w in self.workers if w not in exclude] or list(self.workers)
+        available = [w for w in candidates if w.excluded_until <= now]
+        if not available:
+            return min(candidates, key=lambda w: w.excluded_until)
+        for worker in available:
+            if worker.url == prefer:
+                return worker
+        return min(available, key=self.expected_wait)
+
+    def idle_worker(self, exclude=()) -> Optional[WorkerState]:
+        now = time.monotonic()
+        idle = [w for w in self.workers if w not in exclude and w.excluded_until <= now
+                and w.queued == 0 and w.in_flight < self.max_concurrency]
+        return min(idle, key=lambda w: w.speed) if idle else None
+
+    def hedge_delay(self, key) -> Optional[float]:
+        latencies = self.latencies.get(key)
+        if not self.hedge or latencies is None or len(latencies) < self.hedge_min_samples:
+            return None
+        return float(np.quantile(latencies, self.hedge_quantile))
+
+    def record_success(self, worker: WorkerState, key, latency: float):
+        worker.completed += 1
+        worker.busy_time += latency
+        worker.consecutive_failures = 0
+        self.latencies.setdefault(key, deque(maxlen=self.history)).append(latency)
+        mean = self.mean_latency.get(key)
+        mean = latency if mean is None else 0.9 * mean + 0.1 * latency
+        self.mean_latency[key] = mean
+        if mean > 0:
+            worker.speed = 0.8 * worker.speed + 0.2 * (latency / mean)
+
+    def record_failure(self, worker: WorkerState):
+        worker.failures += 1
+        worker.consecutive_failures += 1
+        backoff = self.exclude_seconds * 2 ** min(worker.consecutive_failures - 1, 5)
+        worker.excluded_until = time.monotonic() + backoff
+
+    def _dispatch(self, worker: WorkerState, call: Callable[[str], Awaitable], key) -> asyncio.Task:
+        # Counted as queued right away so that queries submitted together spread out
+        worker.queued += 1
+        return asyncio.ensure_future(self._run_on(worker, call, key))
+
+    async def _run_on(self, worker: WorkerState, call: Callable[[str], Awaitable], key):
+        waiting = True
+        queued_at = time.perf_counter()
+        try:
+            async with worker.slots:
+                worker.queued -= 1
+                waiting = False
+                telemetry.record('queue_wait', time.perf_counter() - queued_at)
+                worker.in_flight += 1
+                start = time.monotonic()
+                self._started[asyncio.current_task()] = start
+                try:
+                    result = await call(worker.url)
+                except Exception as e:
+                    if is_transport_error(e):
+                        self.record_failure(worker)
+                    raise
+                finally:
+                    worker.in_flight -= 1
+                    self._started.pop(asyncio.current_task(), None)
+                self.record_success(worker, key, time.monotonic() - start)
+                return result
+        finally:
+            if waiting:
+                worker.queued -= 1
+
+    def _hedge_remaining(self, task: asyncio.Task, key) -> Optional[float]:
+        # The deadline counts from when the evaluation started running, not
+        # from when it was queued; None while that is not known yet
+        delay = self.hedge_delay(key)
+        started = self._started.get(task)
+        if delay is None or started is None:
+            return None
+        return max(0.0, started + delay - time.monotonic())
+
+    async def submit(self, call: Callable[[str], Awaitable], key=None, prefer: Optional[str] = None):
+        """Run ``call(url)`` on the best worker and return its result. ``key``
+        identifies the fidelity settings whose latencies are comparable;
+        ``prefer`` names a worker to use while it is healthy."""
+        self._bind_loop()
+        tried = set()
+        error = None
+        for attempt in range(self.max_retries + 1):
+            if attempt:
+                self.retries += 1
+            worker = self.pick(exclude=tried, prefer=prefer)
+            primary = self._dispatch(worker, call, key)
+            tasks = {primary: worker}
+            hedging = self.hedge
+            try:
+                while tasks:
+                    timeout = None
+                    if hedging:
+                        # Past the deadline, poll until a worker is idle
+                        timeout = self._hedge_remaining(primary, key) or self.hedge_poll
+                    done, _ = await asyncio.wait(tasks, timeout=timeout,
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                    if not done:
+                        if self._hedge_remaining(primary, key) != 0.0:
+                            continue
+                        backup = self.idle_worker(exclude=tasks.values())
+                        if backup is not None:
+                            hedging = False
+                            self.hedged += 1
+                            tasks[self._dispatch(backup, call, key)] = backup
+                        continue
+                    for task in done:
+                        finished = tasks.pop(task)
+                        if task.exception() is None:
+                            if finished is not worker:
+                                self.hedge_wins += 1
+                            return task.result()
+                        error = task.exception()
+                        if not is_transport_error(error):
+                            raise error
+                        tried.add(finished)
+                        logging.warning(f"Evaluation on {finished.url} failed: {error}")
+            finally:
+                for task in tasks:
+                    task.cancel()
+        raise error
+
+    def stats(self) -> dict:
+        return {
+            'workers': {worker.url: worker.stats() for worker in self.workers},
+            'hedged': self.hedged,
+            'hedge_wins': self.hedge_wins,
+            'retries': self.retries,
+        }
@@ -0,0 +1,212 @@
+"""gRPC server of a study, as run by the cluster manager.
+
+Serves interopt's unary ``RunConfigurationsClientServer`` and catbench's
+streaming ``RunConfigurationsStream`` (see :mod:`catbench.streaming`), both
+answered by ``study.query_async``, or first by the processes of a
+:class:`~catbench.prefork.PreforkPool` if one is given.
+
+A multi-tenant manager serves every benchmark from one port: each request is
+routed by the benchmark and dataset named in its metadata to a study that is
+created on first use, and all studies send their evaluations through one
+scheduler and one set of connections to the workers.
+"""
+import asyncio
+import re
+import time
+from typing import Callable, Optional
+
+import grpc
+import grpc.aio
+
+import interopt.runner.grpc_runner.config_service_pb2_grpc as cs_grpc
+from interopt.runner.grpc_runner.server import ConfigurationServiceServicer
+
+from catbench import telemetry
+from catbench.client import request_route
+from catbench.streaming import EvaluationError, add_streaming_handler
+
+# Dataset names become file names, so they may not contain path separators
+DATASET_NAME = re.compile(r'[A-Za-z0-9][A-Za-z0-9_.-]*')
+
+
+class StudyServicer(ConfigurationServiceServicer):
+    async def evaluate_request(self, request, context=None):
+        query, fidelities = await self.convert_request(request)
+        query = {name: query[name] for name in self.study.get_parameter_names()}
+        result = await self.study.query_async(query, fidelities)
+        return await self.convert_response(result)
+
+
+class PooledStudyServicer(StudyServicer):
+    """Answers from a pre-forked pool, and from the study the queries the
+    pool cannot answer."""
+
+    def __init__(self, study, pool):
+        super().__init__(study)
+        self.pool = pool
+
+    async def evaluate_request(self, request, context=None):
+        query, fidelities = await self.convert_request(request)
+        query = {name: query[name] for name in self.study.get_parameter_names()}
+        with telemetry.labels(self.study.benchmark_name, self.study.mode), telemetry.span('query'):
+            result = await self.pool.query(query, fidelities)
+        if result is None:
+            result = await self.study.query_async(query, fidelities)
+        return await self.convert_response(result)
+
+    async def RunConfigurationsClientServer(self, request, context):
+        return await self.evaluate_request(request, context)
+
+
+class Tenant:
+    """A study of a multi-tenant manager and the requests it has served."""
+
+    def __init__(self, benchmark_name: str, dataset: str, study):
+        self.benchmark_name = benchmark_name
+        self.dataset = dataset
+        self.servicer = StudyServicer(study)
+        self.created = time.monotonic()
+        self.requests = 0
+        self.completed = 0
+        self.failed = 0
+        self.in_flight = 0
+
+    def stats(self) -> dict:
+        elapsed = time.monotonic() - self.created
+        return {
+            'benchmark': self.benchmark_name,
+            'dataset': self.dataset,
+            'requests': self.requests,
+            'completed': self.completed,
+            'failed': self.failed,
+            'in_flight': self.in_flight,
+            'throughput': self.completed / elapsed if elapsed > 0 else None,
+        }
+
+
+class MultiTenantServicer(cs_grpc.ConfigurationServiceServicer):
+    """Routes requests to the study of their benchmark and dataset, built by
+    ``factory(benchmark_name, dataset)`` on first use. Requests that name
+    neither are routed to ``default``; ``benchmarks`` limits which benchmarks
+    are served and ``max_tenants`` how many studies clients can have created,
+    as each may download a dataset and train models."""
+
+    def __init__(self, factory: Callable, default: tuple, benchmarks: Optional[list[str]] = None,
+                 scheduler=None, max_tenants: Optional[int] = None):
+        self.factory = factory
+        self.default = default
+        self.benchmarks = {name.lower() for name in benchmarks} if benchmarks else None
+        self.scheduler = scheduler
+        self.max_tenants = max_tenants
+        self.tenants: dict = {}
+        self._creating: dict = {}
+
+    async def tenant(self, benchmark_name: Optional[str], dataset: Optional[str]) -> Tenant:
+        from catbench.registry import get_benchmark
+
+        benchmark_name = (benchmark_name or self.default[0]).lower()
+        dataset = dataset or self.default[1]
+        key = (benchmark_name, dataset)
+        tenant = self.tenants.get(key)
+        if tenant is not None:
+            return tenant
+        if self.benchmarks is not None and benchmark_name not in self.benchmarks:
+            raise EvaluationError(grpc.StatusCode.NOT_FOUND, f"Benchmark {benchmark_name} is not served")
+        try:
+            get_benchmark(benchmark_name)
+        except ValueError:
+            raise EvaluationError(grpc.StatusCode.NOT_FOUND, f"Unknown benchmark {benchmark_name}")
+        if not DATASET_NAME.fullmatch(dataset):
+            raise EvaluationError(grpc.StatusCode.INVALID_ARGUMENT, f"Invalid dataset name {dataset!r}")
+        creating = self._creating.get(key)
+        if creating is None:
+            tenants = len(self.tenants) + len(self._creating)
+            if self.max_tenants is not None and tenants >= self.max_tenants:
+                raise EvaluationError(grpc.StatusCode.RESOURCE_EXHAUSTED,
+                                      f"Already serving {self.max_tenants} studies")
+            # Loading a dataset or training a model must not block the other tenants
+            creating = self._creating[key] = asyncio.get_running_loop().run_in_executor(
+                None, self.factory, benchmark_name, dataset)
+        try:
+            study = await asyncio.shield(creating)
+        except Exception as e:
+            self._creating.pop(key, None)
+            raise EvaluationError(grpc.StatusCode.UNAVAILABLE,
+                                  f"Could not create the {benchmark_name}/{dataset} study: {e}")
+        if key not in self.tenants:
+            self.tenants[key] = Tenant(benchmark_name, dataset, study)
+            self._creating.pop(key, None)
+        return self.tenants[key]
+
+    async def evaluate_request(self, request, context=None):
+        tenant = await self.tenant(*request_route(context))
+        tenant.requests += 1
+        tenant.in_flight += 1
+        try:
+            response = await tenant.servicer.evaluate_request(request)
+        except Exception:
+            tenant.failed += 1
+            raise
+        finally:
+            tenant.in_flight -= 1
+        tenant.completed += 1
+        return response
+
+    async def RunConfigurationsClientServer(self, request, context):
+        try:
+            return await self.evaluate_request(request, context)
+        except EvaluationError as e:
+            await context.abort(e.code, e.details)
+
+    def stats(self) -> list[dict]:
+        return [tenant.stats() for tenant in self.tenants.values()]
+
+    async def report(self, interval: float):
+        """Print the throughput of every tenant over each ``interval`` seconds."""
+        last = {}
+        while True:
+            await asyncio.sleep(interval)
+            for key, tenant in list(self.tenants.items()):
+                done = tenant.completed - last.get(key, 0)
+                last[key] = tenant.completed
+                print(f"{tenant.benchmark_name}/{tenant.dataset}: {done / interval:.1f} queries/s, "
+                      f"{tenant.completed} done, {tenant.failed} failed, {tenant.in_flight} in flight",
+                      flush=True)
+            if self.scheduler is not None:
+                workers = self.scheduler.stats()['workers'].values()
+                busy = sum(1 for worker in workers if worker['in_flight'])
+                print(f"workers: {busy}/{len(workers)} busy, "
+                      f"{sum(worker['queued'] for worker in workers)} queued", flush=True)
+
+
+async def start_server(study, port: int = 50050, pool=None) -> grpc.aio.Server:
+    servicer = StudyServicer(study) if pool is None else PooledStudyServicer(study, pool)
+    return await _start(servicer, port)
+
+
+async def _start(servicer, port: int) -> grpc.aio.Server:
+    server = grpc.aio.server()
+    cs_grpc.add_ConfigurationServiceServicer_to_server(servicer, server)
+    add_streaming_handler(server, servicer.evaluate_request)
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    return server
+
+
+async def serve(study, port: int = 50050, pool=None):
+    server = await start_server(study, port, pool)
+    print(f'Serving on [::]:{port}' if pool is None else
+          f'Serving on [::]:{port} from {len(pool.processes)} processes')
+    await server.wait_for_termination()
+
+
+async def serve_multi_tenant(servicer: MultiTenantServicer, port: int = 50050,
+                             report_interval: Optional[float] = 60.0):
+    server = await _start(servicer, port)
+    print(f'Serving all benchmarks on [::]:{port}')
+    reporter = asyncio.ensure_future(servicer.report(report_interval)) if report_interval else None
+    try:
+        await server.wait_for_termination()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
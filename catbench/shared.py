@@ -0,0 +1,118 @@
+"""Process-wide cache of the datasets and surrogate models that studies load.
+
+A process that creates many studies over the same benchmark (a sweep, several
+tuners, repeated trials) would otherwise hold one copy of the dataset and of
+every surrogate model per study. Entries are keyed by what they were loaded
+from and reference counted: a study holds its entries until it is garbage
+collected. Entries that no study holds stay cached for the next one, and the
+least recently used of them are evicted once the cache holds more than
+``CATBENCH_SHARED_CACHE_BYTES`` (default 2 GiB). Entries in use are never
+evicted.
+"""
+import collections
+import os
+import threading
+import weakref
+from typing import Callable, Hashable, Optional
+
+MAX_SHARED_BYTES = int(os.environ.get('CATBENCH_SHARED_CACHE_BYTES', 2 * 1024 ** 3))
+
+
+class _Entry:
+    __slots__ = ('value', 'sizeof', 'refs')
+
+    def __init__(self, value, sizeof: Callable[[object], int]):
+        self.value = value
+        self.sizeof = sizeof
+        self.refs = 0
+
+
+class SharedCache:
+    def __init__(self, max_bytes: int = MAX_SHARED_BYTES):
+        self.max_bytes = max_bytes
+        # Least recently used first
+        self._entries: collections.OrderedDict = collections.OrderedDict()
+        self._lock = threading.Lock()
+        # One lock per key, so that a value is loaded once however many threads ask for it
+        self._loading: dict = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def acquire(self, key: Hashable, load: Callable[[], object],
+                sizeof: Callable[[object], int] = lambda value: 0,
+                owner: Optional[object] = None, reload: bool = False):
+        """Return the value cached under ``key``, calling ``load`` if there is
+        none or ``reload`` is set, and take a reference to it. The reference
+        is released when ``owner`` is garbage collected, or by
+        :meth:`release` if no owner is given. ``sizeof`` estimates the bytes
+        the value holds."""
+        with self._lock:
+            key_lock = self._loading.setdefault(key, threading.Lock())
+        with key_lock:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and not reload:
+                    self.hits += 1
+                    entry.refs += 1
+                    self._entries.move_to_end(key)
+                    value = entry.value
+            if entry is None or reload:
+                value = load()
+                with self._lock:
+                    self.misses += 1
+                    entry = self._entries.get(key)
+                    if entry is None:
+                        entry = self._entries[key] = _Entry(value, sizeof)
+                    # Holders of a value that was reloaded keep their reference to the key
+                    entry.value, entry.sizeof = value, sizeof
+                    entry.refs += 1
+                    self._entries.move_to_end(key)
+                    self._evict()
+        if owner is not None:
+            weakref.finalize(owner, self.release, key)
+        return value
+
+    def release(self, key: Hashable):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return
+            entry.refs -= 1
+            if entry.refs <= 0:
+                self._evict()
+
+    def _evict(self):
+        total = sum(entry.sizeof(entry.value) for entry in self._entries.values())
+        for key, entry in list(self._entries.items()):
+            if total <= self.max_bytes:
+                break
+            if entry.refs <= 0:
+                total -= entry.sizeof(entry.value)
+                del self._entries[key]
+                self.evictions += 1
+
+    def clear(self):
+        """Drop every entry that no study holds."""
+        with self._lock:
+            for key in [key for key, entry in self._entries.items() if entry.refs <= 0]:
+                del self._entries[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'in_use': sum(1 for entry in self._entries.values() if entry.refs > 0),
+                'bytes': sum(entry.sizeof(entry.value) for entry in self._entries.values()),
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
+
+
+_cache = SharedCache()
+
+
+def shared_cache() -> SharedCache:
+    return _cache
@@ -0,0 +1,238 @@
+"""Enumerated feasible configuration space of a benchmark.
+
+Parameters are encoded as integer codes into their (discrete) domains.
+Constraints only couple a few parameters each, so the space is split into
+independent components of constraint-connected parameters; each component's
+feasible code tuples are enumerated once, stored as sorted mixed-radix keys in
+a memory-mapped ``.npy`` file, and the full feasible space is the cartesian
+product of the components. That gives uniform feasible sampling in O(1) per
+draw, exact feasible-space sizes and a rank/unrank bijection onto
+``range(space.size)``.
+"""
+import math
+import os
+import weakref
+from typing import Optional
+
+import numpy as np
+
+from interopt.parameter import ParamType
+
+from catbench.cache import cache_dir, fingerprint, save_array, load_array
+from catbench.constraints import compile_constraints, to_columns, from_columns
+from catbench.permutations import get_codec
+
+MAX_ENUMERATION = 2 ** 32
+CHUNK_SIZE = 2 ** 20
+
+
+class Domain:
+    def __init__(self, param):
+        self.param = param
+        self.name = param.name
+        self.param_type = param.param_type_enum
+        if self.param_type == ParamType.INTEGER_EXP:
+            low, high = param.bounds
+            values, value = [], 1
+            while value <= high:
+                if value >= low:
+                    values.append(value)
+                value *= param.base
+        elif self.param_type == ParamType.INTEGER:
+            low, high = param.bounds
+            values = range(int(low), int(high) + 1)
+        elif self.param_type == ParamType.CATEGORICAL:
+            values = param.categories
+        elif self.param_type == ParamType.PERMUTATION:
+            # Permutations are represented by their rank
+            values = np.arange(get_codec(param.length).size)
+        else:
+            raise ValueError(f"Parameter {self.name} of type {self.param_type.name} "
+                             "cannot be enumerated")
+        self.values = np.asarray(values)
+        self.size = len(self.values)
+        self._order = np.argsort(self.values, kind='stable')
+        self._sorted = self.values[self._order]
+
+    def encode(self, column, strict: bool = True) -> np.ndarray:
+        """Map values to codes; values outside the domain raise ValueError,
+        or are encoded as -1 when ``strict`` is False."""
+        column = np.asarray(column)
+        if self.param_type == ParamType.PERMUTATION:
+            codes = column.astype(np.int64)
+            valid = (codes >= 0) & (codes < self.size)
+        else:
+            pos = np.clip(np.searchsorted(self._sorted, column), 0, self.size - 1)
+            valid = self._sorted[pos] == column
+            codes = self._order[pos]
+        if not np.all(valid):
+            if strict:
+                raise ValueError(f"Value outside the domain of {self.name}")
+            codes = np.where(valid, codes, -1)
+        return codes
+
+    def decode(self, codes) -> np.ndarray:
+        return self.values[codes]
+
+
+class _Component:
+    def __init__(self, domains: list[Domain], keys: Optional[np.ndarray] = None):
+        self.domains = domains
+        self.dims = tuple(domain.size for domain in domains)
+        self.keys = keys
+        self.size = math.prod(self.dims) if keys is None else len(keys)
+
+    def codes(self, index: np.ndarray) -> tuple:
+        key = index if self.keys is None else self.keys[index]
+        return np.unravel_index(key, self.dims)
+
+    def index(self, codes: list) -> np.ndarray:
+        key = np.ravel_multi_index(codes, self.dims)
+        if self.keys is None:
+            return key
+        pos = np.searchsorted(self.keys, key)
+        found = pos < len(self.keys)
+        found[found] = self.keys[pos[found]] == key[found]
+        if not np.all(found):
+            raise ValueError("Configuration is not feasible")
+        return pos
+
+
+class FeasibleSpace:
+    def __init__(self, definition, cache: bool = True):
+        self.definition = definition
+        self.params = definition.search_space.params
+        self.domains = {param.name: Domain(param) for param in self.params}
+        constraints = compile_constraints(definition)
+        if constraints.callables:
+            raise ValueError("Callable constraints cannot be enumerated")
+
+        # Group parameters that are connected through a shared constraint
+        parent = {name: name for name in self.domains}
+
+        def find(name):
+            while parent[name] != name:
+                parent[name] = parent[parent[name]]
+                name = parent[name]
+            return name
+
+        for constraint in constraints.constraints:
+            roots = [find(name) for name in constraint.dependent_params]
+            for root in roots[1:]:
+                parent[root] = roots[0]
+
+        groups = {}
+        for name in self.domains:
+            groups.setdefault(find(name), []).append(name)
+
+        self.components = []
+        for names in groups.values():
+            component_constraints = [c for c in constraints.constraints
+                                     if c.dependent_params and find(c.dependent_params[0]) == find(names[0])]
+            domains = [self.domains[name] for name in names]
+            keys = None
+            if component_constraints:
+                keys = self._feasible_keys(domains, component_constraints, cache)
+            self.components.append(_Component(domains, keys))
+
+        self.size = math.prod(component.size for component in self.components)
+        self.total_size = math.prod(domain.size for domain in self.domains.values())
+        self._strides = []
+        stride = 1
+        for component in reversed(self.components):
+            self._strides.insert(0, stride)
+            stride *= component.size
+
+    def _feasible_keys(self, domains, constraints, cache) -> np.ndarray:
+        path = None
+        if cache:
+            key = fingerprint([(d.name, d.values.tolist()) for d in domains],
+                              [c.source for c in constraints])
+            path = os.path.join(cache_dir('feasible'), f'{self.definition.name}_{key}.npy')
+            if os.path.exists(path):
+                return load_array(path)
+
+        dims = tuple(domain.size for domain in domains)
+        total = math.prod(dims)
+        if total > MAX_ENUMERATION:
+            raise ValueError(f"Component {[d.name for d in domains]} has {total} "
+                             "combinations and is too large to enumerate")
+        feasible = []
+        for start in range(0, total, CHUNK_SIZE):
+            keys = np.arange(start, min(start + CHUNK_SIZE, total), dtype=np.int64)
+            codes = np.unravel_index(keys, dims)
+            columns = {d.name: d.decode(c) for d, c in zip(domains, codes)}
+            mask = np.ones(len(keys), dtype=bool)
+            for constraint in constraints:
+                mask &= constraint(columns)
+            feasible.append(keys[mask])
+        keys = np.concatenate(feasible)
+        if path is not None:
+            save_array(path, keys)
+            return load_array(path)
+        return keys
+
+    def __len__(self) -> int:
+        return self.size
+
+    @property
+    def density(self) -> float:
+        return self.size / self.total_size
+
+    def columns(self, indices) -> dict:
+        """Decode feasible-space indices into a column-oriented batch."""
+        indices = np.asarray(indices, dtype=np.int64)
+        if np.any((indices < 0) | (indices >= self.size)):
+            raise IndexError("Index outside the feasible space")
+        columns = {}
+        for component, stride in zip(self.components, self._strides):
+            local = (indices // stride) % component.size
+            for domain, codes in zip(component.domains, component.codes(local)):
+                columns[domain.name] = domain.decode(codes)
+        return {param.name: columns[param.name] for param in self.params}
+
+    def indices(self, columns: dict) -> np.ndarray:
+        """Rank a column-oriented batch of feasible configurations."""
+        columns = to_columns(columns, self.params)
+        indices = 0
+        for component, stride in zip(self.components, self._strides):
+            codes = [domain.encode(columns[domain.name]) for domain in component.domains]
+            indices = indices + component.index(codes) * stride
+        return np.asarray(indices, dtype=np.int64)
+
+    def rank(self, config: dict) -> int:
+        return int(self.indices(to_columns([config], self.params))[0])
+
+    def unrank(self, index: int) -> dict:
+        return from_columns(self.columns([index]), self.params)[0]
+
+    def __contains__(self, config: dict) -> bool:
+        try:
+            self.rank(config)
+        except ValueError:
+            return False
+        return True
+
+    def sample_columns(self, n: int, rng=None) -> dict:
+        rng = np.random.default_rng(rng)
+        columns = {}
+        for component in self.components:
+            local = rng.integers(0, component.size, size=n)
+            for domain, codes in zip(component.domains, component.codes(local)):
+                columns[domain.name] = domain.decode(codes)
+        return {param.name: columns[param.name] for param in self.params}
+
+    def sample(self, n: Optional[int] = None, rng=None):
+        """Draw configurations uniformly from the feasible space: a single
+        dict when ``n`` is None, otherwise a list of ``n`` dicts."""
+        configs = from_columns(self.sample_columns(1 if n is None else n, rng), self.params)
+        return configs[0] if n is None else configs
+
+
+_spaces = weakref.WeakKeyDictionary()
+
+
+def get_feasible_space(definition) -> FeasibleSpace:
+    if definition not in _spaces:
+        _spaces[definition] = FeasibleSpace(definition)
+    return _spaces[definition]
@@ -0,0 +1,197 @@
+"""Streaming evaluation RPC.
+
+Next to the unary ``RunConfigurationsClientServer``, catbench's manager and
+workers serve ``RunConfigurationsStream``: a bidirectional stream on which a
+client writes any number of ``ConfigurationRequest`` messages and reads back
+one ``ConfigurationResponse`` per request, in the order the evaluations
+finish. A client keeps one stream open per server and multiplexes all its
+evaluations over it, which saves the per-call setup of the unary RPC. The
+service definition is unchanged; the method is added with a generic handler,
+and each message is framed with a request index and a status code so that
+results can be matched to requests and failures reported one by one: a
+failed request raises :class:`EvaluationError` on the client, while a failed
+stream fails all its pending requests with the stream's status. Servers
+that do not know the method answer ``UNIMPLEMENTED``, and clients then fall
+back to unary calls.
+"""
+import asyncio
+import logging
+import struct
+from typing import Awaitable, Callable, Optional
+
+import grpc
+import grpc.aio
+
+import interopt.runner.grpc_runner.config_service_pb2 as cs
+
+SERVICE = 'ConfigurationService'
+METHOD = 'RunConfigurationsStream'
+
+# Request index and gRPC status code of each message
+_HEADER = struct.Struct('>IB')
+_STATUS_CODES = {code.value[0]: code for code in grpc.StatusCode}
+
+
+def _frame(index: int, code: int, payload: bytes) -> bytes:
+    return _HEADER.pack(index, code) + payload
+
+
+def _serialize_request(item: tuple) -> bytes:
+    index, request = item
+    return _frame(index, 0, request.SerializeToString())
+
+
+def _deserialize_request(data: bytes) -> tuple:
+    index, _ = _HEADER.unpack_from(data)
+    return index, cs.ConfigurationRequest.FromString(data[_HEADER.size:])
+
+
+def _serialize_result(item: tuple) -> bytes:
+    index, code, payload = item
+    if code == 0:
+        return _frame(index, 0, payload.SerializeToString())
+    return _frame(index, code, payload.encode('utf-8'))
+
+
+def _deserialize_result(data: bytes) -> tuple:
+    index, code = _HEADER.unpack_from(data)
+    payload = data[_HEADER.size:]
+    if code == 0:
+        return index, code, cs.ConfigurationResponse.FromString(payload)
+    return index, code, payload.decode('utf-8', errors='replace')
+
+
+class EvaluationError(Exception):
+    """Raised by an ``evaluate`` function to fail one request with ``code``,
+    and by :meth:`StreamingCall.evaluate` when the server failed the request.
+    Failures of the stream itself are raised as ``grpc.aio.AioRpcError``."""
+
+    def __init__(self, code: grpc.StatusCode, details: str):
+        super().__init__(details)
+        self.code = code
+        self.details = details
+
+
+def add_streaming_handler(server: grpc.aio.Server,
+                          evaluate: Callable[..., Awaitable[cs.ConfigurationResponse]]):
+    """Serve ``RunConfigurationsStream`` on ``server``, answering every
+    request with ``evaluate(request, context)``, where ``context`` is that of
+    the stream; requests of a stream run concurrently."""
+
+    async def run(index: int, request, context) -> tuple:
+        try:
+            return index, 0, await evaluate(request, context)
+        except EvaluationError as e:
+            return index, e.code.value[0], e.details
+        except Exception as e:
+            logging.exception("Evaluation of a streamed request failed")
+            return index, grpc.StatusCode.INTERNAL.value[0], f'{type(e).__name__}: {e}'
+
+    async def handler(request_iterator, context):
+        # Tells the client the call was accepted before any result is ready
+        await context.send_initial_metadata(())
+        results = asyncio.Queue()
+        tasks = set()
+
+        def done(task):
+            tasks.discard(task)
+            if not task.cancelled():
+                results.put_nowait(task.result())
+
+        async def read():
+            async for index, request in request_iterator:
+                task = asyncio.ensure_future(run(index, request, context))
+                tasks.add(task)
+                task.add_done_callback(done)
+
+        reader = asyncio.ensure_future(read())
+        try:
+            while not (reader.done() and not tasks and results.empty()):
+                getter = asyncio.ensure_future(results.get())
+                await asyncio.wait({getter, reader}, return_when=asyncio.FIRST_COMPLETED)
+                if getter.done():
+                    yield getter.result()
+                else:
+                    getter.cancel()
+            reader.result()
+        finally:
+            reader.cancel()
+            for task in list(tasks):
+                task.cancel()
+
+    server.add_generic_rpc_handlers((grpc.method_handlers_generic_handler(SERVICE, {
+        METHOD: grpc.stream_stream_rpc_method_handler(
+            handler, request_deserializer=_deserialize_request,
+            response_serializer=_serialize_result)}),))
+
+
+class StreamingCall:
+    """One open ``RunConfigurationsStream`` call that evaluations are
+    multiplexed over."""
+
+    def __init__(self, channel: grpc.aio.Channel, metadata: Optional[tuple] = None):
+        self.call = channel.stream_stream(
+            f'/{SERVICE}/{METHOD}', request_serializer=_serialize_request,
+            response_deserializer=_deserialize_result)(metadata=metadata or None)
+        self.pending = {}
+        self.next_index = 0
+        self.closed = False
+        self.error = None
+        self._accepted = False
+        self._write_lock = asyncio.Lock()
+        self._reader = asyncio.ensure_future(self._read())
+
+    async def _read(self):
+        try:
+            async for index, code, payload in self.call:
+                future = self.pending.pop(index, None)
+                if future is None or future.done():
+                    continue
+                if code == 0:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(EvaluationError(
+                        _STATUS_CODES.get(code, grpc.StatusCode.UNKNOWN), payload))
+            error = grpc.aio.AioRpcError(grpc.StatusCode.UNAVAILABLE, grpc.aio.Metadata(),
+                                         grpc.aio.Metadata(), details='Stream closed by the server')
+        except grpc.aio.AioRpcError as e:
+            error = e
+        except asyncio.CancelledError:
+            error = grpc.aio.AioRpcError(grpc.StatusCode.CANCELLED, grpc.aio.Metadata(),
+                                         grpc.aio.Metadata(), details='Stream closed')
+        self.closed = True
+        self.error = error
+        for future in self.pending.values():
+            if not future.done():
+                future.set_exception(error)
+        self.pending.clear()
+
+    async def evaluate(self, request: cs.ConfigurationRequest) -> cs.ConfigurationResponse:
+        if self.closed:
+            raise self.error
+        index = self.next_index
+        self.next_index += 1
+        future = asyncio.get_running_loop().create_future()
+        self.pending[index] = future
+        try:
+            async with self._write_lock:
+                if not self._accepted:
+                    # Writing to a call the server rejects can end it with INTERNAL instead
+                    # of its status, so nothing is written before the server accepts it
+                    await self.call.initial_metadata()
+                    self._accepted = not self.call.done()
+                if self._accepted:
+                    await self.call.write((index, request))
+        except (grpc.aio.AioRpcError, grpc.aio.UsageError, asyncio.InvalidStateError):
+            # The call already failed; the reader reports why
+            pass
+        if self.closed and not future.done():
+            future.set_exception(self.error)
+        try:
+            return await future
+        finally:
+            self.pending.pop(index, None)
+
+    def close(self):
+        self.call.cancel()
+        self._reader.cancel()
@@ -0,0 +1,345 @@
+import asyncio
+import time
+from typing import Optional, Union
+
+import numpy as np
+
+from interopt.study import Study as InteroptStudy
+
+from catbench.adaptive import AdaptiveRepeats
+from catbench.client import ConnectionPool, HardwareQuery, route_metadata, server_url
+from catbench.models import load_models
+from catbench.pareto import ParetoArchive
+from catbench.querylog import QueryLog, SURROGATE, TABULAR, HARDWARE
+from catbench.results import ResultStore
+from catbench.scheduler import Scheduler
+from catbench.constraints import compile_constraints, to_columns, from_columns, batch_size
+from catbench.space import get_feasible_space
+from catbench.surrogate import predict
+from catbench.tabular import TabularDataset
+from catbench import telemetry
+
+
+class SoftwareQuery:
+    def __init__(self, benchmark_name, dataset, parameters, fidelity_params, enabled_objectives,
+                 enable_tabular, enable_model, enable_download, retrain_model=False,
+                 multi_output_model=False):
+        key_params = parameters + fidelity_params
+        names = [param.name for param in key_params]
+        # Studies of this process over the same data share its table and the models
+        self.tabular_dataset = TabularDataset(benchmark_name, dataset, key_params, enabled_objectives,
+                                              enable_download)
+        self.objectives = enabled_objectives
+        self.models = None
+        if enable_model:
+            self.models = load_models(
+                lambda: self.tabular_dataset.query_tab, benchmark_name,
+                self.tabular_dataset.content_hash, enabled_objectives, names,
+                retrain=retrain_model, multi_output=multi_output_model, owner=self)
+        self.enable_tabular = enable_tabular
+        self.enable_model = enable_model
+        self.multi_output_model = multi_output_model
+
+    def get_objectives(self):
+        return self.objectives
+
+    def query_columns(self, columns: dict, results: dict,
+                      sources: Optional[np.ndarray] = None) -> np.ndarray:
+        """Fill ``results`` from the dataset and the surrogate models and
+        return the mask of rows that are still unanswered. ``sources``, if
+        given, is set to where each answered row came from."""
+        pending = np.ones(batch_size(columns), dtype=bool)
+        if self.enable_tabular:
+            found = self.tabular_dataset.lookup(columns, results)
+            pending &= ~found
+            if sources is not None:
+                sources[found] = TABULAR
+        if self.enable_model and pending.any():
+            rows = np.flatnonzero(pending)
+            subset = {name: column[rows] for name, column in columns.items()}
+            with telemetry.span('surrogate_predict'):
+                predictions = predict(self.models, subset, self.get_objectives())
+            for objective, values in predictions.items():
+                results[objective][rows] = values
+            pending[rows] = False
+            if sources is not None:
+                sources[rows] = SURROGATE
+        return pending
+
+
+class Study(InteroptStudy):
+    def __init__(self, benchmark_name: str, definition, enable_tabular: bool, dataset,
+                 enabled_objectives: list[str], server_addresses: Optional[list[str]] = None,
+                 port=50051, enable_model: bool = True, enable_download: bool = True,
+                 retrain_model: bool = False, multi_output_model: bool = False,
+                 server_concurrency: int = 1,
+                 hedge: bool = False, enable_result_store: Optional[bool] = None,
+                 result_ttl: Optional[float] = None,
+                 adaptive_repeats: Union[bool, AdaptiveRepeats] = False,
+                 streaming_rpc: bool = True, track_pareto: Optional[bool] = None,
+                 query_log: Optional[str] = None, scheduler: Optional[Scheduler] = None,
+                 connections: Optional[ConnectionPool] = None):
+        # Mirrors interopt's Study, but with catbench's columnar tabular data
+        if enable_result_store is None:
+            enable_result_store = server_addresses is not None
+        if server_addresses is None:
+            server_addresses = ["localhost"]
+        self.benchmark_name = benchmark_name
+        self.grpc_urls = [server_url(server_address, port) for server_address in server_addresses]
+        self.enabled_objectives = enabled_objectives
+        self.enable_tabular = enable_tabular
+        self.enable_model = enable_model
+        self.dataset = dataset
+        self.definition = definition
+        self.parameters = definition.search_space.params
+        self.fidelity_params = definition.search_space.fidelity_params or []
+        self.port = port
+
+        # Benchmarks without a published dataset are only measured
+        if (self.enable_tabular or self.enable_model) and dataset is not None:
+            self.software_query = SoftwareQuery(
+                benchmark_name, dataset, self.parameters, self.fidelity_params,
+                enabled_objectives=self.enabled_objectives,
+                enable_tabular=self.enable_tabular, enable_model=self.enable_model,
+                enable_download=enable_download, retrain_model=retrain_model,
+                multi_output_model=multi_output_model)
+        else:
+            self.software_query = None
+        # Studies served by one multi-tenant manager share its scheduler and connections
+        if scheduler is None:
+            scheduler = Scheduler(self.grpc_urls, max_concurrency=server_concurrency, hedge=hedge)
+        result_store = ResultStore(benchmark_name, dataset, ttl=result_ttl, parameters=self.parameters) \
+            if enable_result_store else None
+        if adaptive_repeats is True:
+            adaptive_repeats = AdaptiveRepeats()
+        self.grpc_query = HardwareQuery(self.grpc_urls, self.enabled_objectives, self.definition,
+                                        scheduler=scheduler, result_store=result_store,
+                                        adaptive=adaptive_repeats or None,
+                                        streaming=streaming_rpc, connections=connections,
+                                        metadata=route_metadata(benchmark_name, dataset))
+        # Non-dominated evaluations so far; tracked by default for multi-objective studies
+        if track_pareto is None:
+            track_pareto = len(self.enabled_objectives) > 1
+        self.pareto = ParetoArchive(self.enabled_objectives) if track_pareto else None
+        self.query_log = QueryLog(query_log, self.parameters, self.fidelity_params,
+                                  self.enabled_objectives, benchmark_name, dataset) \
+            if query_log is not None else None
+
+    @property
+    def mode(self) -> str:
+        """How queries are answered, as used to label telemetry."""
+        if self.software_query is None:
+            return 'hardware'
+        return '+'.join(name for name, enabled in [('tabular', self.enable_tabular),
+                                                   ('surrogate', self.enable_model)] if enabled)
+
+    @property
+    def constraints(self):
+        return compile_constraints(self.definition)
+
+    @property
+    def space(self):
+        return get_feasible_space(self.definition)
+
+    def is_feasible(self, config: dict) -> bool:
+        with telemetry.labels(self.benchmark_name, self.mode), telemetry.span('constraints'):
+            return self.constraints.is_feasible(config)
+
+    def feasible_mask(self, configs):
+        with telemetry.labels(self.benchmark_name, self.mode), telemetry.span('constraints'):
+            return self.constraints(configs)
+
+    def sample(self, n=None, rng=None):
+        return self.space.sample(n, rng)
+
+    def query_software(self, query: dict, fidelities: Optional[dict] = None) -> Optional[dict]:
+        """Answer ``query`` from the dataset or surrogate models only; None
+        when neither can."""
+        return self._query_software_one(query, fidelities or {})
+
+    def query(self, query: dict, fidelities: Optional[dict] = None) -> dict:
+        # Answer from the dataset or surrogate without starting an event loop
+        with telemetry.labels(self.benchmark_name, self.mode):
+            start = time.perf_counter()
+            result = self._query_software_one(query, fidelities or {}, record=True)
+            if result is not None:
+                telemetry.record('query', time.perf_counter() - start)
+        if result is None:
+            result = self._run(self.query_async(query, fidelities or {}))
+        return {objective: result[objective] for objective in self.enabled_objectives}
+
+    def _run(self, coroutine):
+        # The event loop ends with the call, so the channels it opened must too
+        async def run():
+            try:
+                return await coroutine
+            finally:
+                await self.grpc_query.close()
+
+        return asyncio.run(run())
+
+    async def aquery(self, query: dict, fidelities: Optional[dict] = None) -> dict:
+        result = await self.query_async(query, fidelities or {})
+        return {objective: result[objective] for objective in self.enabled_objectives}
+
+    async def query_choice(self, query: dict, fidelities: dict) -> dict:
+        # Also the entry point of queries arriving at the gRPC server
+        with telemetry.labels(self.benchmark_name, self.mode), telemetry.span('query'):
+            return await self._query_choice(query, fidelities)
+
+    async def _query_choice(self, query: dict, fidelities: dict) -> dict:
+        result = self._query_software_one(query, fidelities, record=True)
+        if result is not None:
+            return result
+
+        fidelities = {param.name: fidelities.get(param.name, param.default)
+                      for param in self.fidelity_params}
+        result = await self.grpc_query.query_hardware(query.copy(), fidelities)
+        if len(result.index) == 0:
+            return {"compute_time": 0.0}
+        if self.software_query is not None:
+            self.software_query.tabular_dataset.add(result)
+        result = result.iloc[0].to_dict()
+        self._record(query, fidelities, result)
+        return result
+
+    def query_batch(self, configs: Union[list[dict], dict],
+                    fidelities: Optional[Union[list[dict], dict]] = None) -> dict:
+        """Query many configurations at once.
+
+        ``configs`` is a list of configuration dicts or a dict of per-parameter
+        columns; ``fidelities`` is a single dict applied to every
+        configuration, a list of dicts or a dict of columns. Missing
+        fidelities take their default value. Returns a dict mapping each
+        enabled objective to an array with one value per configuration (NaN
+        where no result could be obtained).
+        """
+        with telemetry.labels(self.benchmark_name, self.mode), telemetry.span('query_batch'):
+            with telemetry.span('encode'):
+                columns = to_columns(configs, self.parameters)
+                n = batch_size(columns)
+                fidelity_columns = self._fidelity_columns(fidelities, n)
+            results, pending, sources = self._query_software(columns, fidelity_columns)
+            if pending.any():
+                async def run():
+                    return await asyncio.gather(*(
+                        self._query_hardware_one(config, fidelity)
+                        for _, config, fidelity in self._pending_queries(columns, fidelity_columns, pending)))
+
+                for row, result in zip(np.flatnonzero(pending), self._run(run())):
+                    for objective in self.enabled_objectives:
+                        results[objective][row] = result[objective]
+            self._record_batch(columns, fidelity_columns, results, sources)
+        return results
+
+    async def aquery_batch(self, configs: Union[list[dict], dict],
+                           fidelities: Optional[Union[list[dict], dict]] = None):
+        """Asynchronous counterpart of :meth:`query_batch` that yields
+        ``(index, result)`` pairs as results become available: software
+        answers first, then hardware evaluations in completion order, with up
+        to ``server_concurrency`` evaluations in flight per server."""
+        async def run(row, config, fidelity):
+            return row, await self._query_hardware_one(config, fidelity)
+
+        # Labels are set around the work only, not across the yields, and are
+        # inherited by the hardware tasks created here
+        with telemetry.labels(self.benchmark_name, self.mode):
+            with telemetry.span('encode'):
+                columns = to_columns(configs, self.parameters)
+                fidelity_columns = self._fidelity_columns(fidelities, batch_size(columns))
+            results, pending, sources = self._query_software(columns, fidelity_columns)
+            self._record_batch(columns, fidelity_columns, results, sources, np.flatnonzero(~pending))
+            queries = self._pending_queries(columns, fidelity_columns, pending)
+            tasks = asyncio.as_completed([run(row, config, fidelity) for row, config, fidelity in queries])
+        for row in np.flatnonzero(~pending):
+            yield int(row), {objective: float(values[row]) for objective, values in results.items()}
+        for task in tasks:
+            row, result = await task
+            for objective in self.enabled_objectives:
+                results[objective][row] = result[objective]
+            self._record_batch(columns, fidelity_columns, results, sources, np.array([row]))
+            yield row, result
+
+    def _record(self, query: dict, fidelities: dict, result: dict):
+        """Record one hardware result."""
+        if self.pareto is not None:
+            self.pareto.add(result, {**query, **fidelities})
+        if self.query_log is not None:
+            self.query_log.append(to_columns([query], self.parameters),
+                                  self._fidelity_columns(fidelities, 1),
+                                  {o: np.array([result.get(o, np.nan)]) for o in self.enabled_objectives},
+                                  HARDWARE)
+
+    def _record_batch(self, columns: dict, fidelity_columns: dict, results: dict,
+                      sources: np.ndarray, rows: Optional[np.ndarray] = None):
+        """Record the rows ``rows`` (all if None) of a batch."""
+        if self.query_log is not None:
+            self.query_log.append(columns, fidelity_columns, results, sources, rows)
+        if self.pareto is None:
+            return
+
+        def configs(selected):
+            if rows is not None:
+                selected = rows[selected]
+            configs = from_columns({name: column[selected] for name, column in columns.items()},
+                                   self.parameters)
+            fidelities = from_columns({name: column[selected] for name, column in fidelity_columns.items()},
+                                      self.fidelity_params) or [{} for _ in selected]
+            return [{**config, **fidelity} for config, fidelity in zip(configs, fidelities)]
+
+        points = np.column_stack([results[o] for o in self.enabled_objectives])
+        if rows is not None:
+            points = points[rows]
+        if len(points) == 1:
+            # The archive inserts a single point without sorting a batch
+            self.pareto.add(points[0], configs(np.arange(1))[0])
+        else:
+            self.pareto.add_batch(points, configs)
+
+    def _fidelity_columns(self, fidelities, n: int) -> dict:
+        if fidelities is None:
+            fidelities = {}
+        elif isinstance(fidelities, list):
+            fidelities = {name: [f[name] for f in fidelities] for name in fidelities[0]} if fidelities else {}
+        return {param.name: np.broadcast_to(np.asarray(fidelities.get(param.name, param.default)), (n,))
+                for param in self.fidelity_params}
+
+    def _query_software_one(self, query: dict, fidelities: dict, record: bool = False) -> Optional[dict]:
+        if self.software_query is None:
+            return None
+        with telemetry.span('encode'):
+            columns = to_columns([query], self.parameters)
+            fidelity_columns = self._fidelity_columns(fidelities, 1)
+        results, pending, sources = self._query_software(columns, fidelity_columns)
+        if pending[0]:
+            return None
+        if record:
+            self._record_batch(columns, fidelity_columns, results, sources)
+        return {objective: float(values[0]) for objective, values in results.items()}
+
+    def _query_software(self, columns: dict, fidelity_columns: dict) -> tuple:
+        n = batch_size(columns)
+        results = {objective: np.full(n, np.nan) for objective in self.enabled_objectives}
+        sources = np.full(n, HARDWARE, dtype=np.uint8)
+        if self.software_query is None:
+            return results, np.ones(n, dtype=bool), sources
+        pending = self.software_query.query_columns({**columns, **fidelity_columns}, results, sources)
+        return results, pending, sources
+
+    def _pending_queries(self, columns: dict, fidelity_columns: dict, pending: np.ndarray):
+        rows = np.flatnonzero(pending)
+        configs = from_columns({name: column[rows] for name, column in columns.items()},
+                               self.parameters)
+        fidelities = from_columns({name: column[rows] for name, column in fidelity_columns.items()},
+                                  self.fidelity_params) or [{} for _ in rows]
+        return [(int(row), config, fidelity) for row, config, fidelity in zip(rows, configs, fidelities)]
+
+    async def _query_hardware_one(self, config: dict, fidelities: dict) -> dict:
+        result = await self.grpc_query.send_query(config, fidelities)
+        if len(result) == 0:
+            return {objective: np.nan for objective in self.enabled_objectives}
+        if self.software_query is not None:
+            # Only the dataset needs the result as a DataFrame row
+            self.software_query.tabular_dataset.add(
+                self.grpc_query.process_grpc_results(result, config, fidelities))
+        return {objective: result[objective][0] for objective in self.enabled_objectives}
@@ -0,0 +1,45 @@
+"""Batched surrogate inference."""
+import numpy as np
+import pandas as pd
+
+from catbench.models import MultiOutputModel
+from catbench.permutations import get_codec
+
+PERMUTATION_FEATURE = 'tuple_permutation_'
+
+
+def feature_frame(columns: dict, feature_names: list[str]) -> pd.DataFrame:
+    """Build the model input for a column-oriented batch in the feature order
+    the model was trained with; permutations are split into one feature per
+    position as in ``interopt.runner.model.train_model``."""
+    features = {}
+    permutations = None
+    for name in feature_names:
+        if name.startswith(PERMUTATION_FEATURE):
+            if permutations is None:
+                length = sum(n.startswith(PERMUTATION_FEATURE) for n in feature_names)
+                permutations = get_codec(length).unrank(columns['permutation'])
+            features[name] = permutations[:, int(name[len(PERMUTATION_FEATURE):])]
+        else:
+            features[name] = columns[name]
+    return pd.DataFrame(features, columns=feature_names)
+
+
+def predict(models: dict, columns: dict, objectives: list[str]) -> dict:
+    """Run one prediction per model over the whole batch; objectives that
+    share a multi-output model are predicted together. The models are trained
+    on log values."""
+    results = {}
+    frame = None
+    outputs = {}
+    for objective in objectives:
+        model = models[objective]
+        if frame is None or list(frame.columns) != model.feature_names_:
+            frame = feature_frame(columns, model.feature_names_)
+        if not isinstance(model, MultiOutputModel):
+            results[objective] = np.exp(model.predict(frame))
+            continue
+        if id(model) not in outputs:
+            outputs[id(model)] = model.predict(frame)
+        results[objective] = np.exp(outputs[id(model)][:, model.objectives.index(objective)])
+    return results
@@ -0,0 +1,454 @@
+"""Compact, hash-indexed columnar form of the tabular datasets.
+
+On first load a dataset CSV is converted into one ``.npy`` file per column
+under ``cache/tabular/``. Parameters with an enumerable domain are stored as
+small integer codes (the exponent index for ``IntExponential`` parameters and
+the lexicographic rank for permutations), other key columns are downcast to
+the smallest integer type that holds them, and the measured values are kept
+as float64. An open-addressing hash table over the key columns maps a
+configuration plus fidelities to its row, so lookups are a constant number of
+array probes. Later starts memory-map the columns and skip CSV parsing.
+"""
+import concurrent.futures
+import hashlib
+import io
+import json
+import os
+import shutil
+from typing import Optional
+
+import numpy as np
+import pandas as pd
+
+from interopt.parameter import ParamType
+
+from catbench.cache import cache_dir, fingerprint, save_array, load_array
+from catbench.constraints import to_columns
+from catbench.download import fetch, file_lock
+from catbench.permutations import get_codec
+from catbench.shared import shared_cache
+from catbench.space import Domain
+from catbench import telemetry
+
+FORMAT_VERSION = 1
+DATASET_URL = os.environ.get(
+    'CATBENCH_DATASET_URL', 'https://raw.githubusercontent.com/anonymoussisef/catbench_data/main/{filename}')
+
+_EMPTY = -1
+
+
+def _mix(h: np.ndarray) -> np.ndarray:
+    # splitmix64 finalizer
+    h = (h ^ (h >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    h = (h ^ (h >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return h ^ (h >> np.uint64(31))
+
+
+def hash_rows(columns: list[np.ndarray]) -> np.ndarray:
+    h = np.full(len(columns[0]), 0x9E3779B97F4A7C15, dtype=np.uint64)
+    for column in columns:
+        # Hash the float64 bit pattern so that 15 and 15.0 share a key; + 0.0 folds -0.0
+        bits = (np.asarray(column, dtype=np.float64) + 0.0).view(np.uint64)
+        h = _mix(h ^ bits)
+    return h
+
+
+def _smallest_int_dtype(low: int, high: int):
+    for dtype in (np.int8, np.int16, np.int32, np.int64):
+        info = np.iinfo(dtype)
+        if info.min <= low and high <= info.max:
+            return dtype
+    return np.int64
+
+
+class _KeyColumn:
+    def __init__(self, param, kind: str, dtype):
+        self.param = param
+        self.name = param.name
+        self.kind = kind
+        self.dtype = np.dtype(dtype)
+        self.domain = Domain(param) if kind == 'code' else None
+
+    @staticmethod
+    def from_values(param, values) -> tuple:
+        """Choose the encoding of a key column from its values and return the
+        column descriptor together with the encoded values."""
+        try:
+            domain = Domain(param)
+        except ValueError:
+            domain = None
+        if domain is not None:
+            codes = domain.encode(values, strict=False)
+            if param.param_type_enum == ParamType.PERMUTATION or np.all(codes >= 0):
+                dtype = _smallest_int_dtype(-1, domain.size)
+                return _KeyColumn(param, 'code', dtype), codes.astype(dtype)
+        values = np.asarray(values)
+        if np.issubdtype(values.dtype, np.number) and np.all(np.mod(values, 1) == 0):
+            dtype = _smallest_int_dtype(int(values.min(initial=0)), int(values.max(initial=0)))
+            return _KeyColumn(param, 'raw', dtype), values.astype(dtype)
+        return _KeyColumn(param, 'raw', np.float64), values.astype(np.float64)
+
+    def encode(self, values) -> np.ndarray:
+        if self.kind == 'code':
+            return self.domain.encode(values, strict=False)
+        return np.asarray(values, dtype=np.float64)
+
+    def decode(self, stored: np.ndarray):
+        if self.kind != 'code':
+            return stored
+        if self.param.param_type_enum == ParamType.PERMUTATION:
+            return get_codec(self.param.length).render(stored)
+        return self.domain.decode(stored)
+
+    def to_meta(self) -> dict:
+        return {'name': self.name, 'kind': self.kind, 'dtype': self.dtype.str}
+
+
+class ColumnarTable:
+    def __init__(self, path: str, key_params: list):
+        self.path = path
+        with open(os.path.join(path, 'meta.json'), encoding='utf-8') as f:
+            self.meta = json.load(f)
+        params = {param.name: param for param in key_params}
+        self.key_columns = [_KeyColumn(params[c['name']], c['kind'], c['dtype'])
+                            for c in self.meta['key_columns']]
+        self.value_names = self.meta['value_columns']
+        self.keys = [load_array(os.path.join(path, f'key_{c.name}.npy')) for c in self.key_columns]
+        self.values = {name: load_array(os.path.join(path, f'value_{name}.npy'))
+                       for name in self.value_names}
+        self.index = load_array(os.path.join(path, 'index.npy'))
+        self.rows = self.meta['rows']
+        self.content_hash = self.meta['content_hash']
+
+    @staticmethod
+    def cache_path(csv_path: str, name: str, key_params: list) -> str:
+        """Where the columnar cache of ``csv_path`` in its current version
+        is stored; a new version of the CSV gets a new path."""
+        stat = os.stat(csv_path)
+        key = fingerprint(FORMAT_VERSION, os.path.abspath(csv_path), stat.st_size, stat.st_mtime_ns,
+                          [(p.name, p.param_type_enum.name, getattr(p, 'bounds', None),
+                            getattr(p, 'base', None), getattr(p, 'categories', None),
+                            getattr(p, 'length', None)) for p in key_params])
+        return os.path.join(cache_dir('tabular'), f'{name}_{key}')
+
+    @staticmethod
+    def open(csv_path: str, name: str, key_params: list, tab: Optional[pd.DataFrame] = None,
+             content_hash: Optional[str] = None) -> 'ColumnarTable':
+        """Open the columnar cache of ``csv_path``, building it on first use
+        or when the CSV has changed. ``tab`` and ``content_hash``, when the
+        caller already has them, spare reading the CSV again."""
+        path = ColumnarTable.cache_path(csv_path, name, key_params)
+        root = os.path.dirname(path)
+        if not os.path.exists(os.path.join(path, 'meta.json')):
+            ColumnarTable.build(csv_path, path, key_params, tab, content_hash)
+            for entry in os.listdir(root):
+                # Remove caches of older versions of the CSV, but not builds in progress
+                if entry.rsplit('_', 1)[0] == name and entry != os.path.basename(path) \
+                        and not entry.endswith('.tmp'):
+                    shutil.rmtree(os.path.join(root, entry), ignore_errors=True)
+        return ColumnarTable(path, key_params)
+
+    @staticmethod
+    def build(csv_path: str, path: str, key_params: list, tab: Optional[pd.DataFrame] = None,
+              content_hash: Optional[str] = None):
+        if content_hash is None:
+            with open(csv_path, 'rb') as f:
+                content_hash = hashlib.sha256(f.read()).hexdigest()
+        tab = (pd.read_csv(csv_path) if tab is None else tab).dropna()
+        key_names = [param.name for param in key_params]
+        tmp_path = f'{path}.{os.getpid()}.tmp'
+        os.makedirs(tmp_path, exist_ok=True)
+
+        key_columns, keys = [], []
+        for param in key_params:
+            values = tab[param.name]
+            if param.param_type_enum == ParamType.PERMUTATION:
+                values = get_codec(param.length).rank(values.to_numpy())
+            else:
+                values = values.to_numpy()
+            column, stored = _KeyColumn.from_values(param, values)
+            key_columns.append(column)
+            keys.append(stored)
+            save_array(os.path.join(tmp_path, f'key_{param.name}.npy'), stored)
+
+        value_names = [name for name in tab.columns if name not in key_names
+                       and pd.api.types.is_numeric_dtype(tab[name])]
+        for name in value_names:
+            save_array(os.path.join(tmp_path, f'value_{name}.npy'),
+                       tab[name].to_numpy(dtype=np.float64))
+
+        save_array(os.path.join(tmp_path, 'index.npy'), build_index(keys))
+        meta = {
+            'version': FORMAT_VERSION,
+            'rows': len(tab),
+            'content_hash': content_hash,
+            'key_columns': [column.to_meta() for column in key_columns],
+            'value_columns': value_names,
+        }
+        with open(os.path.join(tmp_path, 'meta.json'), 'w', encoding='utf-8') as f:
+            json.dump(meta, f)
+        try:
+            os.rename(tmp_path, path)
+        except OSError:
+            # Another process finished building the same cache first
+            shutil.rmtree(tmp_path, ignore_errors=True)
+
+    @property
+    def nbytes(self) -> int:
+        return sum(array.nbytes for array in self.keys + list(self.values.values())) + self.index.nbytes
+
+    def encode(self, columns: dict) -> list[np.ndarray]:
+        return [column.encode(columns[column.name]) for column in self.key_columns]
+
+    def lookup(self, encoded: list[np.ndarray]) -> np.ndarray:
+        """Return the row of each encoded key, or -1 where it is absent."""
+        return probe(self.index, self.keys, encoded)
+
+    def to_frame(self) -> pd.DataFrame:
+        data = {column.name: column.decode(np.asarray(stored))
+                for column, stored in zip(self.key_columns, self.keys)}
+        data.update({name: np.asarray(values) for name, values in self.values.items()})
+        return pd.DataFrame(data)
+
+
+def build_index(keys: list[np.ndarray]) -> np.ndarray:
+    """Build a linear-probing hash table mapping slots to row numbers. Rows
+    with a duplicate key are left out so that lookups return the first."""
+    n = len(keys[0])
+    capacity = 1 << max(4, int(2 * n).bit_length())
+    mask = np.uint64(capacity - 1)
+    table = np.full(capacity, _EMPTY, dtype=np.int64)
+    hashes = hash_rows(keys)
+    pending = np.arange(n, dtype=np.int64)
+    probes = np.zeros(n, dtype=np.uint64)
+    while len(pending):
+        slots = ((hashes[pending] + probes[pending]) & mask).astype(np.int64)
+        occupant = table[slots]
+        empty = occupant == _EMPTY
+        duplicate = ~empty & _rows_equal(keys, occupant, keys, pending)
+        # Claim empty slots; when several rows race for one slot the earliest wins
+        candidates, first = np.unique(slots[empty], return_index=True)
+        table[candidates] = pending[empty][first]
+        placed = np.zeros(len(pending), dtype=bool)
+        placed[np.flatnonzero(empty)[first]] = True
+        collided = ~empty & ~duplicate
+        probes[pending[collided]] += np.uint64(1)
+        pending = pending[~placed & ~duplicate]
+    return table
+
+
+def probe(table: np.ndarray, keys: list[np.ndarray], query: list[np.ndarray]) -> np.ndarray:
+    m = len(query[0]) if query else 0
+    rows = np.full(m, _EMPTY, dtype=np.int64)
+    if m == 0 or len(keys[0]) == 0:
+        return rows
+    mask = np.uint64(len(table) - 1)
+    hashes = hash_rows(query)
+    active = np.arange(m, dtype=np.int64)
+    step = np.uint64(0)
+    while len(active):
+        slots = ((hashes[active] + step) & mask).astype(np.int64)
+        occupant = table[slots]
+        empty = occupant == _EMPTY
+        match = ~empty & _rows_equal(keys, occupant, query, active)
+        rows[active[match]] = occupant[match]
+        active = active[~empty & ~match]
+        step += np.uint64(1)
+    return rows
+
+
+def _rows_equal(keys, rows, other, other_rows) -> np.ndarray:
+    equal = np.ones(len(rows), dtype=bool)
+    valid = rows != _EMPTY
+    for key, column in zip(keys, other):
+        equal[valid] &= key[rows[valid]] == column[other_rows[valid]]
+    return equal & valid
+
+
+class TabularDataset:
+    def __init__(self, benchmark_name: str, dataset: str, key_params: list,
+                 objectives: list[str], enable_download: bool):
+        self.objectives = objectives
+        self.key_params = key_params
+        self.parameter_names = [param.name for param in key_params]
+        self.tab_path = f'datasets/{benchmark_name}_{dataset}.csv'
+        self.table: Optional[ColumnarTable] = None
+        if not os.path.exists(self.tab_path) and enable_download:
+            ensure_dataset_downloaded(benchmark_name, dataset, key_params)
+        if os.path.exists(self.tab_path):
+            # The table of a version of the CSV never changes, so every dataset
+            # of this process over that version shares it
+            name = f'{benchmark_name}_{dataset}'
+            self.table = shared_cache().acquire(
+                ('table', ColumnarTable.cache_path(self.tab_path, name, key_params)),
+                lambda: ColumnarTable.open(self.tab_path, name, key_params),
+                sizeof=lambda table: table.nbytes, owner=self)
+        # Results added by this study while running, keyed by their encoded key tuple
+        self.added = {}
+        self._fallback_domains = {param.name: Domain(param) for param in key_params
+                                  if param.param_type_enum == ParamType.PERMUTATION}
+        self._query_tab = None
+
+    @property
+    def content_hash(self) -> Optional[str]:
+        return self.table.content_hash if self.table is not None else None
+
+    @property
+    def query_tab(self) -> pd.DataFrame:
+        """The dataset as a DataFrame indexed by parameters and fidelities,
+        as used to train the surrogate models."""
+        if self._query_tab is None:
+            if self.table is None:
+                tab = pd.DataFrame(columns=self.parameter_names + self.objectives)
+            else:
+                tab = self.table.to_frame()
+            self._query_tab = tab.set_index(self.parameter_names).sort_index()
+        return self._query_tab
+
+    @property
+    def nbytes(self) -> int:
+        """Approximate memory held, counting the memory-mapped columns."""
+        size = 0
+        if self.table is not None:
+            size += self.table.nbytes
+        if self._query_tab is not None:
+            size += int(self._query_tab.memory_usage(index=True).sum())
+        return size
+
+    def lookup(self, columns: dict, results: dict) -> np.ndarray:
+        """Fill ``results`` for every key in ``columns`` present in the dataset
+        and return the mask of rows that were found. The objectives filled
+        are the keys of ``results``."""
+        n = len(next(iter(columns.values())))
+        found = np.zeros(n, dtype=bool)
+        encoded = None
+        if self.table is not None:
+            with telemetry.span('encode'):
+                encoded = self.table.encode(columns)
+            with telemetry.span('tabular_lookup'):
+                rows = self.table.lookup(encoded)
+            found = rows >= 0
+            for objective in results:
+                if objective in self.table.values:
+                    results[objective][found] = self.table.values[objective][rows[found]]
+        if self.added and not found.all():
+            if encoded is None:
+                encoded = self.encode(columns)
+            for row in np.flatnonzero(~found):
+                values = self.added.get(tuple(float(column[row]) for column in encoded))
+                if values is not None and all(objective in values for objective in results):
+                    for objective in results:
+                        results[objective][row] = values.get(objective, np.nan)
+                    found[row] = True
+        return found
+
+    def encode(self, columns: dict) -> list[np.ndarray]:
+        if self.table is not None:
+            return self.table.encode(columns)
+        return [self._fallback_domains[param.name].encode(columns[param.name], strict=False)
+                if param.name in self._fallback_domains
+                else np.asarray(columns[param.name], dtype=np.float64)
+                for param in self.key_params]
+
+    def add(self, result: pd.DataFrame):
+        """Record a hardware result: append it to the CSV and make it
+        available to lookups."""
+        self.write(result)
+        for index, row in result.iterrows():
+            index = index if isinstance(index, tuple) else (index,)
+            key_values = dict(zip(result.index.names, index))
+            encoded = self.encode(to_columns([key_values], self.key_params))
+            self.added[tuple(float(column[0]) for column in encoded)] = row.to_dict()
+        if self._query_tab is not None:
+            self._query_tab = pd.concat([self._query_tab, result])
+
+    def write(self, result: pd.DataFrame):
+        write_result = result.reset_index()
+        if os.path.isfile(self.tab_path):
+            # Append in the column order of the existing file
+            header = pd.read_csv(self.tab_path, nrows=0).columns
+            write_result.reindex(columns=header).to_csv(
+                self.tab_path, mode='a', index=False, header=False)
+        else:
+            os.makedirs(os.path.dirname(self.tab_path), exist_ok=True)
+            write_result.to_csv(self.tab_path, mode='w', index=False, header=True)
+
+
+class CSVStream:
+    """Parses a CSV from the chunks of a download, a block of complete lines
+    at a time. Fields must not contain newlines."""
+
+    def __init__(self, block_size: int = 4 << 20):
+        self.block_size = block_size
+        self.header = None
+        self.buffer = bytearray()
+        self.frames = []
+
+    def __call__(self, data: bytes):
+        self.buffer += data
+        if len(self.buffer) >= self.block_size:
+            self._parse(final=False)
+
+    def _parse(self, final: bool):
+        end = len(self.buffer) if final else self.buffer.rfind(b'\n') + 1
+        if end <= 0:
+            return
+        block = bytes(self.buffer[:end])
+        del self.buffer[:end]
+        if self.header is None:
+            newline = block.find(b'\n') + 1 or len(block)
+            self.header, block = block[:newline], block[newline:]
+        if block.strip():
+            self.frames.append(pd.read_csv(io.BytesIO(self.header + block)))
+
+    def frame(self) -> pd.DataFrame:
+        self._parse(final=True)
+        if not self.frames:
+            return pd.read_csv(io.BytesIO(self.header or b''))
+        return pd.concat(self.frames, ignore_index=True)
+
+
+def ensure_dataset_downloaded(benchmark_name: str, dataset: str, key_params: Optional[list] = None,
+                              sha256: Optional[str] = None) -> bool:
+    """Download a dataset CSV unless it is already present. One process per
+    host downloads a given file; others wait for it. With ``key_params``, the
+    columnar cache is built from the rows parsed during the download. The
+    file must match ``sha256``, by default the checksum registered for the
+    dataset."""
+    from catbench.registry import dataset_checksum
+
+    filename = f'{benchmark_name}_{dataset}.csv'
+    os.makedirs('datasets', exist_ok=True)
+    file_path = f'datasets/{filename}'
+    if os.path.exists(file_path):
+        return True
+    with file_lock(f'{file_path}.lock'):
+        if os.path.exists(file_path):
+            return True
+        stream = CSVStream() if key_params is not None else None
+        sha256 = sha256 or dataset_checksum(benchmark_name, dataset)
+        try:
+            content_hash = fetch(DATASET_URL.format(filename=filename), file_path, sha256, stream)
+        except Exception as e:  # network errors leave the study without tabular data
+            print(f"Failed to download {filename}: {e}")
+            return False
+        print(f"Downloaded {file_path}")
+        if stream is not None:
+            ColumnarTable.open(file_path, f'{benchmark_name}_{dataset}', key_params,
+                               stream.frame(), content_hash)
+    return True
+
+
+def download_datasets(datasets: list[tuple[str, str]], max_workers: int = 4) -> dict:
+    """Download several ``(benchmark, dataset)`` pairs at once and build their
+    columnar caches; returns whether each one is available."""
+    from catbench.registry import get_definition
+
+    def download(benchmark_name, dataset):
+        search_space = get_definition(benchmark_name).search_space
+        return ensure_dataset_downloaded(benchmark_name, dataset,
+                                         search_space.params + (search_space.fidelity_params or []))
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers) as pool:
+        futures = {pair: pool.submit(download, *pair) for pair in datasets}
+    return {pair: future.result() for pair, future in futures.items()}
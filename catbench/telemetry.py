@@ -0,0 +1,194 @@
+"""Timing of the stages of a query.
+
+When enabled, each stage of a query (parameter encoding, constraint checks,
+tabular lookup, surrogate prediction, queue wait, gRPC round trip, and the
+query as a whole) is timed and added to a latency histogram per benchmark,
+study mode and stage. The histograms can be read with :func:`snapshot`, served
+in the Prometheus text format with :func:`start_http_server`, and every span
+can be appended to a JSONL trace file. Disabled (the default), :func:`span`
+and :func:`labels` return a shared no-op context manager.
+
+    from catbench import telemetry
+    telemetry.enable(trace_path='trace.jsonl')
+    ...
+    telemetry.snapshot()
+
+Set ``CATBENCH_TELEMETRY=1`` (and optionally ``CATBENCH_TRACE=path``) to enable
+it from the environment.
+"""
+import bisect
+import contextlib
+import contextvars
+import json
+import os
+import threading
+import time
+from typing import Optional
+
+# Upper bounds of the histogram buckets in seconds, from 1 us to 100 s
+BUCKETS = tuple(m * 10.0 ** e for e in range(-6, 2) for m in (1, 2.5, 5)) + (100.0,)
+
+_NULL = contextlib.nullcontext()
+_labels = contextvars.ContextVar('catbench_telemetry_labels', default=('', ''))
+
+_enabled = False
+_lock = threading.Lock()
+_histograms: dict = {}
+_trace = None
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket that holds the ``q`` quantile."""
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(BUCKETS + (float('inf'),), self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+
+def enable(trace_path: Optional[str] = None):
+    global _enabled, _trace
+    with _lock:
+        if trace_path is not None and _trace is None:
+            _trace = open(trace_path, 'a', encoding='utf-8', buffering=1)
+        _enabled = True
+
+
+def disable():
+    global _enabled, _trace
+    with _lock:
+        _enabled = False
+        if _trace is not None:
+            _trace.close()
+            _trace = None
+
+
+def is_enabled() -> bool:
+    return _enabled
+
+
+def reset():
+    with _lock:
+        _histograms.clear()
+
+
+def record(stage: str, duration: float, start: Optional[float] = None):
+    if not _enabled:
+        return
+    benchmark, mode = _labels.get()
+    with _lock:
+        histogram = _histograms.get((benchmark, mode, stage))
+        if histogram is None:
+            histogram = _histograms[(benchmark, mode, stage)] = Histogram()
+        histogram.observe(duration)
+        if _trace is not None:
+            _trace.write(json.dumps({
+                'time': time.time() - duration if start is None else start,
+                'benchmark': benchmark, 'mode': mode, 'stage': stage,
+                'duration_s': duration, 'thread': threading.get_ident()}) + '\n')
+
+
+class _Span:
+    __slots__ = ('stage', 'start', 'wall')
+
+    def __init__(self, stage: str):
+        self.stage = stage
+
+    def __enter__(self):
+        self.wall = time.time()
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        record(self.stage, time.perf_counter() - self.start, self.wall)
+
+
+def span(stage: str):
+    """Time the enclosed block as ``stage``."""
+    if not _enabled:
+        return _NULL
+    return _Span(stage)
+
+
+@contextlib.contextmanager
+def _labelled(benchmark: str, mode: str):
+    token = _labels.set((benchmark, mode))
+    try:
+        yield
+    finally:
+        _labels.reset(token)
+
+
+def labels(benchmark: str, mode: str):
+    """Attribute the spans in the enclosed block (and in tasks started from
+    it) to ``benchmark`` and ``mode``."""
+    if not _enabled:
+        return _NULL
+    return _labelled(benchmark, mode)
+
+
+def snapshot() -> list[dict]:
+    with _lock:
+        items = sorted(_histograms.items())
+        return [{'benchmark': benchmark, 'mode': mode, 'stage': stage,
+                 'count': histogram.count, 'sum_s': histogram.sum,
+                 'mean_s': histogram.sum / histogram.count,
+                 'p50_s': histogram.quantile(0.5), 'p99_s': histogram.quantile(0.99)}
+                for (benchmark, mode, stage), histogram in items]
+
+
+def prometheus_text() -> str:
+    lines = ['# HELP catbench_stage_seconds Time spent in each stage of a query.',
+             '# TYPE catbench_stage_seconds histogram']
+    with _lock:
+        for (benchmark, mode, stage), histogram in sorted(_histograms.items()):
+            labels_text = f'benchmark="{benchmark}",mode="{mode}",stage="{stage}"'
+            cumulative = 0
+            for bound, count in zip(BUCKETS, histogram.counts):
+                cumulative += count
+                lines.append(f'catbench_stage_seconds_bucket{{{labels_text},le="{bound:g}"}} {cumulative}')
+            lines.append(f'catbench_stage_seconds_bucket{{{labels_text},le="+Inf"}} {histogram.count}')
+            lines.append(f'catbench_stage_seconds_sum{{{labels_text}}} {histogram.sum}')
+            lines.append(f'catbench_stage_seconds_count{{{labels_text}}} {histogram.count}')
+    return '\n'.join(lines) + '\n'
+
+
+def start_http_server(port: int, address: str = ''):
+    """Serve :func:`prometheus_text` at ``/metrics`` from a daemon thread."""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split('?')[0] != '/metrics':
+                self.send_error(404)
+                return
+            body = prometheus_text().encode('utf-8')
+            self.send_response(200)
+            self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer((address, port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+if os.environ.get('CATBENCH_TELEMETRY', '') not in ('', '0'):
+    enable(os.environ.get('CATBENCH_TRACE'))
@@ -0,0 +1,246 @@
+"""Stand-in and simulated gRPC workers that answer evaluation requests
+without hardware.
+
+Both speak the same ``ConfigurationService`` protocol as the hardware servers.
+The stand-in worker gives every configuration a fixed, made-up value derived
+from a hash of the configuration. The simulated worker answers from a
+benchmark's dataset or surrogate models and holds each answer back for as long
+as the measurement would have taken, so many of them on one host can stand in
+for a cluster:
+
+    python -m catbench worker --benchmark spmm --dataset 2630 --port 50061 --count 16
+    python -m catbench --benchmark spmm --servers localhost:50061 localhost:50062 ...
+
+Workers given several benchmarks answer each request for the benchmark named
+in its metadata, as the workers of a multi-tenant manager are asked to.
+"""
+import argparse
+import asyncio
+import logging
+import random
+from typing import Optional, Union
+
+import grpc
+import grpc.aio
+
+import interopt.runner.grpc_runner.config_service_pb2 as cs
+import interopt.runner.grpc_runner.config_service_pb2_grpc as cs_grpc
+
+from catbench.cache import fingerprint
+from catbench.client import params_to_dict, request_route
+from catbench.streaming import EvaluationError, add_streaming_handler
+
+
+class StandInServicer(cs_grpc.ConfigurationServiceServicer):
+    def __init__(self, metrics: list[str], latency: float = 0.0,
+                 concurrency: Optional[int] = None):
+        self.metrics = metrics
+        self.latency = latency
+        self.requests = 0
+        # Evaluations allowed at once, like a server running one benchmark at a time
+        self.slots = asyncio.Semaphore(concurrency) if concurrency else None
+
+    def evaluate(self, query: dict, fidelities: dict) -> Optional[dict]:
+        value = 1 + int(fingerprint(sorted(query.items())), 16) % 1000 / 1000
+        repeats = int(fidelities.get('repeats', 1))
+        return {name: [value] * repeats if name == 'compute_times' else [value]
+                for name in self.metrics}
+
+    def delay(self, result: dict, fidelities: dict) -> float:
+        return self.latency
+
+    async def run(self, query: dict, fidelities: dict) -> Optional[dict]:
+        result = self.evaluate(query, fidelities)
+        if result is not None:
+            delay = self.delay(result, fidelities)
+            if delay > 0:
+                await asyncio.sleep(delay)
+        return result
+
+    async def evaluate_request(self, request, context=None) -> cs.ConfigurationResponse:
+        self.requests += 1
+        query = params_to_dict(request.configurations.parameters)
+        fidelities = params_to_dict(request.fidelities.parameters)
+        if self.slots is None:
+            result = await self.run(query, fidelities)
+        else:
+            async with self.slots:
+                result = await self.run(query, fidelities)
+        if result is None:
+            raise EvaluationError(grpc.StatusCode.NOT_FOUND, "No data for this configuration")
+        return cs.ConfigurationResponse(
+            metrics=[cs.Metric(name=name, values=values) for name, values in result.items()],
+            timestamps=cs.Timestamp(timestamp=int()),
+            feasible=cs.Feasible(value=True))
+
+    async def RunConfigurationsClientServer(self, request, context):
+        try:
+            return await self.evaluate_request(request, context)
+        except EvaluationError as e:
+            await context.abort(e.code, e.details)
+
+    async def Shutdown(self, request, context):
+        if request.shutdown:
+            logging.warning("Shutdown requested")
+            return cs.ShutdownResponse(success=True)
+        return cs.ShutdownResponse(success=False)
+
+
+def simulated_duration(compute_time: float, fidelities: dict) -> float:
+    """How long measuring a configuration with ``compute_time`` per run takes
+    at ``fidelities``, in the unit of ``compute_time``: every iteration of
+    every repeat (each run capped at ``timeouts``), plus the waits between
+    repeats and after the run."""
+    iterations = fidelities.get('iterations', 1)
+    repeats = fidelities.get('repeats', 1)
+    run_time = min(compute_time, fidelities.get('timeouts', compute_time))
+    return (run_time * iterations * repeats
+            + fidelities.get('wait_between_repeats', 0) * (repeats - 1)
+            + fidelities.get('wait_after_run', 0))
+
+
+class SimulatedServicer(StandInServicer):
+    """Answers from a study in tabular and/or surrogate mode, after the
+    simulated duration of the measurement times ``time_scale`` (seconds per
+    unit of ``compute_time``) divided by ``speedup``."""
+
+    def __init__(self, study, time_scale: float = 1e-3, speedup: float = 1.0,
+                 jitter: float = 0.0, concurrency: Optional[int] = 1, seed: Optional[int] = None):
+        super().__init__(list(study.enabled_objectives), concurrency=concurrency)
+        self.study = study
+        self.fidelity_defaults = {param.name: param.default for param in study.fidelity_params}
+        self.metric_names = metric_names(study.definition)
+        self.time_scale = time_scale
+        self.speedup = speedup
+        self.jitter = jitter
+        self.random = random.Random(seed)
+
+    def evaluate(self, query: dict, fidelities: dict) -> Optional[dict]:
+        result = self.study.query_software(query, fidelities)
+        if result is None:
+            return None
+        fidelities = {**self.fidelity_defaults, **fidelities}
+        response = {name: [value] for name, value in result.items()}
+        if 'compute_times' in self.metric_names and 'compute_time' in result:
+            response['compute_times'] = [
+                result['compute_time'] * (1 + self.random.gauss(0, self.jitter))
+                for _ in range(int(fidelities.get('repeats', 1)))]
+        return response
+
+    def delay(self, result: dict, fidelities: dict) -> float:
+        fidelities = {**self.fidelity_defaults, **fidelities}
+        duration = simulated_duration(result.get('compute_time', [0.0])[0], fidelities)
+        duration *= 1 + self.random.gauss(0, self.jitter)
+        return max(0.0, duration) * self.time_scale / self.speedup
+
+
+class RoutingServicer(StandInServicer):
+    """Hands every request to the servicer of the benchmark it names, or of
+    the first benchmark if it names none. The benchmarks share the
+    evaluation slots, as they would share the hardware."""
+
+    def __init__(self, servicers: dict, concurrency: Optional[int] = 1):
+        super().__init__([], concurrency=concurrency)
+        self.servicers = servicers
+        self.default = next(iter(servicers))
+
+    async def evaluate_request(self, request, context=None) -> cs.ConfigurationResponse:
+        benchmark_name = request_route(context)[0] or self.default
+        servicer = self.servicers.get(benchmark_name.lower())
+        if servicer is None:
+            raise EvaluationError(grpc.StatusCode.NOT_FOUND, f"Benchmark {benchmark_name} is not served")
+        self.requests += 1
+        if self.slots is None:
+            return await servicer.evaluate_request(request)
+        async with self.slots:
+            return await servicer.evaluate_request(request)
+
+
+def metric_names(definition) -> list[str]:
+    return [metric.name for metric in definition.search_space.metrics]
+
+
+async def start_worker(servicer: StandInServicer, port: int, streaming: bool = True) -> grpc.aio.Server:
+    server = grpc.aio.server()
+    cs_grpc.add_ConfigurationServiceServicer_to_server(servicer, server)
+    if streaming:
+        add_streaming_handler(server, servicer.evaluate_request)
+    server.add_insecure_port(f'[::]:{port}')
+    await server.start()
+    return server
+
+
+async def serve_simulated(benchmark_names: Union[str, list[str]], dataset: Optional[str],
+                          ports: list[int], enable_tabular: bool = True, enable_model: bool = True,
+                          enable_download: bool = True, seed: Optional[int] = None,
+                          concurrency: Optional[int] = 1, **options):
+    """Serve simulated workers for each of ``benchmark_names`` on each of
+    ``ports`` from one process; the study of a benchmark is loaded once and
+    shared."""
+    from catbench.main import benchmark
+    from catbench.registry import get_definition
+
+    if isinstance(benchmark_names, str):
+        benchmark_names = [benchmark_names]
+    studies = {}
+    for benchmark_name in benchmark_names:
+        # Answer with every metric a hardware server reports, not only the default objectives
+        objectives = [metric.name for metric in get_definition(benchmark_name).search_space.metrics
+                      if metric.singular]
+        study = benchmark(benchmark_name, dataset=dataset, enable_tabular=enable_tabular,
+                          enable_model=enable_model, enable_download=enable_download,
+                          enabled_objectives=objectives, enable_result_store=False)
+        if study.software_query is None:
+            raise ValueError(f"{benchmark_name} has no dataset or surrogate to answer from")
+        studies[benchmark_name.lower()] = study
+    servers = []
+    for index, port in enumerate(ports):
+        worker_seed = None if seed is None else seed + index
+        if len(studies) == 1:
+            servicer = SimulatedServicer(next(iter(studies.values())), seed=worker_seed,
+                                         concurrency=concurrency, **options)
+        else:
+            servicer = RoutingServicer({name: SimulatedServicer(study, seed=worker_seed,
+                                                                concurrency=None, **options)
+                                        for name, study in studies.items()},
+                                       concurrency=concurrency)
+        servers.append(await start_worker(servicer, port))
+        logging.info(f"Simulated {', '.join(studies)} worker listening on port {port}")
+    print(f"Serving {len(servers)} simulated {', '.join(studies)} worker(s) on ports "
+          f"{ports[0]}-{ports[-1]}", flush=True)
+    await asyncio.gather(*(server.wait_for_termination() for server in servers))
+
+
+def main(argv: Optional[list[str]] = None):
+    parser = argparse.ArgumentParser(prog='python -m catbench worker',
+                                     description="Run simulated hardware workers")
+    parser.add_argument('--benchmark', type=str, nargs='+', default=["spmm"],
+                        help='Benchmarks to simulate')
+    parser.add_argument('--dataset', type=str, default=None,
+                        help='Dataset to answer from (default: the benchmark\'s default)')
+    parser.add_argument('--port', type=int, default=50061,
+                        help='Port of the first worker')
+    parser.add_argument('--count', type=int, default=1,
+                        help='Number of workers, on consecutive ports')
+    parser.add_argument('--concurrency', type=int, default=1,
+                        help='Evaluations each worker runs at once')
+    parser.add_argument('--time_scale', type=float, default=1e-3,
+                        help='Seconds per unit of compute_time and wait fidelities')
+    parser.add_argument('--speedup', type=float, default=1.0,
+                        help='Divide simulated latencies by this factor')
+    parser.add_argument('--jitter', type=float, default=0.0,
+                        help='Relative standard deviation of latencies and compute_times')
+    parser.add_argument('--enable_tabular', action=argparse.BooleanOptionalAction, default=True,
+                        help='Answer from the dataset')
+    parser.add_argument('--enable_model', action=argparse.BooleanOptionalAction, default=True,
+                        help='Answer configurations missing from the dataset with the surrogate')
+    parser.add_argument('--enable_download', action=argparse.BooleanOptionalAction, default=True,
+                        help='Enable downloading of datasets')
+    parser.add_argument('--seed', type=int, default=None)
+    args = parser.parse_args(argv)
+
+    asyncio.run(serve_simulated(
+        args.benchmark, args.dataset, list(range(args.port, args.port + args.count)),
+        enable_tabular=args.enable_tabular, enable_model=args.enable_model,
+        enable_download=args.enable_download, time_scale=args.time_scale,
+        speedup=args.speedup, jitter=args.jitter, concurrency=args.concurrency, seed=args.seed))
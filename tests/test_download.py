@@ -0,0 +1,153 @@
+import hashlib
+import http.server
+import os
+import threading
+
+import pytest
+
+from catbench import registry, tabular
+from catbench.download import ChecksumError, fetch
+
+CONTENT = b'a,b\n' + b''.join(b'%d,%d\n' % (i, i) for i in range(20000))
+SHA256 = hashlib.sha256(CONTENT).hexdigest()
+
+
+class Handler(http.server.BaseHTTPRequestHandler):
+    content = CONTENT
+    etag = '"v1"'
+    ranges = True
+    # Bytes sent of the next response before the connection drops
+    cut = None
+    requests = []
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        type(self).requests.append(dict(self.headers))
+        start = 0
+        range_header, if_range = self.headers.get('Range'), self.headers.get('If-Range')
+        if self.ranges and range_header and (if_range is None or if_range == self.etag):
+            start = int(range_header.split('=')[1].rstrip('-'))
+            self.send_response(206)
+        else:
+            self.send_response(200)
+        body = self.content[start:]
+        self.send_header('Content-Length', str(len(body)))
+        if self.etag:
+            self.send_header('ETag', self.etag)
+        self.end_headers()
+        cut, type(self).cut = type(self).cut, None
+        self.wfile.write(body if cut is None else body[:cut])
+
+
+@pytest.fixture
+def server():
+    handler = type('TestHandler', (Handler,), {'requests': []})
+    httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), handler)
+    thread = threading.Thread(target=httpd.serve_forever, daemon=True)
+    thread.start()
+    yield handler, f'http://127.0.0.1:{httpd.server_port}/data.csv'
+    httpd.shutdown()
+    httpd.server_close()
+
+
+def write_part(path, data: bytes, validator=None):
+    with open(f'{path}.part', 'wb') as f:
+        f.write(data)
+    if validator is not None:
+        with open(f'{path}.part.validator', 'w', encoding='utf-8') as f:
+            f.write(validator)
+
+
+def test_download(server, tmp_path):
+    _, url = server
+    path = str(tmp_path / 'data.csv')
+    received = bytearray()
+    assert fetch(url, path, SHA256, received.extend) == SHA256
+    assert bytes(received) == CONTENT
+    assert open(path, 'rb').read() == CONTENT
+    assert os.listdir(tmp_path) == ['data.csv']
+
+
+def test_broken_transfer_is_resumed(server, tmp_path):
+    handler, url = server
+    handler.cut = 5000
+    path = str(tmp_path / 'data.csv')
+    received = bytearray()
+    assert fetch(url, path, SHA256, received.extend, chunk_size=1024) == SHA256
+    assert bytes(received) == CONTENT
+    assert handler.requests[1]['Range'] == 'bytes=5000-'
+    assert handler.requests[1]['If-Range'] == '"v1"'
+
+
+def test_part_of_the_same_file_is_resumed(server, tmp_path):
+    handler, url = server
+    path = str(tmp_path / 'data.csv')
+    write_part(path, CONTENT[:7000], '"v1"')
+    received = bytearray()
+    assert fetch(url, path, SHA256, received.extend) == SHA256
+    assert bytes(received) == CONTENT
+    assert handler.requests[0]['Range'] == 'bytes=7000-'
+    assert os.listdir(tmp_path) == ['data.csv']
+
+
+def test_part_of_another_version_is_replaced(server, tmp_path):
+    handler, url = server
+    path = str(tmp_path / 'data.csv')
+    write_part(path, b'stale bytes', '"v0"')
+    received = bytearray()
+    assert fetch(url, path, SHA256, received.extend) == SHA256
+    assert bytes(received) == CONTENT
+
+
+def test_part_without_validator_is_discarded(server, tmp_path):
+    handler, url = server
+    path = str(tmp_path / 'data.csv')
+    write_part(path, b'foreign bytes')
+    assert fetch(url, path, SHA256) == SHA256
+    assert 'Range' not in handler.requests[0]
+
+
+def test_same_file_from_a_server_without_range_support(server, tmp_path):
+    handler, url = server
+    handler.ranges = False
+    path = str(tmp_path / 'data.csv')
+    write_part(path, CONTENT[:7000], '"v1"')
+    received = bytearray()
+    assert fetch(url, path, SHA256, received.extend) == SHA256
+    assert bytes(received) == CONTENT
+
+
+def test_transfer_without_validator_cannot_resume_a_consumer(server, tmp_path):
+    handler, url = server
+    handler.etag = None
+    handler.cut = 5000
+    path = str(tmp_path / 'data.csv')
+    with pytest.raises(ChecksumError):
+        fetch(url, path, SHA256, bytearray().extend, chunk_size=1024)
+    assert os.listdir(tmp_path) == []
+
+    handler.cut = 5000
+    assert fetch(url, path, SHA256, chunk_size=1024) == SHA256
+
+
+def test_checksum_mismatch(server, tmp_path):
+    _, url = server
+    path = str(tmp_path / 'data.csv')
+    with pytest.raises(ChecksumError):
+        fetch(url, path, '0' * 64)
+    assert os.listdir(tmp_path) == []
+
+
+@pytest.mark.parametrize('checksum, downloaded', [(SHA256, True), ('0' * 64, False)])
+def test_registered_checksum_is_checked(server, tmp_path, monkeypatch, checksum, downloaded):
+    _, url = server
+    monkeypatch.setattr(registry, '_registry', dict(registry._registry))
+    monkeypatch.setattr(tabular, 'DATASET_URL', url.replace('data.csv', '{filename}'))
+    monkeypatch.chdir(tmp_path)
+    registry.register_benchmark('checked', lambda: None, checksums={'unit': checksum})
+
+    assert registry.dataset_checksum('checked', 'unit') == checksum
+    assert tabular.ensure_dataset_downloaded('checked', 'unit') == downloaded
+    assert os.path.exists('datasets/checked_unit.csv') == downloaded
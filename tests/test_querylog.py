@@ -0,0 +1,131 @@
+import os
+
+import numpy as np
+import pytest
+
+from interopt.parameter import Categorical, Integer, Permutation, Real
+
+from catbench.constraints import to_columns
+from catbench.querylog import HARDWARE, SURROGATE, TABULAR, QueryLog, QueryLogReader
+
+PARAMS = [
+    Integer(name='n', bounds=(1, 8), default=1),
+    Categorical(name='layout', categories=['row', 'col'], default='row'),
+    Categorical(name='threads', categories=[1, 2, 4], default=1),
+    Permutation(name='order', length=3, default='(0, 1, 2)'),
+    Real(name='scale', bounds=(0, 1), default=0.5),
+]
+FIDELITY_PARAMS = [Integer(name='repeats', bounds=(1, 10), default=1)]
+OBJECTIVES = ['compute_time', 'energy']
+
+CONFIGS = [
+    {'n': 1, 'layout': 'row', 'threads': 1, 'order': '(0, 1, 2)', 'scale': 0.25},
+    {'n': 8, 'layout': 'col', 'threads': 4, 'order': '(2, 1, 0)', 'scale': 1.0},
+    {'n': 3, 'layout': 'col', 'threads': 2, 'order': '(1, 0, 2)', 'scale': 0.0},
+]
+
+
+def write(log: QueryLog, configs: list, repeats: list, sources, rows=None):
+    results = {'compute_time': np.arange(len(configs), dtype=float) + 1.5,
+               'energy': np.full(len(configs), np.nan)}
+    log.append(to_columns(configs, PARAMS), {'repeats': np.array(repeats)}, results, sources, rows)
+    return results
+
+
+def open_log(path, **kwargs) -> QueryLog:
+    return QueryLog(str(path), PARAMS, FIDELITY_PARAMS, OBJECTIVES, 'test', 'unit', **kwargs)
+
+
+def test_round_trip(tmp_path):
+    log = open_log(tmp_path)
+    results = write(log, CONFIGS, [1, 5, 10], np.array([TABULAR, SURROGATE, HARDWARE]))
+    log.flush()
+
+    frame = QueryLogReader(str(tmp_path)).to_frame()
+    assert frame['n'].tolist() == [1, 8, 3]
+    assert frame['layout'].tolist() == ['row', 'col', 'col']
+    assert frame['threads'].tolist() == [1, 4, 2]
+    assert frame['order'].tolist() == ['(0, 1, 2)', '(2, 1, 0)', '(1, 0, 2)']
+    assert frame['scale'].tolist() == [0.25, 1.0, 0.0]
+    assert frame['repeats'].tolist() == [1, 5, 10]
+    assert frame['compute_time'].tolist() == results['compute_time'].tolist()
+    assert frame['energy'].isna().all()
+    assert frame['source'].tolist() == ['tabular', 'surrogate', 'hardware']
+
+
+def test_replay(tmp_path):
+    log = open_log(tmp_path)
+    write(log, CONFIGS, [1, 5, 10], HARDWARE)
+    log.flush()
+
+    replayed = list(QueryLogReader(str(tmp_path)).replay(chunk_rows=2))
+    assert [config for config, _, _ in replayed] == CONFIGS
+    assert [fidelities for _, fidelities, _ in replayed] == [{'repeats': r} for r in (1, 5, 10)]
+    assert [result['compute_time'] for _, _, result in replayed] == [1.5, 2.5, 3.5]
+
+
+def test_values_outside_the_bounds_are_kept(tmp_path):
+    log = open_log(tmp_path)
+    configs = [dict(CONFIGS[0], n=100000), dict(CONFIGS[0], n=-3, threads=3, layout='diagonal')]
+    write(log, configs, [1000, 0], HARDWARE)
+    log.flush()
+
+    columns = QueryLogReader(str(tmp_path)).read()
+    assert columns[('param', 'n')].tolist() == [100000, -3]
+    assert columns[('param', 'threads')].tolist() == [1, 3]
+    assert columns[('param', 'layout')].tolist() == ['row', None]
+    assert columns[('fidelity', 'repeats')].tolist() == [1000, 0]
+
+
+def test_selected_rows(tmp_path):
+    log = open_log(tmp_path)
+    write(log, CONFIGS, [1, 5, 10], np.array([TABULAR, SURROGATE, HARDWARE]), rows=np.array([0, 2]))
+    log.flush()
+
+    frame = QueryLogReader(str(tmp_path)).to_frame()
+    assert frame['n'].tolist() == [1, 3]
+    assert frame['compute_time'].tolist() == [1.5, 3.5]
+    assert frame['source'].tolist() == ['tabular', 'hardware']
+
+
+def test_chunks_are_written_when_full(tmp_path):
+    log = open_log(tmp_path, chunk_rows=2)
+    write(log, CONFIGS, [1, 5, 10], HARDWARE)
+    reader = QueryLogReader(str(tmp_path))
+    assert len(reader) == 2
+    log.flush()
+    reader.refresh()
+    assert len(reader) == 3
+    assert [chunk['n'].tolist() for chunk in reader.iter_frames(chunk_rows=2)] == [[1, 8], [3]]
+
+
+def test_reopened_log_is_appended_to(tmp_path):
+    log = open_log(tmp_path)
+    write(log, CONFIGS[:1], [1], HARDWARE)
+    log.close()
+    log = open_log(tmp_path)
+    write(log, CONFIGS[1:], [5, 10], HARDWARE)
+    log.close()
+
+    assert QueryLogReader(str(tmp_path)).to_frame()['n'].tolist() == [1, 8, 3]
+
+
+def test_partly_written_chunk_is_dropped_on_reopen(tmp_path):
+    log = open_log(tmp_path)
+    write(log, CONFIGS, [1, 5, 10], HARDWARE)
+    log.close()
+    # A crash while a chunk was written leaves some columns longer than others
+    with open(os.path.join(tmp_path, 'param_n.bin'), 'ab') as f:
+        f.write(np.zeros(2, dtype='<i8').tobytes())
+    assert len(QueryLogReader(str(tmp_path))) == 3
+
+    log = open_log(tmp_path)
+    write(log, CONFIGS[:1], [1], HARDWARE)
+    log.close()
+    assert QueryLogReader(str(tmp_path)).to_frame()['n'].tolist() == [1, 8, 3, 1]
+
+
+def test_log_with_other_columns_is_refused(tmp_path):
+    open_log(tmp_path).close()
+    with pytest.raises(ValueError):
+        QueryLog(str(tmp_path), PARAMS[:2], FIDELITY_PARAMS, OBJECTIVES)
@@ -0,0 +1,107 @@
+import pytest
+
+from interopt.parameter import Integer, Permutation
+
+from catbench.results import ResultStore
+
+PARAMETERS = [
+    Integer(name='n', bounds=(1, 8), default=1),
+    Permutation(name='order', length=3, default='(0, 1, 2)'),
+]
+CONFIG = {'n': 4, 'order': '(2, 0, 1)'}
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore('spmm', 'test', path=str(tmp_path / 'results.sqlite'),
+                        parameters=PARAMETERS)
+    yield store
+    store.close()
+
+
+def test_round_trip(store):
+    assert store.get(CONFIG, {'iterations': 10}) is None
+    store.put(CONFIG, {'iterations': 10}, {'compute_time': 1.5})
+    assert store.get(CONFIG, {'iterations': 10}) == {'compute_time': 1.5}
+    assert store.get({**CONFIG, 'n': 5}, {'iterations': 10}) is None
+    assert (store.hits, store.misses) == (1, 2)
+    assert len(store) == 1
+
+
+def test_higher_fidelity_answers_lower(store):
+    store.put(CONFIG, {'iterations': 15, 'repeats': 5}, {'compute_time': 1.0})
+    assert store.get(CONFIG, {'iterations': 10, 'repeats': 3}) == {'compute_time': 1.0}
+    assert store.get(CONFIG, {'iterations': 20, 'repeats': 3}) is None
+    assert store.get(CONFIG, {'iterations': 10, 'repeats': 6}) is None
+
+
+def test_lower_fidelity_does_not_answer_higher(store):
+    store.put(CONFIG, {'iterations': 10, 'repeats': 3}, {'compute_time': 1.0})
+    assert store.get(CONFIG, {'iterations': 15, 'repeats': 5}) is None
+
+
+def test_highest_fidelity_is_preferred(store):
+    store.put(CONFIG, {'iterations': 10}, {'compute_time': 1.0})
+    store.put(CONFIG, {'iterations': 30}, {'compute_time': 3.0})
+    store.put(CONFIG, {'iterations': 20}, {'compute_time': 2.0})
+    assert store.get(CONFIG, {'iterations': 5}) == {'compute_time': 3.0}
+
+
+def test_other_fidelities_must_match(store):
+    store.put(CONFIG, {'iterations': 15, 'threads': 4}, {'compute_time': 1.0})
+    assert store.get(CONFIG, {'iterations': 10, 'threads': 4}) == {'compute_time': 1.0}
+    assert store.get(CONFIG, {'iterations': 10, 'threads': 8}) is None
+    assert store.get(CONFIG, {'iterations': 10, 'threads': 4, 'repeats': 1}) is None
+
+
+@pytest.mark.parametrize('order', ['(2, 0, 1)', (2, 0, 1), [2, 0, 1]])
+def test_permutation_forms_share_an_entry(store, order):
+    store.put({'order': (2, 0, 1), 'n': 4.0}, {'iterations': 10}, {'compute_time': 1.0})
+    assert store.get({'n': 4, 'order': order}, {'iterations': 10}) == {'compute_time': 1.0}
+
+
+def test_server_filter(store):
+    store.put(CONFIG, {'iterations': 10}, {'compute_time': 1.0}, server='a:50050')
+    assert store.get(CONFIG, {'iterations': 10}) == {'compute_time': 1.0}
+    assert store.get(CONFIG, {'iterations': 10}, server='a:50050') == {'compute_time': 1.0}
+    assert store.get(CONFIG, {'iterations': 10}, server='b:50050') is None
+
+
+def test_expired_results_are_ignored(tmp_path, monkeypatch):
+    store = ResultStore('spmm', 'test', path=str(tmp_path / 'results.sqlite'), ttl=60)
+    now = 1_000_000.0
+    monkeypatch.setattr('catbench.results.time.time', lambda: now)
+    store.put(CONFIG, {'iterations': 10}, {'compute_time': 1.0})
+    now += 30
+    assert store.get(CONFIG, {'iterations': 10}) == {'compute_time': 1.0}
+    now += 60
+    assert store.get(CONFIG, {'iterations': 10}) is None
+    store.evict()
+    assert len(store) == 0
+    store.close()
+
+
+def test_least_recently_used_are_evicted(tmp_path, monkeypatch):
+    store = ResultStore('spmm', 'test', path=str(tmp_path / 'results.sqlite'), max_entries=2)
+    now = 1_000_000.0
+    monkeypatch.setattr('catbench.results.time.time', lambda: now)
+    for n in (1, 2, 3):
+        now += 1
+        store.put({'n': n}, {}, {'compute_time': n})
+    now += 1
+    assert store.get({'n': 1}, {}) == {'compute_time': 1}
+    store.evict()
+    assert len(store) == 2
+    assert store.get({'n': 2}, {}) is None
+    assert store.get({'n': 1}, {}) == {'compute_time': 1}
+    store.close()
+
+
+def test_stores_share_the_database(store):
+    other = ResultStore('spmm', 'test', path=store.path, parameters=PARAMETERS)
+    other.put(CONFIG, {'iterations': 10}, {'compute_time': 1.0})
+    assert store.get(CONFIG, {'iterations': 10}) == {'compute_time': 1.0}
+    other.close()
+    dataset = ResultStore('spmm', 'other', path=store.path)
+    assert dataset.get(CONFIG, {'iterations': 10}) is None
+    dataset.close()
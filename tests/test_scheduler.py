@@ -0,0 +1,105 @@
+import asyncio
+
+import grpc
+import grpc.aio
+import pytest
+
+from catbench.scheduler import Scheduler, is_transport_error
+
+
+def rpc_error(code: grpc.StatusCode) -> grpc.aio.AioRpcError:
+    return grpc.aio.AioRpcError(code, grpc.aio.Metadata(), grpc.aio.Metadata(), details=code.name)
+
+
+def failures(scheduler: Scheduler) -> int:
+    return sum(worker.failures for worker in scheduler.workers)
+
+
+@pytest.mark.parametrize('error, transport', [
+    (rpc_error(grpc.StatusCode.UNAVAILABLE), True),
+    (rpc_error(grpc.StatusCode.DEADLINE_EXCEEDED), True),
+    (rpc_error(grpc.StatusCode.CANCELLED), True),
+    (ConnectionResetError(), True),
+    (asyncio.TimeoutError(), True),
+    (rpc_error(grpc.StatusCode.INVALID_ARGUMENT), False),
+    (rpc_error(grpc.StatusCode.NOT_FOUND), False),
+    (rpc_error(grpc.StatusCode.INTERNAL), False),
+    (rpc_error(grpc.StatusCode.UNKNOWN), False),
+    (ValueError(), False),
+])
+def test_is_transport_error(error, transport):
+    assert is_transport_error(error) == transport
+
+
+@pytest.mark.parametrize('error', [rpc_error(grpc.StatusCode.INVALID_ARGUMENT),
+                                   rpc_error(grpc.StatusCode.INTERNAL), ValueError('bad query')])
+def test_query_errors_are_raised_at_once(error):
+    scheduler = Scheduler(['a', 'b', 'c'], max_retries=2)
+    calls = []
+
+    async def call(url):
+        calls.append(url)
+        raise error
+
+    with pytest.raises(type(error)):
+        asyncio.run(scheduler.submit(call))
+    assert len(calls) == 1
+    assert failures(scheduler) == 0
+    assert scheduler.retries == 0
+    assert scheduler.pick().excluded_until == 0.0
+
+
+def test_transport_errors_exclude_the_worker_and_retry_elsewhere():
+    scheduler = Scheduler(['a', 'b'], max_retries=2)
+    calls = []
+
+    async def call(url):
+        calls.append(url)
+        if url == 'a':
+            raise rpc_error(grpc.StatusCode.UNAVAILABLE)
+        return url
+
+    assert asyncio.run(scheduler.submit(call, prefer='a')) == 'b'
+    assert calls == ['a', 'b']
+    assert scheduler.retries == 1
+    stats = scheduler.stats()['workers']
+    assert stats['a']['failures'] == 1 and stats['a']['excluded']
+    assert stats['b']['failures'] == 0 and stats['b']['completed'] == 1
+
+
+def test_transport_errors_raise_once_retries_run_out():
+    scheduler = Scheduler(['a', 'b', 'c'], max_retries=2)
+
+    async def call(url):
+        raise ConnectionRefusedError(url)
+
+    with pytest.raises(ConnectionRefusedError):
+        asyncio.run(scheduler.submit(call))
+    assert failures(scheduler) == 3
+    assert scheduler.retries == 2
+
+
+def test_queries_spread_over_idle_workers():
+    scheduler = Scheduler(['a', 'b'], max_concurrency=1)
+
+    async def call(url):
+        await asyncio.sleep(0.01)
+        return url
+
+    async def run():
+        return await asyncio.gather(*(scheduler.submit(call) for _ in range(4)))
+
+    assert sorted(asyncio.run(run())) == ['a', 'a', 'b', 'b']
+
+
+def test_straggler_is_hedged_on_an_idle_worker():
+    scheduler = Scheduler(['slow', 'fast'], hedge=True, hedge_min_samples=1, hedge_poll=0.01)
+    scheduler.record_success(scheduler.workers[0], None, 0.01)
+
+    async def call(url):
+        await asyncio.sleep(5 if url == 'slow' else 0.01)
+        return url
+
+    assert asyncio.run(asyncio.wait_for(scheduler.submit(call, prefer='slow'), 2)) == 'fast'
+    assert scheduler.hedged == 1
+    assert scheduler.hedge_wins == 1
@@ -0,0 +1,146 @@
+import asyncio
+
+import grpc
+import grpc.aio
+import pytest
+
+import interopt.runner.grpc_runner.config_service_pb2 as cs
+import interopt.runner.grpc_runner.config_service_pb2_grpc as cs_grpc
+from interopt.parameter import ParamType
+from interopt.runner.grpc_runner.main import value_to_param
+
+from catbench.client import ConnectionPool
+from catbench.streaming import EvaluationError, StreamingCall, add_streaming_handler
+
+
+def request(x: int) -> cs.ConfigurationRequest:
+    return cs.ConfigurationRequest(configurations=cs.Configuration(
+        parameters={'x': value_to_param(x, ParamType.INTEGER)}))
+
+
+def response(x: int) -> cs.ConfigurationResponse:
+    return cs.ConfigurationResponse(metrics=[cs.Metric(name='compute_time', values=[float(x)])])
+
+
+async def evaluate(request, context=None):
+    x = request.configurations.parameters['x'].integer_param.value
+    if x < 0:
+        raise EvaluationError(grpc.StatusCode.INVALID_ARGUMENT, f"Negative x: {x}")
+    if x == 0:
+        raise RuntimeError("boom")
+    # Later requests finish first
+    await asyncio.sleep(0.05 / x)
+    return response(x)
+
+
+class UnaryServicer(cs_grpc.ConfigurationServiceServicer):
+    async def RunConfigurationsClientServer(self, request, context):
+        try:
+            return await evaluate(request)
+        except EvaluationError as e:
+            await context.abort(e.code, e.details)
+
+
+async def start(streaming: bool = True):
+    server = grpc.aio.server()
+    cs_grpc.add_ConfigurationServiceServicer_to_server(UnaryServicer(), server)
+    if streaming:
+        add_streaming_handler(server, evaluate)
+    port = server.add_insecure_port('127.0.0.1:0')
+    await server.start()
+    return server, f'127.0.0.1:{port}'
+
+
+def values(result: cs.ConfigurationResponse) -> float:
+    return result.metrics[0].values[0]
+
+
+def test_responses_are_matched_to_their_requests():
+    async def run():
+        server, url = await start()
+        async with grpc.aio.insecure_channel(url) as channel:
+            call = StreamingCall(channel)
+            results = await asyncio.gather(*(call.evaluate(request(x)) for x in range(1, 11)))
+            call.close()
+        await server.stop(None)
+        return results
+
+    assert [values(result) for result in asyncio.run(run())] == list(range(1, 11))
+
+
+@pytest.mark.parametrize('x, code', [(-1, grpc.StatusCode.INVALID_ARGUMENT),
+                                     (0, grpc.StatusCode.INTERNAL)])
+def test_a_failed_request_fails_alone(x, code):
+    async def run():
+        server, url = await start()
+        async with grpc.aio.insecure_channel(url) as channel:
+            call = StreamingCall(channel)
+            results = await asyncio.gather(call.evaluate(request(1)), call.evaluate(request(x)),
+                                           call.evaluate(request(2)), return_exceptions=True)
+            after = await call.evaluate(request(3))
+            closed = call.closed
+            call.close()
+        await server.stop(None)
+        return results, after, closed
+
+    (first, failed, second), after, closed = asyncio.run(run())
+    assert isinstance(failed, EvaluationError)
+    assert not isinstance(failed, grpc.aio.AioRpcError)
+    assert failed.code == code
+    assert values(first) == 1 and values(second) == 2 and values(after) == 3
+    assert not closed
+
+
+def test_a_failed_stream_fails_its_pending_requests_with_its_status():
+    async def run():
+        server, url = await start()
+        async with grpc.aio.insecure_channel(url) as channel:
+            call = StreamingCall(channel)
+            pending = asyncio.ensure_future(call.evaluate(request(1)))
+            await asyncio.sleep(0.01)
+            await server.stop(None)
+            try:
+                await pending
+            except BaseException as e:
+                return e, call.closed
+
+    error, closed = asyncio.run(run())
+    assert isinstance(error, grpc.aio.AioRpcError)
+    assert closed
+
+
+def test_pool_falls_back_to_unary_calls():
+    async def run():
+        server, url = await start(streaming=False)
+        connections = ConnectionPool()
+        connections.bind_loop()
+        result = await connections.call(url, request(4))
+        with pytest.raises(grpc.aio.AioRpcError) as error:
+            await connections.call(url, request(-1))
+        unary = url in connections.unary_urls
+        await connections.close()
+        await server.stop(None)
+        return result, error.value.code(), unary
+
+    result, code, unary = asyncio.run(run())
+    assert values(result) == 4
+    assert code == grpc.StatusCode.INVALID_ARGUMENT
+    assert unary
+
+
+def test_pool_streams_when_the_server_can():
+    async def run():
+        server, url = await start()
+        connections = ConnectionPool()
+        connections.bind_loop()
+        results = await asyncio.gather(*(connections.call(url, request(x)) for x in (1, 2, 3)))
+        with pytest.raises(EvaluationError):
+            await connections.call(url, request(-1))
+        unary = url in connections.unary_urls
+        await connections.close()
+        await server.stop(None)
+        return results, unary
+
+    results, unary = asyncio.run(run())
+    assert [values(result) for result in results] == [1, 2, 3]
+    assert not unary